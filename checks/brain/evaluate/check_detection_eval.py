@@ -0,0 +1,59 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+from eagle.brain.evaluate.detection_eval import DetectionEvaluator
+
+
+parser = OptionParser()
+parser.add_option("-n", "--num_images",
+                  dest="num_images", default="50000",
+                  help="number of synthetic validation images")
+parser.add_option("--num_classes",
+                  dest="num_classes", default="20",
+                  help="number of object classes")
+(options, args) = parser.parse_args()
+
+# 用随机生成的检测结果测试评估的速度，检测框由真实框加噪声得到
+num_images = int(options.num_images)
+num_classes = int(options.num_classes)
+rng = np.random.RandomState(0)
+evaluator = DetectionEvaluator(num_classes,
+                               iou_thresholds=np.arange(0.5, 1.0, 0.05))
+
+start_time = time.time()
+for _ in range(num_images):
+    num_gt = rng.randint(1, 10)
+    xmin = rng.uniform(0, 250, num_gt)
+    ymin = rng.uniform(0, 250, num_gt)
+    xmax = xmin + rng.uniform(10, 50, num_gt)
+    ymax = ymin + rng.uniform(10, 50, num_gt)
+    classes = rng.randint(1, num_classes + 1, num_gt)
+    ground_truth = np.stack([xmin, ymin, xmax, ymax, classes], axis=1)
+
+    num_det = rng.randint(0, 20)
+    source = rng.randint(0, num_gt, num_det)
+    noise = rng.normal(0, 4, (num_det, 4))
+    detections = np.stack([
+        classes[source], rng.uniform(0, 1, num_det),
+        xmin[source] + noise[:, 0], xmax[source] + noise[:, 1],
+        ymin[source] + noise[:, 2], ymax[source] + noise[:, 3]], axis=1)
+    evaluator.update(detections, ground_truth)
+update_time = time.time() - start_time
+
+start_time = time.time()
+result = evaluator.compute()
+print("update: %.2f sec, compute: %.2f sec" % (update_time,
+                                              time.time() - start_time))
+print("mAP@0.5: %.4f, mAP@[.5:.95]: %.4f" % (result["map"][0], result["mAP"]))
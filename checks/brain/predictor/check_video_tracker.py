@@ -0,0 +1,55 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-4])
+sys.path.insert(0, proj_root)
+
+import numpy as np
+
+from eagle.brain.predictor.video import IoUTracker
+
+DETECT_EVERY = 3
+SPEED = 2.0
+
+
+def box(frame_index):
+    """The object moves SPEED pixels per frame to the right"""
+    xmin = SPEED * frame_index
+    return [[1, 0.9, xmin, xmin + 20, 10, 30]]
+
+
+def track(detector_frames, num_frames):
+    """Run the tracker like VideoDetector, the detector only sees the object
+    on `detector_frames`"""
+    tracker = IoUTracker()
+    boxes = None
+    for index in range(num_frames):
+        if index % DETECT_EVERY == 0:
+            detections = box(index) if index in detector_frames else []
+            boxes = tracker.update(detections, num_frames=DETECT_EVERY)
+        else:
+            boxes = tracker.predict()
+    return tracker, boxes
+
+
+# 每个检测帧都匹配上: 速度为每帧SPEED
+tracker, boxes = track({0, 3, 6}, 9)
+assert np.allclose(tracker.velocity[:, 0], SPEED), tracker.velocity
+assert np.allclose(boxes[0, 2], box(8)[0][2]), boxes
+
+# 第3帧漏检，第6帧重新匹配: 位移跨了两个检测间隔，速度仍为每帧SPEED
+tracker, boxes = track({0, 6}, 9)
+assert len(tracker.ids) == 1 and tracker.ids[0] == 0, tracker.ids
+assert np.allclose(tracker.velocity[:, 0], SPEED), tracker.velocity
+assert np.allclose(boxes[0, 2], box(8)[0][2]), boxes
+print("a track missed once keeps its velocity of %.1f pixels per frame" %
+      tracker.velocity[0, 0])
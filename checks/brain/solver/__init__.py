@@ -0,0 +1,9 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
\ No newline at end of file
@@ -0,0 +1,60 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-4])
+sys.path.insert(0, proj_root)
+
+import numpy as np
+import tensorflow as tf
+
+from eagle.brain.solver.solver import Solver
+
+K = 4
+BATCH_SIZE = 8
+rng = np.random.RandomState(0)
+inputs = rng.uniform(-1, 1, (K * BATCH_SIZE, 5)).astype(np.float32)
+targets = rng.uniform(-1, 1, (K * BATCH_SIZE, 1)).astype(np.float32)
+init_weights = rng.uniform(-1, 1, (5, 1)).astype(np.float32)
+
+
+def train(accumulate_steps, batch_size, updates):
+    """A linear model with the mean squared error, plain SGD"""
+    with tf.Graph().as_default():
+        x = tf.placeholder(tf.float32, (None, 5))
+        y = tf.placeholder(tf.float32, (None, 1))
+        weights = tf.Variable(init_weights, name="weights")
+        loss = tf.reduce_mean(tf.square(tf.matmul(x, weights) - y))
+        solver = Solver(None, None, {},
+                        {"accumulate_steps": str(accumulate_steps)})
+        solver.train_op = solver.build_train_op(
+            tf.train.GradientDescentOptimizer(0.1), loss,
+            tf.Variable(0, trainable=False))
+        with tf.Session() as sess:
+            sess.run([tf.global_variables_initializer(),
+                      tf.local_variables_initializer()])
+            for step in range(updates * accumulate_steps):
+                start = (step % accumulate_steps) * batch_size
+                sess.run(solver.train_op_for_step(step), feed_dict={
+                    x: inputs[start:start + batch_size],
+                    y: targets[start:start + batch_size]})
+            return sess.run(weights)
+
+
+# K micro-batches of BATCH_SIZE must give the same update as one batch of
+# K * BATCH_SIZE, also after several updates (the accumulators are reset)
+for updates in [1, 3]:
+    accumulated = train(K, BATCH_SIZE, updates)
+    full_batch = train(1, K * BATCH_SIZE, updates)
+    max_diff = np.abs(accumulated - full_batch).max()
+    assert max_diff < 1e-5, "accumulated update differs by %g" % max_diff
+    print("%d updates: accumulate_steps=%d x %d == batch %d (max diff %.2e)" % (
+        updates, K, BATCH_SIZE, K * BATCH_SIZE, max_diff))
@@ -0,0 +1,103 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import time
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-4])
+sys.path.insert(0, proj_root)
+
+import numpy as np
+import tensorflow as tf
+
+from datum.utils.process_config import process_config
+from eagle.brain.ssd.models.vgg import SSDVGG
+from eagle.brain.solver.ssd_solver import SSDSolver
+
+# the VGG base network of SSDVGG
+VGG_SCOPES = ["conv1_1", "conv1_2", "conv2_1", "conv2_2", "conv3_1",
+              "conv3_2", "conv3_3", "conv4_1", "conv4_2", "conv4_3",
+              "conv5_1", "conv5_2", "conv5_3", "fc6", "fc7"]
+
+
+class RandomDataSet(object):
+    """Random images, a few positive boxes per image"""
+
+    def __init__(self, batch_size, image_size, num_classes):
+        self.batch_size = batch_size
+        self.image_size = image_size
+        self.num_classes = num_classes
+        self.label_shape = None
+        self.rng = np.random.RandomState(0)
+
+    def batch(self):
+        images = self.rng.uniform(
+            -1, 1, (self.batch_size, self.image_size, self.image_size, 3))
+        labels = np.zeros((self.batch_size,) + self.label_shape,
+                          dtype=np.float32)
+        labels[:, :, 0] = 1
+        labels[:, :8, 0] = 0
+        labels[:, :8, 1] = 1
+        labels[:, :8, self.num_classes:] = self.rng.uniform(
+            -1, 1, (self.batch_size, 8, 4))
+        return images, labels
+
+
+def time_steps(conf, freeze_scopes, steps):
+    common_params, dataset_params, net_params, solver_params, \
+        box_encoder_params = conf
+    solver_params = dict(solver_params)
+    solver_params["freeze_scopes"] = json.dumps(freeze_scopes)
+    solver_params["feed_mode"] = "feed_dict"
+    solver_params["accumulate_steps"] = "1"
+    batch_size = int(common_params["batch_size"])
+    num_classes = int(common_params["num_classes"]) + 1
+
+    with tf.Graph().as_default():
+        net = SSDVGG(common_params, net_params, box_encoder_params)
+        dataset = RandomDataSet(batch_size, int(common_params["image_size"]),
+                                num_classes)
+        solver = SSDSolver(dataset, net, common_params, solver_params)
+        dataset.label_shape = tuple(solver.predicts.get_shape().as_list()[1:])
+        frozen = [var for var in tf.trainable_variables()
+                  if var.op.name.split("/")[0] in freeze_scopes]
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            before = sess.run(frozen)
+            for _ in range(3):
+                sess.run(solver.train_op, feed_dict=solver.next_feed())
+            start_time = time.time()
+            for _ in range(steps):
+                sess.run(solver.train_op, feed_dict=solver.next_feed())
+            duration = (time.time() - start_time) / steps
+            after = sess.run(frozen)
+    # the frozen variables must not have moved
+    for var, value_before, value_after in zip(frozen, before, after):
+        assert np.array_equal(value_before, value_after), var.op.name
+    return duration
+
+
+parser = OptionParser()
+parser.add_option("-c", "--conf", dest="configure",
+                  default=os.path.join(proj_root, "conf/ssd_train.cfg"),
+                  help="configure filename")
+parser.add_option("--steps", dest="steps", type="int", default=20,
+                  help="timed training steps per setting")
+(options, args) = parser.parse_args()
+
+conf = process_config(options.configure)
+full = time_steps(conf, [], options.steps)
+print("train all layers:       %.1f ms per step" % (full * 1000))
+frozen = time_steps(conf, VGG_SCOPES, options.steps)
+print("freeze conv1_1 .. fc7:  %.1f ms per step, %.2fx faster" % (
+    frozen * 1000, full / frozen))
@@ -0,0 +1,72 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-4])
+sys.path.insert(0, proj_root)
+
+import numpy as np
+
+from eagle.brain.yolo.decoder import YoloDecoder
+
+
+num_classes, boxes_per_cell, image_size, batch_size = 1, 2, 512, 32
+decoder = YoloDecoder(num_classes, boxes_per_cell, image_size, image_size,
+                      confidence_thresh=0.2, iou_threshold=0.45)
+rng = np.random.RandomState(0)
+
+# 1: a planted box is decoded at its place
+cell_size = 9
+predicts = np.zeros((1, cell_size, cell_size, num_classes + 5 * boxes_per_cell),
+                    dtype=np.float32)
+predicts[0, 4, 2, 0] = 1.0
+predicts[0, 4, 2, num_classes + 1] = 0.9
+predicts[0, 4, 2, num_classes + boxes_per_cell + 4:] = [0.5, 0.5, 0.1, 0.2]
+detections = decoder(predicts)[0]
+cell_width = image_size / cell_size
+expected = [0, 0.9, 2.5 * cell_width - 25.6, 2.5 * cell_width + 25.6,
+            4.5 * cell_width - 51.2, 4.5 * cell_width + 51.2]
+assert len(detections) == 1, detections
+assert np.allclose(detections[0], expected, atol=1e-3), detections
+
+# 2: the same object on the 9x9 and the 15x15 grid survives the fused NMS once
+predicts_g15 = np.zeros((1, 15, 15, num_classes + 5 * boxes_per_cell),
+                        dtype=np.float32)
+center = np.array([2.5 * cell_width, 4.5 * cell_width]) / (image_size / 15)
+col, row = np.floor(center).astype(np.int64)
+predicts_g15[0, row, col, 0] = 1.0
+predicts_g15[0, row, col, num_classes] = 0.8
+predicts_g15[0, row, col, num_classes + boxes_per_cell:
+             num_classes + boxes_per_cell + 4] = [
+    center[0] - col, center[1] - row, 0.1, 0.2]
+detections = decoder([predicts, predicts_g15])[0]
+assert len(detections) == 1 and np.isclose(detections[0, 1], 0.9), detections
+
+# 3: time per batch of random outputs, the candidates are dense
+grids = []
+for cell_size in [9, 15]:
+    predicts = rng.uniform(0, 1, (batch_size, cell_size, cell_size,
+                                  num_classes + 5 * boxes_per_cell))
+    predicts[..., num_classes + boxes_per_cell:] *= 0.3
+    predicts = predicts.astype(np.float32)
+    grids.append(predicts)
+for name, predicts in [("9x9", grids[0]), ("15x15", grids[1]),
+                       ("9x9 + 15x15", grids)]:
+    decoder(predicts)
+    start_time = time.time()
+    for _ in range(20):
+        detections = decoder(predicts)
+    duration = (time.time() - start_time) / 20
+    print("grid %s: %.2f ms per batch of %d, %.1f detections per image" % (
+        name, duration * 1000, batch_size,
+        np.mean([len(d) for d in detections])))
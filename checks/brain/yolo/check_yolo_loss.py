@@ -0,0 +1,116 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-4])
+sys.path.insert(0, proj_root)
+
+import numpy as np
+import tensorflow as tf
+
+from eagle.brain.yolo.yolo_tiny_net import YoloTinyNet
+
+
+common_params = {"image_size": "448", "num_classes": "20", "batch_size": "16"}
+net_params = {"cell_size": "7", "boxes_per_cell": "2", "weight_decay": "0.0005",
+              "object_scale": "1", "noobject_scale": "0.5",
+              "class_scale": "1", "coord_scale": "5"}
+max_objects = 20
+
+
+def iou(boxes1, box2):
+    b1 = np.concatenate([boxes1[..., :2] - boxes1[..., 2:] / 2,
+                         boxes1[..., :2] + boxes1[..., 2:] / 2], -1)
+    b2 = np.concatenate([box2[:2] - box2[2:] / 2, box2[:2] + box2[2:] / 2])
+    inter = np.minimum(b1[..., 2:], b2[2:]) - np.maximum(b1[..., :2], b2[:2])
+    inter_square = (inter[..., 0] * inter[..., 1] *
+                    (inter[..., 0] > 0) * (inter[..., 1] > 0))
+    square1 = (b1[..., 2] - b1[..., 0]) * (b1[..., 3] - b1[..., 1])
+    square2 = (b2[2] - b2[0]) * (b2[3] - b2[1])
+    return inter_square / (square1 + square2 - inter_square + 1e-6)
+
+
+def reference_loss(net, predicts, labels, objects_num):
+    """The per image, per object formulation in numpy"""
+    S, B, C = net.cell_size, net.boxes_per_cell, net.num_classes
+    cw = net.image_size / S
+    base = np.zeros([S, S, 1, 4])
+    for y in range(S):
+        for x in range(S):
+            base[y, x, 0, :2] = [cw * x, cw * y]
+    loss = np.zeros(4)
+    for i in range(len(predicts)):
+        predict = predicts[i]
+        boxes = (predict[:, :, C + B:].reshape(S, S, B, 4) *
+                 [cw, cw, net.image_size, net.image_size] + base)
+        for n in range(objects_num[i]):
+            label = labels[i, n]
+            objects = np.zeros([S, S])
+            objects[int(np.floor((label[1] - label[3] / 2) / cw)):
+                    int(np.ceil((label[1] + label[3] / 2) / cw)),
+                    int(np.floor((label[0] - label[2] / 2) / cw)):
+                    int(np.ceil((label[0] + label[2] / 2) / cw))] = 1
+            response = np.zeros([S, S, 1])
+            response[int(label[1] // cw), int(label[0] // cw)] = 1
+            C_ = iou(boxes, label[:4]) * response
+            I = (C_ >= C_.max(2, keepdims=True)) * response
+            p_C = predict[:, :, C:C + B]
+            P = np.eye(C)[int(label[4])]
+            p_sqrt_w = np.sqrt(np.clip(boxes[..., 2], 0, net.image_size))
+            p_sqrt_h = np.sqrt(np.clip(boxes[..., 3], 0, net.image_size))
+            loss += [
+                np.sum((objects[..., None] * (predict[:, :, :C] - P)) ** 2) / 2 * net.class_scale,
+                np.sum((I * (p_C - C_)) ** 2) / 2 * net.object_scale,
+                np.sum(((1 - I) * p_C) ** 2) / 2 * net.noobject_scale,
+                (np.sum((I * (boxes[..., 0] - label[0]) / cw) ** 2) / 2 +
+                 np.sum((I * (boxes[..., 1] - label[1]) / cw) ** 2) / 2 +
+                 np.sum((I * (p_sqrt_w - np.sqrt(label[2]))) ** 2) / 2 / net.image_size +
+                 np.sum((I * (p_sqrt_h - np.sqrt(label[3]))) ** 2) / 2 / net.image_size
+                 ) * net.coord_scale]
+    return loss
+
+
+net = YoloTinyNet(common_params, net_params)
+batch_size, S = net.batch_size, net.cell_size
+depth = net.num_classes + 5 * net.boxes_per_cell
+
+rng = np.random.RandomState(0)
+predicts_np = rng.uniform(0, 1, (batch_size, S, S, depth)).astype(np.float32)
+objects_num_np = rng.randint(1, max_objects + 1, batch_size).astype(np.int32)
+labels_np = np.zeros((batch_size, max_objects, 5), dtype=np.float32)
+wh = rng.uniform(10, 200, (batch_size, max_objects, 2))
+labels_np[..., 0:2] = wh / 2 + rng.uniform(0, 1, wh.shape) * (net.image_size - wh)
+labels_np[..., 2:4] = wh
+labels_np[..., 4] = rng.randint(0, net.num_classes, (batch_size, max_objects))
+
+predicts = tf.placeholder(tf.float32, (batch_size, S, S, depth))
+labels = tf.placeholder(tf.float32, (batch_size, max_objects, 5))
+objects_num = tf.placeholder(tf.int32, (batch_size,))
+loss, _ = net.batch_loss(predicts, labels, objects_num)
+grads = tf.gradients(tf.add_n(loss), predicts)
+print("graph ops: %d" % len(tf.get_default_graph().get_operations()))
+
+feed_dict = {predicts: predicts_np, labels: labels_np,
+             objects_num: objects_num_np}
+with tf.Session() as sess:
+    values = sess.run(loss, feed_dict=feed_dict)
+    start_time = time.time()
+    for _ in range(100):
+        sess.run(grads, feed_dict=feed_dict)
+    print("loss + gradient: %.2f ms" % ((time.time() - start_time) * 10))
+
+expected = reference_loss(net, predicts_np, labels_np, objects_num_np)
+for name, value, ref in zip(["class", "object", "noobject", "coord"],
+                            values, expected):
+    print("%-9s batched %.5f reference %.5f" % (name, value, ref))
+assert np.allclose(values, expected, rtol=1e-4), "loss mismatch"
@@ -0,0 +1,59 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/11
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+from datum.utils.process_config import process_config
+from datum.models.ssd.box_encoder import BoxEncoder
+
+
+parser = OptionParser()
+parser.add_option("-c", "--conf",
+                  dest="configure",
+                  help="configure filename")
+parser.add_option("-n", "--num_boxes",
+                  dest="num_boxes", default="200",
+                  help="ground truth boxes per image")
+(options, args) = parser.parse_args()
+if options.configure:
+    conf_file = str(options.configure)
+else:
+    print('please sspecify --conf configure filename')
+    exit(0)
+
+common_params, dataset_params, net_params, solver_params, box_encoder_params = \
+    process_config(conf_file)
+
+# 对比稠密匹配与网格索引匹配的结果和耗时
+width = int(common_params["image_width"])
+height = int(common_params["image_height"])
+num_boxes = int(options.num_boxes)
+rng = np.random.RandomState(0)
+xmin = rng.uniform(0, width - 8, num_boxes)
+ymin = rng.uniform(0, height - 8, num_boxes)
+xmax = np.minimum(xmin + rng.uniform(4, width / 3, num_boxes), width)
+ymax = np.minimum(ymin + rng.uniform(4, height / 3, num_boxes), height)
+labels = rng.randint(1, int(common_params["num_classes"]) + 1, num_boxes)
+ground_truth = np.stack([xmin, xmax, ymin, ymax, labels], axis=1)
+
+results = {}
+for use_grid_index in ["False", "True"]:
+    params = dict(box_encoder_params)
+    params["use_grid_index"] = use_grid_index
+    encoder = BoxEncoder(common_params, params)
+    start_time = time.time()
+    results[use_grid_index] = encoder.encode_y_sample(ground_truth)
+    print("use_grid_index: %s, %.3f sec" % (
+        use_grid_index, time.time() - start_time))
+
+print("identical:", np.array_equal(results["False"], results["True"]))
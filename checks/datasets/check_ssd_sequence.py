@@ -0,0 +1,65 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/11
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+from multiprocessing import Pool
+from optparse import OptionParser
+
+import numpy as np
+
+from datum.utils.process_config import process_config
+from datum.models.ssd.ssd_sequence import SSDSequence
+
+
+parser = OptionParser()
+parser.add_option("-c", "--conf",
+                  dest="configure",
+                  help="configure filename, e.g. conf/squeezenet_300_train.cfg")
+parser.add_option("--predictor_sizes",
+                  dest="predictor_sizes",
+                  default="[[36, 36], [19, 19], [10, 10], [5, 5], [3, 3], [1, 1]]",
+                  help="predictor layer sizes of the model (squeezenet_300)")
+(options, args) = parser.parse_args()
+if options.configure:
+    conf_file = str(options.configure)
+else:
+    print('please specify --conf configure filename')
+    exit(0)
+
+common_params, dataset_params, net_params, solver_params, box_encoder_params = \
+    process_config(conf_file)
+box_encoder_params["predictor_sizes"] = options.predictor_sizes
+sequence = SSDSequence(common_params, dataset_params, box_encoder_params)
+num_batches = min(len(sequence), 8)
+
+
+def load(idx):
+    return sequence[idx]
+
+
+# 1: the same batch index gives the same batch, also in worker processes
+start_time = time.time()
+serial = [sequence[i] for i in range(num_batches)]
+serial_time = time.time() - start_time
+start_time = time.time()
+with Pool(4) as pool:
+    parallel = pool.map(load, range(num_batches))
+parallel_time = time.time() - start_time
+for (images, labels), (p_images, p_labels) in zip(serial, parallel):
+    assert np.array_equal(images, p_images) and np.array_equal(labels, p_labels)
+print("%d batches %s: %.2f sec serial, %.2f sec with 4 processes" % (
+    num_batches, serial[0][1].shape, serial_time, parallel_time))
+
+# 2: the next epoch has another order, the order is fixed by seed + epoch
+first_epoch = sequence.order().copy()
+sequence.on_epoch_end()
+assert not np.array_equal(first_epoch, sequence.order())
+sequence.epoch = 0
+assert np.array_equal(first_epoch, sequence.order())
@@ -0,0 +1,188 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/12
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+from multiprocessing import Pool
+
+import numpy as np
+
+from datum.models.ssd.box_encoder import BoxEncoder
+from datum.models.ssd.ssd_dataset import load_records, process_record
+from datum.models.ssd.ssd_dataset import encode_labels
+from eagle.brain.ssd.box_encode_decode_utils import anchor_box_shapes
+
+# 每个worker进程中的BoxEncoder和图像处理参数，由_init_worker创建
+_worker = {}
+
+
+def _init_worker(common_params, dataset_params, box_encoder_params):
+    box_encoder = BoxEncoder(common_params, box_encoder_params)
+    _worker["box_encoder"] = box_encoder
+    _worker["shape_ids"] = anchor_shape_ids(box_encoder)
+    _worker["n_shapes"] = int(_worker["shape_ids"].max()) + 1
+    _worker["width"] = int(common_params["image_width"])
+    _worker["height"] = int(common_params["image_height"])
+    _worker["lower_resize_rate"] = float(dataset_params["lower_resize_rate"])
+    _worker["upper_resize_rate"] = float(dataset_params["upper_resize_rate"])
+
+
+def _match_record(record):
+    """Encode one record like the training does and count its positive anchors
+    Returns:
+      None for a dropped record, else (#ground truth boxes, counts of the
+      positive anchors per anchor shape)
+    """
+    out = process_record(record, _worker["width"], _worker["height"],
+                         _worker["lower_resize_rate"],
+                         _worker["upper_resize_rate"])
+    if out is None:
+        return None
+    gt_labels = out[1]
+    y_encoded = encode_labels(_worker["box_encoder"], gt_labels)[0]
+    # 正样本: 非背景类别的one-hot，中间阈值的anchor类别全为0
+    positives = np.nonzero(np.max(y_encoded[:, 1:-4], axis=1) > 0)[0]
+    counts = np.bincount(_worker["shape_ids"][positives],
+                         minlength=_worker["n_shapes"])
+    return len(gt_labels), counts
+
+
+def anchor_shapes(box_encoder):
+    """The anchor shapes `(aspect_ratio, second_box)` of every predictor
+    layer, the masked boxes of the encoder are left out"""
+    shapes = []
+    for i, aspect_ratios in enumerate(box_encoder.aspect_ratios_per_layer):
+        layer_shapes = anchor_box_shapes(aspect_ratios,
+                                         box_encoder.two_boxes_for_ar1)
+        box_mask = box_encoder.box_mask(i)
+        if box_mask is not None:
+            layer_shapes = [shape for shape, keep in
+                            zip(layer_shapes, box_mask) if keep]
+        shapes.append(layer_shapes)
+    return shapes
+
+
+def anchor_shape_ids(box_encoder):
+    """The index of the anchor shape (over all layers) of every anchor box of
+    `box_encoder.anchors`"""
+    shape_ids = []
+    offset = 0
+    for feature_map_size, n_boxes in zip(box_encoder.predictor_sizes,
+                                         box_encoder.n_boxes):
+        n_cells = int(feature_map_size[0]) * int(feature_map_size[1])
+        shape_ids.append(np.tile(np.arange(offset, offset + n_boxes), n_cells))
+        offset += n_boxes
+    return np.concatenate(shape_ids)
+
+
+class AnchorStatistics(object):
+    """Positive anchors of a dataset per predictor layer and anchor shape
+
+    All records of the text index are encoded with the BoxEncoder in parallel
+    worker processes, with the same resize rule and matching as the training.
+    Anchor shapes that (almost) never match a ground truth box only cost head
+    compute, encoding and loss work, `prune()` removes them from the config.
+    """
+
+    def __init__(self, common_params, dataset_params, box_encoder_params):
+        if not isinstance(common_params, dict):
+            raise TypeError("common_params must be dict")
+        if not isinstance(dataset_params, dict):
+            raise TypeError("dataset_params must be dict")
+        if not isinstance(box_encoder_params, dict):
+            raise TypeError("box_encoder_params must be dict")
+
+        self.common_params = common_params
+        self.dataset_params = dataset_params
+        self.box_encoder_params = box_encoder_params
+        self.box_encoder = BoxEncoder(common_params, box_encoder_params)
+        self.shapes = anchor_shapes(self.box_encoder)
+
+        self.num_images = 0
+        self.num_dropped = 0
+        self.num_gt_boxes = 0
+        # 每一层每种anchor形状的正样本个数
+        self.counts = [np.zeros(len(layer_shapes), dtype=np.int64)
+                       for layer_shapes in self.shapes]
+
+    def collect(self, num_workers=4, chunksize=16):
+        box_output_format = json.loads(self.dataset_params["box_output_format"])
+        is_need_bg = self.dataset_params["is_need_bg"] == "True"
+        records = load_records(str(self.dataset_params["path"]),
+                               box_output_format, is_need_bg)
+
+        counts = np.zeros(sum(len(s) for s in self.shapes), dtype=np.int64)
+        with Pool(num_workers, initializer=_init_worker,
+                  initargs=(self.common_params, self.dataset_params,
+                            self.box_encoder_params)) as pool:
+            for out in pool.imap_unordered(_match_record, records, chunksize):
+                if out is None:
+                    self.num_dropped += 1
+                    continue
+                self.num_images += 1
+                self.num_gt_boxes += out[0]
+                counts += out[1]
+
+        offset = 0
+        for i, layer_shapes in enumerate(self.shapes):
+            self.counts[i] += counts[offset:offset + len(layer_shapes)]
+            offset += len(layer_shapes)
+        return self
+
+    def num_anchors(self, n_boxes):
+        """The anchor boxes per image for `n_boxes` boxes per cell of every layer"""
+        return int(sum(int(size[0]) * int(size[1]) * n for size, n in
+                       zip(self.box_encoder.predictor_sizes, n_boxes)))
+
+    def report(self):
+        total = max(sum(int(c.sum()) for c in self.counts), 1)
+        lines = ["%d images (%d dropped by the resize rule), %d ground truth "
+                 "boxes, %d positive anchors" % (
+                     self.num_images, self.num_dropped, self.num_gt_boxes,
+                     total),
+                 "%-6s %-8s %-8s %10s %8s" % (
+                     "layer", "size", "ratio", "positives", "share")]
+        for i, layer_shapes in enumerate(self.shapes):
+            size = "%dx%d" % tuple(self.box_encoder.predictor_sizes[i])
+            for (ar, second_box), count in zip(layer_shapes, self.counts[i]):
+                # 1.00+ 为aspect ratio 1的第二个（稍大的）box
+                ratio = "%.2f%s" % (ar, "+" if second_box else "")
+                lines.append("%-6d %-8s %-8s %10d %7.2f%%" % (
+                    i, size, ratio, count, 100.0 * count / total))
+        return "\n".join(lines)
+
+    def prune(self, min_fraction=0.001, min_count=1):
+        """Drop the anchor shapes with few positives
+
+        An anchor shape is kept if it has at least `min_count` positives and
+        at least `min_fraction` of all positives. Every layer keeps at least
+        its most used shape.
+        Returns:
+          aspect_ratios_per_layer: the aspect ratios that keep a box
+          anchor_masks: one 0/1 list per layer over `anchor_box_shapes()` of
+            the pruned aspect ratios, None if no single box of aspect ratio 1
+            has to be masked
+        """
+        total = sum(int(c.sum()) for c in self.counts)
+        two_boxes_for_ar1 = self.box_encoder.two_boxes_for_ar1
+        aspect_ratios_per_layer = []
+        anchor_masks = []
+        for layer_shapes, counts in zip(self.shapes, self.counts):
+            keep = (counts >= min_count) & (counts >= min_fraction * total)
+            if not np.any(keep):
+                keep[np.argmax(counts)] = True
+            kept = [shape for shape, k in zip(layer_shapes, keep) if k]
+            aspect_ratios = sorted(set(ar for ar, _ in kept))
+            aspect_ratios_per_layer.append(aspect_ratios)
+            anchor_masks.append(
+                [1 if shape in kept else 0 for shape in
+                 anchor_box_shapes(aspect_ratios, two_boxes_for_ar1)])
+        if all(all(box_mask) for box_mask in anchor_masks):
+            anchor_masks = None
+        return aspect_ratios_per_layer, anchor_masks
@@ -20,6 +20,9 @@ via an intersection-over-union threshold criterion.
 
 import numpy as np
 from eagle.brain.ssd.box_encode_decode_utils import iou, convert_coordinates
+from eagle.brain.ssd.box_encode_decode_utils import generate_anchor_boxes
+from eagle.brain.ssd.box_encode_decode_utils import count_anchor_boxes
+from eagle.brain.ssd.box_encode_decode_utils import parse_anchor_masks
 
 
 class BoxEncoder:
@@ -84,15 +87,42 @@ class BoxEncoder:
         self.pos_iou_threshold = pos_iou_threshold
         self.neg_iou_threshold = neg_iou_threshold
 
+        # 是否使用网格索引加速匹配（可选，默认关闭）
+        use_grid_index = True if box_encoder_params.get(
+            "use_grid_index", "False") == "True" else False
+        self.use_grid_index = use_grid_index
+
         self.check_valid()
 
+        # 每一层保留哪些anchor box（可选，由anchor_stats统计数据集后生成）
+        self.anchor_masks = parse_anchor_masks(
+            box_encoder_params.get("anchor_masks", "None"),
+            self.aspect_ratios_per_layer, self.two_boxes_for_ar1)
+
         self.n_boxes = []
-        if self.aspect_ratios_per_layer:
-            for aspect_ratios in self.aspect_ratios_per_layer:
-                if (1 in aspect_ratios) & self.two_boxes_for_ar1:
-                    self.n_boxes.append(len(aspect_ratios) + 1)
-                else:
-                    self.n_boxes.append(len(aspect_ratios))
+        for i, aspect_ratios in enumerate(self.aspect_ratios_per_layer):
+            self.n_boxes.append(count_anchor_boxes(
+                aspect_ratios, self.two_boxes_for_ar1, self.box_mask(i)))
+
+        # `(#boxes, 8)`: the 4 anchor box coordinates and the 4 variances of
+        # every box, in the same order as the boxes predicted by the model
+        self.anchors = self.generate_anchor_template()
+
+        # The grid index only skips anchor boxes whose IoU with a ground truth
+        # box is zero, which is only safe while both thresholds are positive.
+        self.grid_index = None
+        if self.use_grid_index and self.neg_iou_threshold > 0 and \
+                self.pos_iou_threshold > 0:
+            self.grid_index = AnchorGridIndex(
+                anchor_boxes=self.anchors[:, :4],
+                predictor_sizes=self.predictor_sizes,
+                n_boxes=self.n_boxes,
+                coords=self.coords)
+
+    def box_mask(self, layer):
+        if self.anchor_masks is None:
+            return None
+        return self.anchor_masks[layer]
 
     def check_valid(self):
         # 检测参数输入是否在正确
@@ -141,18 +171,16 @@ class BoxEncoder:
                 class_id)`, and `class_id` must be an integer greater than 0 for
                 all boxes as class_id 0 is reserved for the background class.
         Returns:
-            `y_encoded`, a 3D numpy array of shape `(batch_size, #boxes, #classes + 4 + 4 + 4)` that serves as the
+            `y_encoded`, a 3D numpy array of shape `(batch_size, #boxes, #classes + 4)` that serves as the
             ground truth label tensor for training, where `#boxes` is the total number of boxes predicted by the
             model per image, and the classes are one-hot-encoded. The four elements after the class vecotrs in
-            the last axis are the box coordinates, the next four elements after that are just dummy elements, and
-            the last four elements are the variances.
+            the last axis are the box coordinate offsets from the anchor boxes in `self.anchors`.
         '''
         # 1: Generate the template for y_encoded
-        y_encode_template = self.generate_encode_template(batch_size=len(ground_truth_labels))
         # We'll write the ground truth box data to this array
-        y_encoded = np.copy(y_encode_template)
+        y_encoded = self.generate_encode_template(batch_size=len(ground_truth_labels))
 
-        # 2: Match the boxes from `ground_truth_labels` to the anchor boxes in `y_encode_template`
+        # 2: Match the boxes from `ground_truth_labels` to the anchor boxes in `self.anchors`
         #    and for each matched box record the ground truth coordinates in `y_encoded`.
         # Every time there is no match for a anchor box, record `class_id` 0 in
         # `y_encoded` for that anchor box.
@@ -161,11 +189,11 @@ class BoxEncoder:
         class_vector = np.eye(self.num_classes)
 
         # For each batch item...
-        for i in range(y_encode_template.shape[0]):
+        for i in range(y_encoded.shape[0]):
             # 1 for all anchor boxes that are not yet matched to a ground truth box, 0 otherwise
-            available_boxes = np.ones((y_encode_template.shape[1]))
+            available_boxes = np.ones((y_encoded.shape[1]))
             # 1 for all negative boxes, 0 otherwise
-            negative_boxes = np.ones((y_encode_template.shape[1]))
+            negative_boxes = np.ones((y_encoded.shape[1]))
             # For each ground truth box belonging to the current batch item...
             for true_box in ground_truth_labels[i]:
                 true_box = true_box.astype(np.float)
@@ -179,46 +207,9 @@ class BoxEncoder:
                 if self.coords == 'centroids':
                     true_box = convert_coordinates(
                         true_box, start_index=0, conversion='minmax2centroids')
-                # The iou similarities for all anchor boxes
-                similarities = iou(
-                    y_encode_template[i, :, -12:-8],
-                    true_box[:-1],
-                    coords=self.coords)
-                # If a negative box gets an IoU match >=
-                # `self.neg_iou_threshold`, it's no longer a valid negative box
-                negative_boxes[similarities >= self.neg_iou_threshold] = 0
-                # Filter out anchor boxes which aren't available anymore (i.e.
-                # already matched to a different ground truth box)
-                similarities *= available_boxes
-                available_and_thresh_met = np.copy(similarities)
-                # Filter out anchor boxes which don't meet the iou threshold
-                available_and_thresh_met[
-                    available_and_thresh_met < self.pos_iou_threshold] = 0
-                # Get the indices of the left-over anchor boxes to which we
-                # want to assign this ground truth box
-                assign_indices = np.nonzero(available_and_thresh_met)[0]
-                if len(assign_indices) > 0:  # If we have any matches
-                    # Write the ground truth box coordinates and class to all
-                    # assigned anchor box positions. Remember that the last
-                    # four elements of `y_encoded` are just dummy entries.
-                    y_encoded[i, assign_indices, :-8] = np.concatenate(
-                        (class_vector[int(true_box[4])], true_box[0:4]), axis=0)
-                    # Make the assigned anchor boxes unavailable for the next
-                    # ground truth box
-                    available_boxes[assign_indices] = 0
-                else:  # If we don't have any matches
-                    # Get the index of the best iou match out of all available
-                    # boxes
-                    best_match_index = np.argmax(similarities)
-                    # Write the ground truth box coordinates and class to the
-                    # best match anchor box position
-                    y_encoded[i, best_match_index, :-8] = np.concatenate(
-                        (class_vector[int(true_box[4])], true_box[0:4]), axis=0)
-                    # Make the assigned anchor box unavailable for the next
-                    # ground truth box
-                    available_boxes[best_match_index] = 0
-                    # The assigned anchor box is no longer a negative box
-                    negative_boxes[best_match_index] = 0
+                self.match_true_box(
+                    self.anchors[:, :4], true_box, class_vector,
+                    y_encoded[i], available_boxes, negative_boxes)
             # Set the classes of all remaining available anchor boxes to class
             # zero
             background_class_indices = np.nonzero(negative_boxes)[0]
@@ -226,185 +217,163 @@ class BoxEncoder:
 
         # 3: Convert absolute box coordinates to offsets from the anchor boxes
         # and normalize them
+        self.encode_offsets(y_encoded)
+
+        return y_encoded
+
+    def match_true_box(self, anchor_boxes, true_box, class_vector,
+                       y_encoded, available_boxes, negative_boxes):
+        """
+        Match a single ground truth box against the anchor boxes of one image
+        and write the result into `y_encoded` in place.
+        Arguments:
+            anchor_boxes (array): `(#boxes, 4)` anchor box coordinates in `self.coords`.
+            true_box (array): The ground truth box `(4 coordinates, class_id)`
+                in `self.coords`, already normalized if `self.normalize_coords`.
+            class_vector (array): The identity matrix used as one-hot class vectors.
+            y_encoded (array): `(#boxes, #classes + 4)` encoding of the image.
+            available_boxes (array): 1 for all anchor boxes that are not yet matched.
+            negative_boxes (array): 1 for all anchor boxes that are still negatives.
+        """
+        if self.grid_index is not None:
+            return self._match_true_box_sparse(
+                anchor_boxes, true_box, class_vector,
+                y_encoded, available_boxes, negative_boxes)
+
+        # The iou similarities for all anchor boxes
+        similarities = iou(anchor_boxes, true_box[:-1], coords=self.coords)
+        # If a negative box gets an IoU match >=
+        # `self.neg_iou_threshold`, it's no longer a valid negative box
+        negative_boxes[similarities >= self.neg_iou_threshold] = 0
+        # Filter out anchor boxes which aren't available anymore (i.e.
+        # already matched to a different ground truth box)
+        similarities *= available_boxes
+        available_and_thresh_met = np.copy(similarities)
+        # Filter out anchor boxes which don't meet the iou threshold
+        available_and_thresh_met[
+            available_and_thresh_met < self.pos_iou_threshold] = 0
+        # Get the indices of the left-over anchor boxes to which we
+        # want to assign this ground truth box
+        assign_indices = np.nonzero(available_and_thresh_met)[0]
+        if len(assign_indices) > 0:  # If we have any matches
+            # Write the ground truth box coordinates and class to all
+            # assigned anchor box positions
+            y_encoded[assign_indices] = np.concatenate(
+                (class_vector[int(true_box[4])], true_box[0:4]), axis=0)
+            # Make the assigned anchor boxes unavailable for the next
+            # ground truth box
+            available_boxes[assign_indices] = 0
+        else:  # If we don't have any matches
+            # Get the index of the best iou match out of all available
+            # boxes
+            best_match_index = np.argmax(similarities)
+            # Write the ground truth box coordinates and class to the
+            # best match anchor box position
+            y_encoded[best_match_index] = np.concatenate(
+                (class_vector[int(true_box[4])], true_box[0:4]), axis=0)
+            # Make the assigned anchor box unavailable for the next
+            # ground truth box
+            available_boxes[best_match_index] = 0
+            # The assigned anchor box is no longer a negative box
+            negative_boxes[best_match_index] = 0
+
+    def _match_true_box_sparse(self, anchor_boxes, true_box, class_vector,
+                               y_encoded, available_boxes, negative_boxes):
+        """
+        Same as `match_true_box()`, but only the anchor boxes returned by the
+        grid index are compared with the ground truth box. All the others have
+        an IoU of zero, so the assignments are identical to the dense version.
+        """
+        candidates = self.grid_index.query(true_box)
+        similarities = iou(
+            anchor_boxes[candidates], true_box[:-1], coords=self.coords)
+        negative_boxes[candidates[
+            similarities >= self.neg_iou_threshold]] = 0
+        similarities *= available_boxes[candidates]
+        assign_indices = candidates[
+            (similarities >= self.pos_iou_threshold) & (similarities != 0)]
+        if len(assign_indices) > 0:
+            y_encoded[assign_indices] = np.concatenate(
+                (class_vector[int(true_box[4])], true_box[0:4]), axis=0)
+            available_boxes[assign_indices] = 0
+        else:
+            # `np.argmax()` over all anchor boxes falls back to index 0 when
+            # every similarity is zero, keep that behaviour
+            best_match_index = 0
+            if len(candidates) > 0 and np.max(similarities) > 0:
+                best_match_index = candidates[np.argmax(similarities)]
+            y_encoded[best_match_index] = np.concatenate(
+                (class_vector[int(true_box[4])], true_box[0:4]), axis=0)
+            available_boxes[best_match_index] = 0
+            negative_boxes[best_match_index] = 0
+
+    def encode_offsets(self, y_encoded):
+        """
+        Convert the absolute ground truth box coordinates in `y_encoded` to
+        offsets from the anchor boxes in `self.anchors`, in place.
+        """
+        anchors = self.anchors
         if self.coords == 'centroids':
             # cx(gt) - cx(anchor), cy(gt) - cy(anchor)
-            y_encoded[:, :, [-12, -11]] -= y_encode_template[:, :, [-12, -11]]
+            y_encoded[:, :, [-4, -3]] -= anchors[:, [0, 1]]
             # (cx(gt) - cx(anchor)) / w(anchor) / cx_variance, (cy(gt) - cy(anchor)) / h(anchor) / cy_variance
-            y_encoded[:, :, [-12, -11]] /= y_encode_template[:,:,[-10, -9]] * y_encode_template[:, :, [-4, -3]]
+            y_encoded[:, :, [-4, -3]] /= anchors[:, [2, 3]] * anchors[:, [4, 5]]
             # w(gt) / w(anchor), h(gt) / h(anchor)
-            y_encoded[:, :, [-10, -9]] /= y_encode_template[:, :, [-10, -9]]
+            y_encoded[:, :, [-2, -1]] /= anchors[:, [2, 3]]
             # ln(w(gt) / w(anchor)) / w_variance, ln(h(gt) / h(anchor)) /
             # h_variance (ln == natural logarithm)
-            y_encoded[:, :, [-10, -9]] = np.log(y_encoded[:, :, [-10, -9]]) / y_encode_template[:, :, [-2, -1]]
-
-        return y_encoded
+            y_encoded[:, :, [-2, -1]] = np.log(
+                y_encoded[:, :, [-2, -1]]) / anchors[:, [6, 7]]
 
     def generate_encode_template(self, batch_size):
         '''
         Produces an encoding template for the ground truth label tensor for a given batch.
-        Note that all tensor creation, reshaping and concatenation operations performed in this function
-        and the sub-functions it calls are identical to those performed inside the conv net model. This, of course,
-        must be the case in order to preserve the spatial meaning of each box prediction, but it's useful to make
-        yourself aware of this fact and why it is necessary.
-        In other words, the boxes in `y_encoded` must have a specific order in order correspond to the right spatial
-        positions and scales of the boxes predicted by the model. The sequence of operations here ensures that `y_encoded`
-        has this specific form.
         Arguments:
             batch_size (int): The batch size.
         Returns:
-            A Numpy array of shape `(batch_size, #boxes, #classes + 12)`, the template into which to encode
-            the ground truth labels for training. The last axis has length `#classes + 12` because the model
-            output contains not only the 4 predicted box coordinate offsets, but also the 4 coordinates for
-            the anchor boxes and the 4 variance values.
+            A Numpy array of shape `(batch_size, #boxes, #classes + 4)`, the template into which to encode
+            the ground truth labels for training. The classes are all zeros and the 4 coordinates are set
+            to the anchor boxes, so that boxes without a match are encoded with zero offsets.
         '''
-
-        # 2: For each conv predictor layer (i.e. for each scale factor) get the tensors for
-        #    the anchor box coordinates of shape `(batch, n_boxes_total, 4)`
-        boxes_tensor = []
-
-        if self.aspect_ratios_per_layer:
-            for i in range(len(self.predictor_sizes)):
-                boxes_tensor.append(
-                    self.generate_anchor_boxes(
-                        batch_size=batch_size,
-                        feature_map_size=self.predictor_sizes[i],
-                        aspect_ratios=self.aspect_ratios_per_layer[i],
-                        this_scale=self.scales[i],
-                        next_scale=self.scales[i+1])
-                )
-        # Concatenate the anchor tensors from the individual layers to one
-        boxes_tensor = np.concatenate(boxes_tensor, axis=1)
-
-        # 3: Create a template tensor to hold the one-hot class encodings of shape `(batch, #boxes, #classes)`
-        # It will contain all zeros for now, the classes will be set in the
-        # matching process that follows
-        classes_tensor = np.zeros(
-            (batch_size, boxes_tensor.shape[1], self.num_classes))
-
-        # 4: Create a tensor to contain the variances. This tensor has the same shape as `boxes_tensor` and simply
-        # contains the same 4 variance values for every position in the last
-        # axis.
-        variances_tensor = np.zeros_like(boxes_tensor)
-        variances_tensor += self.variances  # Long live broadcasting
-
-        # 4: Concatenate the classes, boxes and variances tensors to get our final template for y_encoded. We also need
-        #    another tensor of the shape of `boxes_tensor` as a space filler so that `y_encode_template` has the same
-        #    shape as the SSD model output tensor. The content of this tensor is irrelevant, we'll just use
-        #    `boxes_tensor` a second time.
-        y_encode_template = np.concatenate(
-            (classes_tensor, boxes_tensor, boxes_tensor, variances_tensor),
-            axis=2)
-
+        y_encode_template = np.zeros(
+            (batch_size, self.anchors.shape[0], self.num_classes + 4))
+        y_encode_template[:, :, -4:] = self.anchors[:, :4]
         return y_encode_template
 
-    def generate_anchor_boxes(self, batch_size, feature_map_size,
-                              aspect_ratios, this_scale, next_scale):
-        """
-        Arguments:
-                batch_size (int): The batch size.
-            feature_map_size (tuple): A list or tuple `[feature_map_height, feature_map_width]` with the spatial
-                dimensions of the feature map for which to generate the anchor boxes.
-            aspect_ratios (list): A list of floats, the aspect ratios for which anchor boxes are to be generated.
-                All list elements must be unique.
-            this_scale (float): A float in [0, 1], the scaling factor for the size of the generate anchor boxes
-                as a fraction of the shorter side of the input image.
-            next_scale (float): A float in [0, 1], the next larger scaling factor. Only relevant if
-                `self.two_boxes_for_ar1 == True`.
+    def generate_anchor_template(self):
+        '''
+        Note that the order of the anchor boxes produced here is identical to the order of the boxes
+        predicted by the conv net model. This must be the case in order to preserve the spatial meaning
+        of each box prediction, the loss and the decoder look up the anchor of a box by its index.
         Returns:
-            A 4D Numpy tensor of shape `(feature_map_height, feature_map_width, n_boxes_per_cell, 4)` where the
-            last dimension contains `(xmin, xmax, ymin, ymax)` for each anchor box in each cell of the feature map.
-        """
-        # Compute box width and height for each aspect ratio
-        # The shorter side of the image will be used to compute `w` and `h`
-        # using `scale` and `aspect_ratios`.
-        aspect_ratios = np.sort(aspect_ratios)
-        size = min(self.image_height, self.image_width)
-        # Compute the box widths and and heights for all aspect ratios
-        wh_list = []
-        n_boxes = len(aspect_ratios)
-        for ar in aspect_ratios:
-            if (ar == 1) & self.two_boxes_for_ar1:
-                # Compute the regular anchor box for aspect ratio 1 and...
-                w = this_scale * size * np.sqrt(ar)
-                h = this_scale * size / np.sqrt(ar)
-                wh_list.append((w, h))
-                # ...also compute one slightly larger version using the geometric mean of this scale value and the next
-                w = np.sqrt(this_scale * next_scale) * size * np.sqrt(ar)
-                h = np.sqrt(this_scale * next_scale) * size / np.sqrt(ar)
-                wh_list.append((w, h))
-                # Add 1 to `n_boxes` since we seem to have two boxes for aspect
-                # ratio 1
-                n_boxes += 1
-            else:
-                w = this_scale * size * np.sqrt(ar)
-                h = this_scale * size / np.sqrt(ar)
-                wh_list.append((w, h))
-        wh_list = np.array(wh_list)
-
-        # Compute the grid of box center points. They are identical for all
-        # aspect ratios
-        cell_height = self.image_height / feature_map_size[0]
-        cell_width = self.image_width / feature_map_size[1]
-        cx = np.linspace(cell_width/2,
-                         self.image_width - cell_width/2,
-                         feature_map_size[1])
-        cy = np.linspace(cell_height/2,
-                         self.image_height - cell_height/2,
-                         feature_map_size[0])
-        cx_grid, cy_grid = np.meshgrid(cx, cy)
-        # This is necessary for np.tile() to do what we want further down
-        cx_grid = np.expand_dims(cx_grid, -1)
-        # This is necessary for np.tile() to do what we want further down
-        cy_grid = np.expand_dims(cy_grid, -1)
-
-        # Create a 4D tensor template of shape `(feature_map_height, feature_map_width, n_boxes, 4)`
-        # where the last dimension will contain `(cx, cy, w, h)`
-        boxes_tensor = np.zeros(
-            (feature_map_size[0], feature_map_size[1], n_boxes, 4))
-
-        boxes_tensor[:, :, :, 0] = np.tile(cx_grid, (1, 1, n_boxes))  # Set cx
-        boxes_tensor[:, :, :, 1] = np.tile(cy_grid, (1, 1, n_boxes))  # Set cy
-        boxes_tensor[:, :, :, 2] = wh_list[:, 0]  # Set w
-        boxes_tensor[:, :, :, 3] = wh_list[:, 1]  # Set h
-
-        # Convert `(cx, cy, w, h)` to `(xmin, xmax, ymin, ymax)`
-        boxes_tensor = convert_coordinates(
-            boxes_tensor, start_index=0, conversion='centroids2minmax')
-
-        # `normalize_coords` is enabled, normalize the coordinates to be within [0,1]
-        if self.normalize_coords:
-            boxes_tensor[:, :, :, :2] /= self.image_width
-            boxes_tensor[:, :, :, 2:] /= self.image_height
-
-        if self.coords == 'centroids':
-            # TODO: Implement box limiting directly for `(cx, cy, w, h)` so that we don't have to unnecessarily convert back and forth
-            # Convert `(xmin, xmax, ymin, ymax)` back to `(cx, cy, w, h)`
-            boxes_tensor = convert_coordinates(
-                boxes_tensor, start_index=0, conversion='minmax2centroids')
-
-        # Now prepend one dimension to `boxes_tensor` to account for the batch size and tile it along
-        # The result will be a 5D tensor of shape `(batch_size,
-        # feature_map_height, feature_map_width, n_boxes, 4)`
-        boxes_tensor = np.expand_dims(boxes_tensor, axis=0)
-        boxes_tensor = np.tile(boxes_tensor, (batch_size, 1, 1, 1, 1))
-
-        # Now reshape the 5D tensor above into a 3D tensor of shape
-        # `(batch, feature_map_height * feature_map_width * n_boxes, 4)`. The resulting
-        # order of the tensor content will be identical to the order obtained from the reshaping operation
-        # in our Keras model (we're using the Tensorflow backend, and tf.reshape() and np.reshape()
-        # use the same default index order, which is C-like index ordering)
-        boxes_tensor = np.reshape(boxes_tensor, (batch_size, -1, 4))
-
-        return boxes_tensor
+            A Numpy array of shape `(#boxes, 8)` with the 4 anchor box coordinates and the 4 variances
+            of every box.
+        '''
+        anchors = []
+        for i in range(len(self.predictor_sizes)):
+            boxes = generate_anchor_boxes(
+                self.image_height, self.image_width,
+                feature_map_size=self.predictor_sizes[i],
+                this_scale=self.scales[i],
+                next_scale=self.scales[i + 1],
+                aspect_ratios=self.aspect_ratios_per_layer[i],
+                two_boxes_for_ar1=self.two_boxes_for_ar1,
+                variances=self.variances,
+                coords=self.coords,
+                normalize_coords=self.normalize_coords,
+                box_mask=self.box_mask(i))
+            # `(feature_map_height * feature_map_width * n_boxes, 8)`, in the
+            # same C-like index order as `tf.reshape()` in the model
+            anchors.append(np.reshape(boxes, (-1, 8)))
+        return np.concatenate(anchors, axis=0)
 
     def encode_y_sample(self, ground_truth_labels):
         """仅仅包含一副图像中的目标的位置信息"""
         # 1: Generate the template for y_encoded
-        y_encode_template = self.generate_encode_template(batch_size=1)
         # We'll write the ground truth box data to this array
-        y_encoded = np.copy(y_encode_template)
+        y_encoded = self.generate_encode_template(batch_size=1)
 
-        # 2: Match the boxes from `ground_truth_labels` to the anchor boxes in `y_encode_template`
+        # 2: Match the boxes from `ground_truth_labels` to the anchor boxes in `self.anchors`
         #    and for each matched box record the ground truth coordinates in `y_encoded`.
         # Every time there is no match for a anchor box, record `class_id` 0 in
         # `y_encoded` for that anchor box.
@@ -413,11 +382,11 @@ class BoxEncoder:
         class_vector = np.eye(self.num_classes)
 
         # For each batch item...
-        for i in range(y_encode_template.shape[0]):
+        for i in range(y_encoded.shape[0]):
             # 1 for all anchor boxes that are not yet matched to a ground truth box, 0 otherwise
-            available_boxes = np.ones((y_encode_template.shape[1]))
+            available_boxes = np.ones((y_encoded.shape[1]))
             # 1 for all negative boxes, 0 otherwise
-            negative_boxes = np.ones((y_encode_template.shape[1]))
+            negative_boxes = np.ones((y_encoded.shape[1]))
             # For each ground truth box belonging to the current batch item...
             for true_box in ground_truth_labels:
                 if isinstance(true_box, list):
@@ -435,46 +404,9 @@ class BoxEncoder:
                 if self.coords == 'centroids':
                     true_box = convert_coordinates(
                         true_box, start_index=0, conversion='minmax2centroids')
-                # The iou similarities for all anchor boxes
-                similarities = iou(
-                    y_encode_template[i, :, -12:-8],
-                    true_box[:-1],
-                    coords=self.coords)
-                # If a negative box gets an IoU match >=
-                # `self.neg_iou_threshold`, it's no longer a valid negative box
-                negative_boxes[similarities >= self.neg_iou_threshold] = 0
-                # Filter out anchor boxes which aren't available anymore (i.e.
-                # already matched to a different ground truth box)
-                similarities *= available_boxes
-                available_and_thresh_met = np.copy(similarities)
-                # Filter out anchor boxes which don't meet the iou threshold
-                available_and_thresh_met[
-                    available_and_thresh_met < self.pos_iou_threshold] = 0
-                # Get the indices of the left-over anchor boxes to which we
-                # want to assign this ground truth box
-                assign_indices = np.nonzero(available_and_thresh_met)[0]
-                if len(assign_indices) > 0:  # If we have any matches
-                    # Write the ground truth box coordinates and class to all
-                    # assigned anchor box positions. Remember that the last
-                    # four elements of `y_encoded` are just dummy entries.
-                    y_encoded[i, assign_indices, :-8] = np.concatenate(
-                        (class_vector[int(true_box[4])], true_box[0:4]), axis=0)
-                    # Make the assigned anchor boxes unavailable for the next
-                    # ground truth box
-                    available_boxes[assign_indices] = 0
-                else:  # If we don't have any matches
-                    # Get the index of the best iou match out of all available
-                    # boxes
-                    best_match_index = np.argmax(similarities)
-                    # Write the ground truth box coordinates and class to the
-                    # best match anchor box position
-                    y_encoded[i, best_match_index, :-8] = np.concatenate(
-                        (class_vector[int(true_box[4])], true_box[0:4]), axis=0)
-                    # Make the assigned anchor box unavailable for the next
-                    # ground truth box
-                    available_boxes[best_match_index] = 0
-                    # The assigned anchor box is no longer a negative box
-                    negative_boxes[best_match_index] = 0
+                self.match_true_box(
+                    self.anchors[:, :4], true_box, class_vector,
+                    y_encoded[i], available_boxes, negative_boxes)
             # Set the classes of all remaining available anchor boxes to class
             # zero
             background_class_indices = np.nonzero(negative_boxes)[0]
@@ -482,18 +414,82 @@ class BoxEncoder:
 
         # 3: Convert absolute box coordinates to offsets from the anchor boxes
         # and normalize them
-        if self.coords == 'centroids':
-            # cx(gt) - cx(anchor), cy(gt) - cy(anchor)
-            y_encoded[:, :, [-12, -11]] -= y_encode_template[:, :, [-12, -11]]
-            # (cx(gt) - cx(anchor)) / w(anchor) / cx_variance, (cy(gt) - cy(anchor)) / h(anchor) / cy_variance
-            y_encoded[:, :, [-12, -11]] /= (
-                y_encode_template[:, :, [-10, -9]] *
-                y_encode_template[:, :, [-4, -3]])
-            # w(gt) / w(anchor), h(gt) / h(anchor)
-            y_encoded[:, :, [-10, -9]] /= y_encode_template[:, :, [-10, -9]]
-            # ln(w(gt) / w(anchor)) / w_variance, ln(h(gt) / h(anchor)) /
-            # h_variance (ln == natural logarithm)
-            y_encoded[:, :, [-10, -9]] = np.log(
-                y_encoded[:, :, [-10, -9]]) / y_encode_template[:, :, [-2, -1]]
+        self.encode_offsets(y_encoded)
 
-        return y_encoded
\ No newline at end of file
+        return y_encoded
+
+class AnchorGridIndex:
+    """
+    Buckets the anchor boxes by predictor layer and feature map cell, so that
+    a ground truth box only has to be compared with the anchor boxes whose
+    centers lie in the cells it can overlap with.
+    """
+    def __init__(self, anchor_boxes, predictor_sizes, n_boxes, coords):
+        """
+        Arguments:
+            anchor_boxes (array): `(#boxes, 4)` anchor boxes, in the order
+                produced by `BoxEncoder.generate_anchor_template()`.
+            predictor_sizes (array): `(#layers, 2)` feature map sizes.
+            n_boxes (list): The number of anchor boxes per cell for every layer.
+            coords (str): The coordinate format of `anchor_boxes`.
+        """
+        self.coords = coords
+        if coords == 'centroids':
+            anchor_boxes = convert_coordinates(
+                anchor_boxes, start_index=0, conversion='centroids2minmax')
+
+        # 每一层记录(起始下标, 高, 宽, 每个cell的box数, cx, cy, 最大半宽, 最大半高)
+        self.layers = []
+        offset = 0
+        for feature_map_size, n in zip(predictor_sizes, n_boxes):
+            height, width = int(feature_map_size[0]), int(feature_map_size[1])
+            boxes = anchor_boxes[offset:offset + height * width * n]
+            boxes = boxes.reshape((height, width, n, 4))
+            cx = (boxes[0, :, 0, 0] + boxes[0, :, 0, 1]) / 2.0
+            cy = (boxes[:, 0, 0, 2] + boxes[:, 0, 0, 3]) / 2.0
+            half_w = np.max(boxes[..., 1] - boxes[..., 0]) / 2.0
+            half_h = np.max(boxes[..., 3] - boxes[..., 2]) / 2.0
+            self.layers.append(
+                (offset, height, width, n, cx, cy, half_w, half_h))
+            offset += height * width * n
+        self.n_anchor_boxes = offset
+
+    def query(self, true_box):
+        """
+        Arguments:
+            true_box (array): The ground truth box in `self.coords`, any
+                trailing elements (e.g. the class id) are ignored.
+        Returns:
+            A sorted 1D int array with the indices of all anchor boxes that may
+            have a non-zero IoU with `true_box`.
+        """
+        if self.coords == 'centroids':
+            xmin = true_box[0] - true_box[2] / 2.0
+            xmax = true_box[0] + true_box[2] / 2.0
+            ymin = true_box[1] - true_box[3] / 2.0
+            ymax = true_box[1] + true_box[3] / 2.0
+        else:
+            xmin, xmax, ymin, ymax = true_box[:4]
+
+        candidates = []
+        for offset, height, width, n, cx, cy, half_w, half_h in self.layers:
+            # Two boxes can only overlap if their centers are closer than the
+            # sum of their half sizes, so expand the ground truth box by the
+            # largest anchor box of this layer (plus a tiny margin against
+            # rounding errors) and look up the cells inside it.
+            eps = 1e-6 * max(half_w, half_h)
+            col_start = np.searchsorted(cx, xmin - half_w - eps, side='left')
+            col_end = np.searchsorted(cx, xmax + half_w + eps, side='right')
+            row_start = np.searchsorted(cy, ymin - half_h - eps, side='left')
+            row_end = np.searchsorted(cy, ymax + half_h + eps, side='right')
+            if col_start >= col_end or row_start >= row_end:
+                continue
+            rows = np.arange(row_start, row_end)
+            cols = np.arange(col_start, col_end)
+            cells = rows[:, None] * width + cols[None, :]
+            indices = offset + cells[:, :, None] * n + np.arange(n)
+            candidates.append(indices.ravel())
+
+        if len(candidates) == 0:
+            return np.zeros((0,), dtype=np.int64)
+        return np.concatenate(candidates)
@@ -0,0 +1,144 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/7
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from datum.meta.dataset import DataSet
+
+META_FILE = "meta.json"
+LABELS_FILE = "labels.npy"
+
+
+class FeatureCacheWriter(object):
+    """Store the backbone features and the encoded labels of a dataset
+
+    Every feature layer and the labels go to their own memory mapped `.npy`
+    file, record i of all files belongs to the same image. The meta file is
+    written by `close()`, a cache without it was not finished.
+    """
+
+    def __init__(self, cache_dir, num_records, feature_shapes, label_shape,
+                 dtype="float16", info=None):
+        """
+        Args:
+          num_records: upper bound of the records, the dropped records of
+            the dataset leave the end of the files unused
+          feature_shapes: list of (layer_name, shape without the batch dimension)
+          label_shape: shape of the encoded labels of one image
+          dtype: storage type of the features, float16 halves the cache
+          info: dict stored in the meta file, e.g. the backbone checkpoint
+        """
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        if os.path.exists(os.path.join(cache_dir, META_FILE)):
+            os.remove(os.path.join(cache_dir, META_FILE))
+        self.cache_dir = cache_dir
+        self.feature_shapes = [(name, tuple(shape)) for name, shape in feature_shapes]
+        self.dtype = str(dtype)
+        self.info = info if info is not None else {}
+        self.features = [
+            open_memmap(os.path.join(cache_dir, name + ".npy"), mode="w+",
+                        dtype=self.dtype, shape=(num_records,) + shape)
+            for name, shape in self.feature_shapes]
+        self.labels = open_memmap(
+            os.path.join(cache_dir, LABELS_FILE), mode="w+",
+            dtype=np.float32, shape=(num_records,) + tuple(label_shape))
+        self.count = 0
+
+    def write(self, features, labels):
+        """
+        Args:
+          features: list of [batch, h, w, c] arrays in the order of `feature_shapes`
+          labels: 3-D array [batch, #boxes, #encode_length]
+        """
+        n = len(labels)
+        for memmap, value in zip(self.features, features):
+            memmap[self.count:self.count + n] = value
+        self.labels[self.count:self.count + n] = labels
+        self.count += n
+
+    def close(self):
+        for memmap in self.features + [self.labels]:
+            memmap.flush()
+        meta = dict(self.info)
+        meta.update({
+            "num_records": self.count,
+            "layers": [name for name, _ in self.feature_shapes],
+            "shapes": [list(shape) for _, shape in self.feature_shapes],
+            "dtype": self.dtype
+        })
+        with open(os.path.join(self.cache_dir, META_FILE), "w") as writer:
+            json.dump(meta, writer, indent=2)
+
+
+def load_meta(cache_dir):
+    meta_path = os.path.join(cache_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        raise ValueError("the feature cache is missing or not finished",
+                         cache_dir)
+    with open(meta_path, "r") as f:
+        return json.load(f)
+
+
+class FeatureCacheDataSet(DataSet):
+    """Batches of cached backbone features for training the predictor heads
+
+    batch() returns the feature maps in the order of `layer_names` followed by
+    the encoded labels. The records are read in a new random order every
+    epoch, the features are converted to float32 by the solver.
+    """
+
+    def __init__(self, common_params, dataset_params):
+        super(FeatureCacheDataSet, self).__init__(common_params, dataset_params)
+
+        self.batch_size = int(common_params['batch_size'])
+        self.cache_dir = str(dataset_params['feature_cache_dir'])
+        seed = dataset_params.get('seed', None)
+
+        self.meta = load_meta(self.cache_dir)
+        self.layer_names = list(self.meta["layers"])
+        self.feature_shapes = [tuple(shape) for shape in self.meta["shapes"]]
+        self.record_number = int(self.meta["num_records"])
+        if self.record_number < self.batch_size:
+            raise ValueError("the feature cache has less records than a batch",
+                             self.record_number)
+
+        self.features = [
+            np.load(os.path.join(self.cache_dir, name + ".npy"), mmap_mode="r")
+            for name in self.layer_names]
+        self.labels = np.load(os.path.join(self.cache_dir, LABELS_FILE),
+                              mmap_mode="r")
+
+        self.num_batch_per_epoch = int(self.record_number / self.batch_size)
+        self.random = np.random.RandomState(
+            None if seed is None else int(seed))
+        self.order = self.random.permutation(self.record_number)
+        self.record_point = 0
+
+    def batch(self):
+        """get batch
+        Returns:
+          features: 4-D ndarrays [batch_size, h, w, c], one per layer
+          labels: (batch_size, #boxes, #encode_length)
+        """
+        if self.record_point + self.batch_size > self.record_number:
+            self.order = self.random.permutation(self.record_number)
+            self.record_point = 0
+        indices = self.order[self.record_point:self.record_point + self.batch_size]
+        self.record_point += self.batch_size
+        # 排序后按文件顺序读取memmap
+        indices = np.sort(indices)
+        batch = [np.asarray(feature[indices]) for feature in self.features]
+        batch.append(np.asarray(self.labels[indices]))
+        return batch
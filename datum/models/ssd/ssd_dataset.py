@@ -20,6 +20,151 @@ from datum.meta.dataset import DataSet
 from datum.models.ssd.box_encoder import BoxEncoder
 
 
+def load_records(data_path, box_output_format, is_need_bg):
+    """Records of a text index file
+    text file format:
+    image_path xmin1 ymin1 xmax1 ymax1 class1 xmin2 ymin2 xmax2 ymax2 class2
+    """
+    record_list = []
+    with open(data_path, 'r') as input_file:
+        for line in input_file:
+            line = line.strip()
+            ss = line.split(' ')
+            ss[1:] = [float(num) for num in ss[1:]]
+            # 文件中存储的类别都是从0开始的，如果需要在处理前添加background这个类别
+            # 需要将background这个设置为0，其他的类别编号自动+1
+            if is_need_bg:
+                step_len = len(box_output_format)
+                start_class_idx = box_output_format.index("class_id") + 1
+                for i in range(start_class_idx, len(ss), step_len):
+                    ss[i] += 1
+            record_list.append(ss)
+    return record_list
+
+
+def process_record(record, width, height, lower_resize_rate, upper_resize_rate):
+    """对于每个样本的数据具体该如何处理
+    Args: record --> [image_path, xmin, ymin, xmax, ymax, class_id]
+    Returns:
+      image: 3-D ndarray
+      labels: 2-D list [[xmin, ymin, xmax, ymax, class_id]]
+    """
+    image = cv2.imread(record[0])
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    h = image.shape[0]
+    w = image.shape[1]
+
+    real_rate = w / h
+    target_rate = width / height
+
+    if (target_rate - lower_resize_rate
+            <= real_rate <= target_rate + upper_resize_rate):
+        width_rate = width * 1.0 / w
+        height_rate = height * 1.0 / h
+
+        image = cv2.resize(image, (height, width))
+        labels = []
+        i = 1
+        while i < len(record):
+            xmin = record[i]
+            ymin = record[i + 1]
+            xmax = record[i + 2]
+            ymax = record[i + 3]
+            class_id = record[i + 4]
+            labels.append([xmin * width_rate, ymin * height_rate,
+                           xmax * width_rate, ymax * height_rate,
+                           class_id])
+            i += 5
+        return [image, labels]
+    elif real_rate > target_rate + upper_resize_rate:
+        # 当前的图像不满足直接resize的比例，需要按照最短边进行一定比例进行裁减
+        h0 = h
+        w0 = np.ceil(h0 * (target_rate + upper_resize_rate)).astype(np.int32)
+        # we should crop from (0, 0)
+        image = image[:, 0:w0]
+        image = cv2.resize(image, (height, width))
+        width_rate = width * 1.0 / w0
+        height_rate = height * 1.0 / h0
+
+        # 处理原始目标区域在裁减之后的图像中的实际位置
+        labels = []
+        i = 1
+        while i < len(record):
+            xmin = record[i]
+            ymin = record[i + 1]
+            xmax = record[i + 2]
+            ymax = record[i + 3]
+            class_id = record[i + 4]
+            if xmin < w0 - 1 and xmax <= w0 - 1:
+                labels.append([xmin * width_rate, ymin * height_rate,
+                               xmax * width_rate, ymax * height_rate,
+                               class_id])
+            elif xmin < w0 - 1 and xmax > w0 - 1:
+                if (w0 - 1 - xmin) / (xmax - xmin) >= 0.6:
+                    labels.append([xmin * width_rate, ymin * height_rate,
+                                   w0-1, ymax * height_rate,
+                                   class_id])
+                else:
+                    pass
+            else:
+                pass
+            i += 5
+        # 若没有目标符合变换要求，就将这个数据丢弃
+        if len(labels) != 0:
+            return [image, labels]
+        else:
+            return None
+    elif real_rate < target_rate - lower_resize_rate:
+        w0 = w
+        h0 = np.ceil(w0 / (target_rate - lower_resize_rate)).astype(np.int32)
+        # we should crop from (0, 0)
+        image = image[0:h0, :]
+        image = cv2.resize(image, (height, width))
+        width_rate = width * 1.0 / w0
+        height_rate = height * 1.0 / h0
+
+        # 处理原始目标区域在裁减之后的图像中的实际位置
+        labels = []
+        i = 1
+        while i < len(record):
+            xmin = record[i]
+            ymin = record[i + 1]
+            xmax = record[i + 2]
+            ymax = record[i + 3]
+            class_id = record[i + 4]
+            if ymin < h0 - 1 and ymax <= h0 - 1:
+                labels.append([xmin * width_rate, ymin * height_rate,
+                               xmax * width_rate, ymax * height_rate,
+                               class_id])
+            elif ymin < h0 - 1 < ymax:
+                if (h0 - 1 - ymin) / (ymax - ymin) >= 0.6:
+                    labels.append([xmin * width_rate, ymin * height_rate,
+                                   xmax * width_rate, h0 - 1,
+                                   class_id])
+                else:
+                    pass
+            else:
+                pass
+            i += 5
+        # 若没有目标符合变换要求，就将这个数据丢弃
+        if len(labels) != 0:
+            return [image, labels]
+        else:
+            return None
+    else:
+        pass
+
+
+def encode_labels(box_encoder, gt_labels):
+    """gt_labels [[xmin, ymin, xmax, ymax, class_id]] --> (1, #boxes, #classes + 4)"""
+    # 在归整完数据之后，要对object_label中使用BoxEncoder的调用
+    # gt_labels from
+    # [xmin, ymin, xmax, ymax] --> [xmin, xmax, ymin, ymax]
+    for cell in gt_labels:
+        cell[1], cell[2] = cell[2], cell[1]
+    return box_encoder.encode_y_sample(gt_labels)
+
+
 class SSDDataSet(DataSet):
     """TextDataSet
     process text input file dataset
@@ -45,6 +190,11 @@ class SSDDataSet(DataSet):
 
         self.upper_resize_rate = float(dataset_params["upper_resize_rate"])
         self.lower_resize_rate = float(dataset_params["lower_resize_rate"])
+        # 多个副本并行训练时，每个副本只读取自己的那一份数据
+        self.num_shards = int(dataset_params.get("num_shards", 1))
+        self.shard_index = int(dataset_params.get("shard_index", 0))
+        if not 0 <= self.shard_index < self.num_shards:
+            raise ValueError("`shard_index` must be in [0, num_shards).")
 
         self.box_encoder = BoxEncoder(common_params, box_encoder_params)
 
@@ -52,30 +202,24 @@ class SSDDataSet(DataSet):
         self.record_queue = Queue(maxsize=10000)
         self.image_label_queue = Queue(maxsize=2000)
 
-        self.record_list = []
-
         # filling the record_list
-        input_file = open(self.data_path, 'r')
-
-        for line in input_file:
-            line = line.strip()
-            ss = line.split(' ')
-            ss[1:] = [float(num) for num in ss[1:]]
-            # 文件中存储的类别都是从0开始的，如果需要在处理前添加background这个类别
-            # 需要将background这个设置为0，其他的类别编号自动+1
-            if self.is_need_bg:
-                self.classes.insert(0, "background")
-                step_len = len(self.box_output_format)
-                start_class_idx = self.box_output_format.index("class_id") + 1
-                for i in range(start_class_idx, len(ss), step_len):
-                    ss[i] += 1
-            self.record_list.append(ss)
+        self.record_list = load_records(
+            self.data_path, self.box_output_format, self.is_need_bg)
+        if self.is_need_bg:
+            self.classes.insert(0, "background")
+        # the shard is taken before shuffling, so the shards stay disjoint
+        self.record_list = self.record_list[self.shard_index::self.num_shards]
 
         self.record_point = 0
         self.record_number = len(self.record_list)
 
         self.num_batch_per_epoch = int(self.record_number / self.batch_size)
 
+        # thread_num为0时只解析样本列表，由调用者顺序调用encode_record
+        # (例如构建backbone特征缓存时)
+        if self.thread_num == 0:
+            return
+
         t_record_producer = Thread(target=self.record_producer)
         t_record_producer.daemon = True
         t_record_producer.start()
@@ -96,136 +240,39 @@ class SSDDataSet(DataSet):
     def record_customer(self):
         while True:
             item = self.record_queue.get()
-            out = self.record_process(item)
+            out = self.encode_record(item)
             if out is not None:
-                # 在归整完数据之后，要对object_label中使用BoxEncoder的调用
-                image, gt_labels = out[:]
-                # gt_labels from
-                # [xmin, ymin, xmax, ymax] --> [xmin, xmax, ymin, ymax]
-                # print(gt_labels)
-                for cell in gt_labels:
-                    cell[1], cell[2] = cell[2], cell[1]
-                # print(gt_labels)
-                y_true_encoded = self.box_encoder.encode_y_sample(gt_labels)
-                self.image_label_queue.put([image, y_true_encoded])
+                self.image_label_queue.put(out)
+
+    def encode_record(self, record):
+        """Image and encoded labels of one record, None if it is dropped
 
-    def record_process(self, record):
-        """对于每个样本的数据具体该如何处理
-        Args: record --> [image_path, xmin, ymin, xmax, ymax, class_id]
         Returns:
-          image: 3-D ndarray
-          labels: 2-D list [[xmin, ymin, xmax, ymax, class_id]]
+          image: 3-D ndarray, uint8
+          y_true_encoded: (1, #boxes, #classes + 4), the compact layout of
+            `BoxEncoder.encode_y_sample` without the anchor columns
         """
-        image = cv2.imread(record[0])
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        h = image.shape[0]
-        w = image.shape[1]
-
-        real_rate = w / h
-        target_rate = self.width / self.height
-
-        if (target_rate - self.lower_resize_rate
-                <= real_rate <= target_rate + self.upper_resize_rate):
-            width_rate = self.width * 1.0 / w
-            height_rate = self.height * 1.0 / h
-
-            image = cv2.resize(image, (self.height, self.width))
-            labels = []
-            i = 1
-            while i < len(record):
-                xmin = record[i]
-                ymin = record[i + 1]
-                xmax = record[i + 2]
-                ymax = record[i + 3]
-                class_id = record[i + 4]
-                labels.append([xmin * width_rate, ymin * height_rate,
-                               xmax * width_rate, ymax * height_rate,
-                               class_id])
-                i += 5
-            return [image, labels]
-        elif real_rate > target_rate + self.upper_resize_rate:
-            # 当前的图像不满足直接resize的比例，需要按照最短边进行一定比例进行裁减
-            h0 = h
-            w0 = np.ceil(h0 * (target_rate + self.upper_resize_rate)).astype(np.int32)
-            # we should crop from (0, 0)
-            image = image[:, 0:w0]
-            image = cv2.resize(image, (self.height, self.width))
-            width_rate = self.width * 1.0 / w0
-            height_rate = self.height * 1.0 / h0
-
-            # 处理原始目标区域在裁减之后的图像中的实际位置
-            labels = []
-            i = 1
-            while i < len(record):
-                xmin = record[i]
-                ymin = record[i + 1]
-                xmax = record[i + 2]
-                ymax = record[i + 3]
-                class_id = record[i + 4]
-                if xmin < w0 - 1 and xmax <= w0 - 1:
-                    labels.append([xmin * width_rate, ymin * height_rate,
-                                   xmax * width_rate, ymax * height_rate,
-                                   class_id])
-                elif xmin < w0 - 1 and xmax > w0 - 1:
-                    if (w0 - 1 - xmin) / (xmax - xmin) >= 0.6:
-                        labels.append([xmin * width_rate, ymin * height_rate,
-                                       w0-1, ymax * height_rate,
-                                       class_id])
-                    else:
-                        pass
-                else:
-                    pass
-                i += 5
-            # 若没有目标符合变换要求，就将这个数据丢弃
-            if len(labels) != 0:
-                return [image, labels]
-            else:
-                return None
-        elif real_rate < target_rate - self.lower_resize_rate:
-            w0 = w
-            h0 = np.ceil(w0 / (target_rate - self.lower_resize_rate)).astype(np.int32)
-            # we should crop from (0, 0)
-            image = image[0:h0, :]
-            image = cv2.resize(image, (self.height, self.width))
-            width_rate = self.width * 1.0 / w0
-            height_rate = self.height * 1.0 / h0
-
-            # 处理原始目标区域在裁减之后的图像中的实际位置
-            labels = []
-            i = 1
-            while i < len(record):
-                xmin = record[i]
-                ymin = record[i + 1]
-                xmax = record[i + 2]
-                ymax = record[i + 3]
-                class_id = record[i + 4]
-                if ymin < h0 - 1 and ymax <= h0 - 1:
-                    labels.append([xmin * width_rate, ymin * height_rate,
-                                   xmax * width_rate, ymax * height_rate,
-                                   class_id])
-                elif ymin < h0 - 1 < ymax:
-                    if (h0 - 1 - ymin) / (ymax - ymin) >= 0.6:
-                        labels.append([xmin * width_rate, ymin * height_rate,
-                                       xmax * width_rate, h0 - 1,
-                                       class_id])
-                    else:
-                        pass
-                else:
-                    pass
-                i += 5
-            # 若没有目标符合变换要求，就将这个数据丢弃
-            if len(labels) != 0:
-                return [image, labels]
-            else:
-                return None
-        else:
-            pass
+        out = self.record_process(record)
+        if out is None:
+            return None
+        image, gt_labels = out[:]
+        return [image, encode_labels(self.box_encoder, gt_labels)]
+
+    @staticmethod
+    def normalize(images):
+        """uint8 images --> float32 in [-1, 1]"""
+        images = np.asarray(images, dtype=np.float32)
+        return images / 255 * 2 - 1
+
+    def record_process(self, record):
+        return process_record(record, self.width, self.height,
+                              self.lower_resize_rate, self.upper_resize_rate)
 
     def batch(self):
         """get batch
         Returns:
           images: 4-D ndarray [batch_size, height, width, 3]
-          labels: (batch_size, #boxes, #classes + 4 + 4 + 4)
+          labels: (batch_size, #boxes, #classes + 4)
         """
         images = []
         labels = []
@@ -233,8 +280,7 @@ class SSDDataSet(DataSet):
             image, label = self.image_label_queue.get()
             images.append(image)
             labels.append(label)
-        images = np.asarray(images, dtype=np.float32)
-        images = images / 255 * 2 - 1
+        images = self.normalize(images)
         labels = np.concatenate(labels, axis=0)
         # labels = np.asarray(labels, dtype=np.float32)
         return images, labels
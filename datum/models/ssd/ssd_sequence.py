@@ -0,0 +1,128 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/7
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+import numpy as np
+from keras.utils import Sequence
+
+from datum.models.ssd.box_encoder import BoxEncoder
+from datum.models.ssd.ssd_dataset import load_records, process_record
+from datum.models.ssd.ssd_dataset import encode_labels
+
+
+class SSDSequence(Sequence):
+    """Batches of a text index for `fit_generator` of the keras SSD models
+
+    Batch i of an epoch only depends on i and the epoch, so the batches can be
+    read and encoded in any order by several worker processes
+    (`workers > 1, use_multiprocessing=True`). The records are permuted with
+    `seed + epoch` at every epoch.
+    The images are float32 in [0, 255], the keras models normalize them.
+    """
+
+    def __init__(self, common_params, dataset_params, box_encoder_params,
+                 shuffle=True, append_anchors=True, data_path=None):
+        """
+        Args:
+          append_anchors: append the 8 anchor columns to the labels, the
+            keras models carry the anchors in their output
+            (`Loss(n_anchor_columns=8)`)
+          data_path: index file instead of `path`, e.g. the validation index
+        """
+        if not isinstance(common_params, dict):
+            raise TypeError("common_params must be dict")
+        if not isinstance(dataset_params, dict):
+            raise TypeError("dataset_params must be dict")
+
+        self.width = int(common_params['image_width'])
+        self.height = int(common_params['image_height'])
+        self.batch_size = int(common_params['batch_size'])
+
+        self.data_path = str(data_path or dataset_params['path'])
+        box_output_format = json.loads(dataset_params["box_output_format"])
+        is_need_bg = True if dataset_params["is_need_bg"] == "True" else False
+        self.upper_resize_rate = float(dataset_params["upper_resize_rate"])
+        self.lower_resize_rate = float(dataset_params["lower_resize_rate"])
+        self.seed = int(dataset_params.get("seed", 0))
+
+        self.shuffle = shuffle
+        self.append_anchors = append_anchors
+        self.box_encoder = BoxEncoder(common_params, box_encoder_params)
+        self.record_list = load_records(self.data_path, box_output_format,
+                                        is_need_bg)
+        self.record_number = len(self.record_list)
+        if self.record_number == 0:
+            raise ValueError("no records in the index", self.data_path)
+
+        self.epoch = 0
+        self._order = None
+
+    def __len__(self):
+        return int(np.ceil(self.record_number / self.batch_size))
+
+    def order(self):
+        """The record order of the current epoch"""
+        if self._order is None or self._order[0] != self.epoch:
+            if self.shuffle:
+                order = np.random.RandomState(
+                    self.seed + self.epoch).permutation(self.record_number)
+            else:
+                order = np.arange(self.record_number)
+            self._order = (self.epoch, order)
+        return self._order[1]
+
+    def encode_record(self, record):
+        out = process_record(record, self.width, self.height,
+                             self.lower_resize_rate, self.upper_resize_rate)
+        if out is None:
+            return None
+        image, gt_labels = out[:]
+        return image, encode_labels(self.box_encoder, gt_labels)[0]
+
+    def __getitem__(self, idx):
+        """
+        Returns:
+          images: 4-D ndarray [batch, height, width, 3]
+          labels: (batch, #boxes, #classes + 4 (+ 8 with append_anchors))
+        The records dropped by the resize rule make the batch smaller, an
+        empty batch takes the next usable record of the epoch order.
+        """
+        order = self.order()
+        start = idx * self.batch_size
+        images = []
+        labels = []
+        for i in order[start:start + self.batch_size]:
+            out = self.encode_record(self.record_list[i])
+            if out is not None:
+                images.append(out[0])
+                labels.append(out[1])
+        position = start + self.batch_size
+        while not images and position < start + self.record_number:
+            out = self.encode_record(
+                self.record_list[order[position % self.record_number]])
+            if out is not None:
+                images.append(out[0])
+                labels.append(out[1])
+            position += 1
+        if not images:
+            raise ValueError("no record of the index fits the resize rates",
+                             self.data_path)
+
+        images = np.asarray(images, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.float32)
+        if self.append_anchors:
+            anchors = np.broadcast_to(self.box_encoder.anchors,
+                                      (len(labels),) + self.box_encoder.anchors.shape)
+            labels = np.concatenate([labels, anchors], axis=2)
+        return images, labels
+
+    def on_epoch_end(self):
+        self.epoch += 1
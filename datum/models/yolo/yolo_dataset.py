@@ -15,6 +15,7 @@ from queue import Queue
 from threading import Thread
 
 from datum.meta.dataset import DataSet
+from datum.models.yolo.yolo_targets import encode_targets
 
 
 class YoloDataSet(DataSet):
@@ -35,6 +36,16 @@ class YoloDataSet(DataSet):
         self.thread_num = int(dataset_params['thread_num'])
         self.max_objects = int(common_params['max_objects_per_image'])
 
+        # 在读取线程中预先计算每个cell的训练目标（可选，默认关闭）
+        self.precompute_targets = True if dataset_params.get(
+            "precompute_targets", "False") == "True" else False
+        if self.precompute_targets:
+            if "cell_size" not in dataset_params:
+                raise ValueError(
+                    "precompute_targets needs the cell_size of the net")
+            self.cell_size = int(dataset_params["cell_size"])
+            self.num_classes = int(common_params["num_classes"])
+
         # record and image_label queue
         self.record_queue = Queue(maxsize=10000)
         self.image_label_queue = Queue(maxsize=5000)
@@ -87,6 +98,8 @@ class YoloDataSet(DataSet):
         Returns:
           image: 3-D ndarray
           labels: 2-D list [self.max_objects, 5] (xcenter, ycenter, w, h, class_num)
+            or with precompute_targets the 3-D ndarray
+            [cell_size, cell_size, 6 + num_classes] of `encode_targets`
           object_num:  total object number  int
         """
         image = cv2.imread(record[0])
@@ -120,6 +133,9 @@ class YoloDataSet(DataSet):
             i += 5
             if object_num >= self.max_objects:
                 break
+        if self.precompute_targets:
+            labels = encode_targets(labels, object_num, self.width,
+                                    self.cell_size, self.num_classes)
         return [image, labels, object_num]
 
     def batch(self):
@@ -127,6 +143,8 @@ class YoloDataSet(DataSet):
         Returns:
           images: 4-D ndarray [batch_size, height, width, 3]
           labels: 3-D ndarray [batch_size, max_objects, 5]
+            or with precompute_targets the targets
+            4-D ndarray [batch_size, cell_size, cell_size, 6 + num_classes]
           objects_num: 1-D ndarray [batch_size]
         """
         images = []
@@ -0,0 +1,66 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/12
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+# 每个cell的目标向量: response, objects, x, y, w, h, classes
+RESPONSE = 0
+OBJECTS = 1
+BOXES = 2
+CLASSES = 6
+
+
+def target_depth(num_classes):
+    return CLASSES + num_classes
+
+
+def encode_targets(labels, object_num, image_size, cell_size, num_classes):
+    """Dense per-cell targets of one image for `Net.target_loss`
+
+    The same masks `Net.batch_loss` builds in the graph for every object,
+    merged over the objects of the image:
+      response: 1 for the cell that contains the center of an object
+      objects: the number of objects whose box overlaps the cell
+      x, y, w, h: the box of the object the cell is responsible for
+      classes: sum of the one-hot classes of the objects overlapping the cell
+    When the centers of several objects fall into the same cell, the later
+    object of the labels is kept.
+    Args:
+      labels: 2-D list [max_objects, 5] (xcenter, ycenter, w, h, class_num)
+      object_num: the number of valid labels
+    Returns:
+      targets: 3-D ndarray [cell_size, cell_size, 6 + num_classes]
+    """
+    targets = np.zeros((cell_size, cell_size, target_depth(num_classes)),
+                       dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.float32)[:object_num]
+    if len(labels) == 0:
+        return targets
+    cell_width = image_size / cell_size
+    x, y, w, h = labels[:, 0], labels[:, 1], labels[:, 2], labels[:, 3]
+    grid = np.arange(cell_size, dtype=np.float32)
+
+    # cells overlapped by the boxes [object_num, cell_size(y), cell_size(x)]
+    in_x = (grid >= np.floor((x - w / 2) / cell_width)[:, None]) & \
+           (grid < np.ceil((x + w / 2) / cell_width)[:, None])
+    in_y = (grid >= np.floor((y - h / 2) / cell_width)[:, None]) & \
+           (grid < np.ceil((y + h / 2) / cell_width)[:, None])
+    objects = (in_y[:, :, None] & in_x[:, None, :]).astype(np.float32)
+    targets[..., OBJECTS] = objects.sum(axis=0)
+    one_hot = np.eye(num_classes, dtype=np.float32)[labels[:, 4].astype(np.int32)]
+    targets[..., CLASSES:] = np.tensordot(objects, one_hot, axes=(0, 0))
+
+    # responsible cells, the later object wins the assignment of a cell
+    col = np.floor(x / cell_width).astype(np.int32)
+    row = np.floor(y / cell_width).astype(np.int32)
+    inside = (col >= 0) & (col < cell_size) & (row >= 0) & (row < cell_size)
+    targets[row[inside], col[inside], RESPONSE] = 1
+    targets[row[inside], col[inside], BOXES:CLASSES] = labels[inside, 0:4]
+    return targets
@@ -0,0 +1,263 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+
+import numpy as np
+
+
+def load_index(index_path, is_need_bg=True):
+    """Read the ground truth of a text index file
+
+    text file format:
+    image_path xmin1 ymin1 xmax1 ymax1 class1 xmin2 ymin2 xmax2 ymax2 class2
+    Args:
+      is_need_bg: the classes in the file start at 0, shift them by one so
+        they match the class ids of the decoded predictions
+    Returns:
+      list of (image_path, 2-D array [[xmin, ymin, xmax, ymax, class_id]])
+    """
+    records = []
+    with open(index_path, 'r') as f:
+        for line in f:
+            ss = line.strip().split(' ')
+            if not ss[0]:
+                continue
+            boxes = np.array([float(num) for num in ss[1:]],
+                             dtype=np.float32).reshape(-1, 5)
+            if is_need_bg:
+                boxes[:, 4] += 1
+            records.append((ss[0], boxes))
+    return records
+
+
+class _GrowingArray(object):
+    """Append only numpy buffer, the capacity doubles when it is full"""
+
+    def __init__(self, width, dtype):
+        self.data = np.empty((64, width), dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        end = self.size + len(values)
+        if end > len(self.data):
+            capacity = max(end, 2 * len(self.data))
+            data = np.empty((capacity, self.data.shape[1]), dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+        self.data[self.size:end] = values
+        self.size = end
+
+    def values(self):
+        return self.data[:self.size]
+
+
+def iou_matrix(boxes1, boxes2):
+    """IoU of every pair of boxes in [xmin, ymin, xmax, ymax]
+
+    Returns:
+      2-D array [len(boxes1), len(boxes2)]
+    """
+    ixmin = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    iymin = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    ixmax = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+    iymax = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+    intersection = (np.maximum(ixmax - ixmin, 0) *
+                    np.maximum(iymax - iymin, 0))
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    union = area1[:, None] + area2[None, :] - intersection
+    return intersection / np.maximum(union, 1e-10)
+
+
+def average_precision(recall, precision, use_07_metric=False):
+    """VOC average precision of one class
+
+    Args:
+      use_07_metric: the 11 point interpolation of VOC2007, otherwise the
+        area under the interpolated curve (VOC2010+)
+    """
+    if use_07_metric:
+        ap = 0.0
+        for t in np.arange(0.0, 1.1, 0.1):
+            p = precision[recall >= t]
+            ap += (p.max() if len(p) else 0.0) / 11.0
+        return ap
+
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([0.0], precision, [0.0]))
+    # make the precision monotonically decreasing
+    mpre = np.maximum.accumulate(mpre[::-1])[::-1]
+    i = np.where(mrec[1:] != mrec[:-1])[0]
+    return np.sum((mrec[i + 1] - mrec[i]) * mpre[i + 1])
+
+
+class DetectionEvaluator(object):
+    """Streaming VOC/COCO style mean average precision
+
+    `update()` is called image by image, the detections of every class are
+    matched greedily in score order against the ground truth of that image
+    and only the scores and the match flags are kept, so memory and
+    the final `compute()` only depend on the number of detections.
+
+    With several `iou_thresholds` (e.g. np.arange(0.5, 1.0, 0.05) for COCO)
+    the matching is done for every threshold in the same pass.
+    """
+
+    def __init__(self, num_classes, iou_thresholds=(0.5,), use_07_metric=False,
+                 class_offset=1):
+        """
+        Args:
+          num_classes: number of object classes, without background
+          class_offset: id of the first object class, 1 if the decoded
+            class ids include the background class 0
+        """
+        self.num_classes = num_classes
+        self.iou_thresholds = np.asarray(iou_thresholds, dtype=np.float32)
+        self.use_07_metric = use_07_metric
+        self.class_offset = class_offset
+        self.reset()
+
+    def reset(self):
+        num_thresholds = len(self.iou_thresholds)
+        # per class: [score, flag for every iou threshold], the flag is 1 for
+        # a true positive, 0 for a false positive and -1 for an ignored match
+        self.matches = [_GrowingArray(1 + num_thresholds, np.float32)
+                        for _ in range(self.num_classes)]
+        self.num_gt = np.zeros(self.num_classes, dtype=np.int64)
+        self.num_images = 0
+
+    def update(self, detections, ground_truth, difficult=None):
+        """Add the results of one image
+
+        Args:
+          detections: 2-D array [k, 6] as returned by `decode_y2`
+            `[class_id, confidence, xmin, xmax, ymin, ymax]`
+          ground_truth: 2-D array [m, 5] `[xmin, ymin, xmax, ymax, class_id]`
+          difficult: optional bool array [m], these boxes are neither counted
+            nor turn a matching detection into a false positive
+        """
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+        ground_truth = np.asarray(ground_truth, dtype=np.float32).reshape(-1, 5)
+        if difficult is None:
+            difficult = np.zeros(len(ground_truth), dtype=np.bool_)
+        else:
+            difficult = np.asarray(difficult, dtype=np.bool_)
+        self.num_images += 1
+
+        det_classes = detections[:, 0].astype(np.int64) - self.class_offset
+        det_boxes = detections[:, [2, 4, 3, 5]]
+        gt_classes = ground_truth[:, 4].astype(np.int64) - self.class_offset
+        valid = (~difficult) & (gt_classes >= 0) & (gt_classes < self.num_classes)
+        np.add.at(self.num_gt, gt_classes[valid], 1)
+
+        for c in np.unique(det_classes):
+            if c < 0 or c >= self.num_classes:
+                continue
+            dets = np.where(det_classes == c)[0]
+            dets = dets[np.argsort(-detections[dets, 1], kind="mergesort")]
+            gts = np.where(gt_classes == c)[0]
+
+            records = np.zeros((len(dets), 1 + len(self.iou_thresholds)),
+                               dtype=np.float32)
+            records[:, 0] = detections[dets, 1]
+            if len(gts):
+                ious = iou_matrix(det_boxes[dets], ground_truth[gts, :4])
+                best_gt = np.argmax(ious, axis=1)
+                best_iou = ious[np.arange(len(dets)), best_gt]
+                gt_difficult = difficult[gts]
+                for t, threshold in enumerate(self.iou_thresholds):
+                    taken = np.zeros(len(gts), dtype=np.bool_)
+                    for d in np.where(best_iou >= threshold)[0]:
+                        g = best_gt[d]
+                        if gt_difficult[g]:
+                            # neither true nor false positive (VOC)
+                            records[d, 1 + t] = -1
+                        elif not taken[g]:
+                            taken[g] = True
+                            records[d, 1 + t] = 1
+            self.matches[c].extend(records)
+
+    def compute(self):
+        """
+        Returns:
+          dict with per class `ap` [num_classes, num_thresholds], `map` per
+          iou threshold and the overall `mAP` over classes and thresholds
+        """
+        aps = np.zeros((self.num_classes, len(self.iou_thresholds)))
+        for c in range(self.num_classes):
+            if self.num_gt[c] == 0:
+                continue
+            records = self.matches[c].values()
+            order = np.argsort(-records[:, 0], kind="mergesort")
+            flags = records[order, 1:]
+            tp = np.cumsum(flags == 1, axis=0)
+            fp = np.cumsum(flags == 0, axis=0)
+            recall = tp / self.num_gt[c]
+            precision = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
+            for t in range(len(self.iou_thresholds)):
+                aps[c, t] = average_precision(
+                    recall[:, t], precision[:, t], self.use_07_metric)
+
+        valid = self.num_gt > 0
+        map_per_threshold = (aps[valid].mean(axis=0) if valid.any()
+                             else np.zeros(len(self.iou_thresholds)))
+        return {
+            "ap": aps,
+            "map": map_per_threshold,
+            "mAP": float(map_per_threshold.mean()),
+            "num_gt": self.num_gt.copy(),
+            "num_images": self.num_images
+        }
+
+
+def _evaluate_forever(evaluator, inputs, outputs):
+    while True:
+        item = inputs.get()
+        if item is None:
+            outputs.put(evaluator.compute())
+            evaluator.reset()
+            continue
+        if item == "stop":
+            break
+        evaluator.update(*item)
+
+
+class BackgroundEvaluator(object):
+    """Run a DetectionEvaluator in another process
+
+    The training loop only puts the decoded detections into a queue, the
+    matching runs in parallel. `result()` waits for the queued images and
+    starts a new evaluation round.
+    """
+
+    def __init__(self, num_classes, iou_thresholds=(0.5,), use_07_metric=False,
+                 class_offset=1):
+        evaluator = DetectionEvaluator(num_classes, iou_thresholds,
+                                       use_07_metric, class_offset)
+        self.inputs = multiprocessing.Queue(maxsize=1000)
+        self.outputs = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=_evaluate_forever,
+            args=(evaluator, self.inputs, self.outputs))
+        self.process.daemon = True
+        self.process.start()
+
+    def update(self, detections, ground_truth, difficult=None):
+        self.inputs.put((np.asarray(detections), np.asarray(ground_truth),
+                         difficult))
+
+    def result(self):
+        self.inputs.put(None)
+        return self.outputs.get()
+
+    def close(self):
+        self.inputs.put("stop")
+        self.process.join()
@@ -0,0 +1,247 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import cv2
+import numpy as np
+
+from datum.utils.tools import fetch_xml_format
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif")
+
+
+def list_inputs(path):
+    """Image paths of a directory (recursive) or of a dataset index file
+
+    Returns:
+      (root, paths), the outputs mirror the paths relative to root
+    """
+    if os.path.isdir(path):
+        paths = []
+        for dir_path, _, file_names in os.walk(path):
+            for file_name in file_names:
+                if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(dir_path, file_name))
+        return path, sorted(paths)
+
+    # index file: image_path xmin1 ymin1 xmax1 ymax1 class1 ...
+    paths = []
+    with open(path, 'r') as f:
+        for line in f:
+            ss = line.strip().split(' ')
+            if ss[0]:
+                paths.append(ss[0])
+    root = os.path.commonpath([os.path.dirname(p) for p in paths]) \
+        if paths else ""
+    return root, paths
+
+
+class ProgressLog(object):
+    """Append only log of the finished images, a restarted run skips them
+
+    Every line is `image_path<TAB>status`, status is "done" after the output
+    file is written or "failed" for an image that can not be read. Lines
+    without a status are done images of older logs.
+    """
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        # image_path -> status
+        self.finished = {}
+        if os.path.exists(log_path):
+            with open(log_path, 'r') as f:
+                for line in f:
+                    image_path, _, status = line.rstrip("\n").partition("\t")
+                    self.finished[image_path] = status or "done"
+        self.lock = threading.Lock()
+        self.writer = open(log_path, 'a')
+
+    def done(self, image_path, status="done"):
+        with self.lock:
+            self.writer.write("%s\t%s\n" % (image_path, status))
+            self.writer.flush()
+            self.finished[image_path] = status
+
+    def failed(self, image_path):
+        self.done(image_path, status="failed")
+
+    def close(self):
+        self.writer.close()
+
+
+class BatchRunner(object):
+    """Run a warm predictor over a large list of images
+
+    The images are read and preprocessed on a pool of decode threads, the
+    predictor works on full batches and the result files are written on a
+    pool of writer threads.
+    """
+
+    def __init__(self, predictor, output_dir, output_format="txt",
+                 num_workers=4, class_names=None, class_offset=0,
+                 dataset="EyeSight"):
+        """
+        Args:
+          output_format: txt (`class confidence xmin ymin xmax ymax` per line)
+            or voc (VOC xml as written by `fetch_xml_format`)
+          class_names: names of the object classes, class_id - class_offset
+            indexes them, the class id is written without names
+        """
+        if output_format not in ("txt", "voc"):
+            raise ValueError("output_format must be txt or voc", output_format)
+        self.predictor = predictor
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.num_workers = num_workers
+        self.class_names = class_names
+        self.class_offset = class_offset
+        self.dataset = dataset
+        self.stats = {"images": 0, "skipped": 0, "failed": 0,
+                      "decode_wait": 0.0, "predict": 0.0}
+
+    def _load(self, image_path):
+        image = cv2.imread(image_path)
+        if image is None:
+            return image_path, None, None
+        return image_path, image.shape, self.predictor.preprocess(image)
+
+    def _class_name(self, class_id):
+        class_id = int(class_id)
+        if self.class_names is None:
+            return str(class_id)
+        return self.class_names[class_id - self.class_offset]
+
+    def output_path(self, root, image_path):
+        relative = os.path.relpath(image_path, root) if root else \
+            os.path.basename(image_path)
+        extension = ".txt" if self.output_format == "txt" else ".xml"
+        return os.path.join(self.output_dir,
+                            os.path.splitext(relative)[0] + extension)
+
+    def _write(self, output_path, image_path, shape, detections, progress):
+        """Write the detections of one image in pixel of the original image"""
+        detections = np.array(detections, dtype=np.float32).reshape(-1, 6)
+        detections[:, 2:4] *= shape[1] / self.predictor.width
+        detections[:, 4:6] *= shape[0] / self.predictor.height
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if self.output_format == "txt":
+            content = "".join(
+                "%s %.4f %d %d %d %d\n" % (self._class_name(class_id),
+                                           confidence, xmin, ymin, xmax, ymax)
+                for class_id, confidence, xmin, xmax, ymin, ymax in detections)
+        else:
+            anno_list = [[int(xmin), int(ymin), int(xmax), int(ymax),
+                          self._class_name(class_id)]
+                         for class_id, _, xmin, xmax, ymin, ymax in detections]
+            # fetch_xml_format只用到图像的shape，不需要分配整张图像
+            content = fetch_xml_format(np.broadcast_to(np.uint8(0), shape),
+                                       os.path.basename(image_path),
+                                       anno_list, self.dataset)
+        # 先写临时文件再改名，中断时不会留下写了一半的结果
+        with open(output_path + ".tmp", "w") as writer:
+            writer.write(content)
+        os.rename(output_path + ".tmp", output_path)
+        progress.done(image_path)
+
+    def run(self, input_path, progress_path=None, report_every=1000):
+        """
+        Args:
+          input_path: a directory of images or a dataset index file
+          progress_path: log of the finished images, defaults to
+            `output_dir/progress.log`
+        """
+        root, image_paths = list_inputs(input_path)
+        if progress_path is None:
+            progress_path = os.path.join(self.output_dir, "progress.log")
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        progress = ProgressLog(progress_path)
+        todo = [p for p in image_paths if p not in progress.finished]
+        self.stats["skipped"] = len(image_paths) - len(todo)
+        failed_before = sum(1 for status in progress.finished.values()
+                            if status == "failed")
+        print("%d images, %d finished before (%d failed), %d to do" % (
+            len(image_paths), self.stats["skipped"], failed_before, len(todo)))
+
+        decode_pool = ThreadPool(self.num_workers)
+        write_pool = ThreadPool(self.num_workers)
+        pending = []
+        start_time = time.time()
+        next_report = report_every
+        batch = []
+
+        def flush(batch):
+            predict_start = time.time()
+            inputs = np.stack([image for _, _, image in batch])
+            detections = self.predictor.decode(self.predictor.predict(inputs))
+            self.stats["predict"] += time.time() - predict_start
+            for (image_path, shape, _), dets in zip(batch, detections):
+                pending.append(write_pool.apply_async(
+                    self._write, (self.output_path(root, image_path),
+                                  image_path, shape, dets, progress)))
+            self.stats["images"] += len(batch)
+
+        try:
+            # 只预读有限张图片，几十万张图片时内存不会一直增长
+            read_ahead = 2 * self.predictor.batch_size + self.num_workers
+            loading = collections.deque()
+            todo = iter(todo)
+            while True:
+                while len(loading) < read_ahead:
+                    image_path = next(todo, None)
+                    if image_path is None:
+                        break
+                    loading.append(decode_pool.apply_async(
+                        self._load, (image_path,)))
+                if not loading:
+                    break
+                wait_start = time.time()
+                item = loading.popleft().get()
+                self.stats["decode_wait"] += time.time() - wait_start
+                if item[2] is None:
+                    self.stats["failed"] += 1
+                    print("can not read %s" % item[0])
+                    progress.failed(item[0])
+                    continue
+                batch.append(item)
+                if len(batch) == self.predictor.batch_size:
+                    flush(batch)
+                    batch = []
+                    # 写结果的任务不能无限堆积
+                    while len(pending) > 4 * self.predictor.batch_size:
+                        pending.pop(0).get()
+                    if report_every and self.stats["images"] >= next_report:
+                        print(self.report(time.time() - start_time))
+                        next_report += report_every
+            if batch:
+                flush(batch)
+            for result in pending:
+                result.get()
+        finally:
+            decode_pool.terminate()
+            write_pool.close()
+            write_pool.join()
+            progress.close()
+        print(self.report(time.time() - start_time))
+
+    def report(self, duration):
+        images = max(self.stats["images"], 1)
+        return ("%d images (%d skipped, %d failed), %.1f images/sec, "
+                "decode wait %.1f ms, predict %.1f ms per image" % (
+                    self.stats["images"], self.stats["skipped"],
+                    self.stats["failed"],
+                    self.stats["images"] / max(duration, 1e-6),
+                    self.stats["decode_wait"] * 1000 / images,
+                    self.stats["predict"] * 1000 / images))
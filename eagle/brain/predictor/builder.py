@@ -0,0 +1,56 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from datum.utils.process_config import process_config
+
+
+def build_predictor(model, conf_file):
+    """Build the warm predictor of a model from its configure file
+
+    Args:
+      model: ssd, yolo, yolo_tiny or yolo_u
+    """
+    if model == "ssd":
+        from eagle.brain.ssd.models.vgg import SSDVGG
+        from eagle.brain.ssd.models.vgg_dilated import SSDVGGDilated
+        from eagle.brain.predictor.ssd_predictor import SSDPredictor
+
+        common_params, dataset_params, net_params, solver_params, box_encoder_params = \
+            process_config(conf_file)
+        model_name = common_params.get("model_name", "VGG")
+        if model_name == "VGG":
+            net = SSDVGG(common_params, net_params, box_encoder_params)
+        elif model_name == "VGG-Dilated":
+            net = SSDVGGDilated(common_params, net_params, box_encoder_params)
+        else:
+            raise ValueError("model_name is not fitted !", model_name)
+        return SSDPredictor(
+            net, common_params, solver_params, box_encoder_params)
+
+    from eagle.brain.yolo.yolo_net import YoloNet
+    from eagle.brain.yolo.yolo_tiny_net import YoloTinyNet
+    from eagle.brain.yolo.yolo_u_net import YoloUNet
+    from eagle.brain.predictor.yolo_predictor import YoloPredictor, YoloUPredictor
+
+    common_params, dataset_params, net_params, solver_params = \
+        process_config(conf_file)
+    if model == "yolo":
+        return YoloPredictor(
+            YoloNet(common_params, net_params, test=True),
+            common_params, solver_params)
+    elif model == "yolo_tiny":
+        return YoloPredictor(
+            YoloTinyNet(common_params, net_params, test=True),
+            common_params, solver_params)
+    elif model == "yolo_u":
+        return YoloUPredictor(
+            YoloUNet(common_params, net_params, test=True),
+            common_params, solver_params)
+    raise ValueError("model is not fitted !", model)
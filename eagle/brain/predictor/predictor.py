@@ -0,0 +1,182 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+try:
+    from tensorflow.tools.graph_transforms import TransformGraph
+except ImportError:
+    TransformGraph = None
+
+
+INPUT_NAME = "images"
+OUTPUT_SCOPE = "outputs"
+
+
+class Predictor(object):
+    """Keep a frozen inference graph in a warm session
+
+    The trained graph is rebuilt without loss and optimizer, its variables are
+    converted to constants and the graph is folded once. After that every call
+    of `predict()` is a single `sess.run` on a reusable input buffer.
+    """
+    # outputs which do not depend on the input, e.g. the SSD anchors. They are
+    # fetched once after loading instead of on every call.
+    constant_outputs = ()
+
+    def __init__(self, net, common_params, solver_params):
+        if not isinstance(common_params, dict):
+            raise TypeError("common_params must be dict")
+        if not isinstance(solver_params, dict):
+            raise TypeError("solver_params must be dict")
+
+        # process params
+        self.width = int(common_params['image_size'])
+        self.height = int(common_params['image_size'])
+        self.batch_size = int(common_params['batch_size'])
+        self.pretrain_path = str(solver_params['pretrain_model_path'])
+        self.frozen_graph_path = str(
+            solver_params.get('frozen_graph_path', "None"))
+
+        self.net = net
+
+        if self.frozen_graph_path != "None":
+            graph_def = self.load_graph(self.frozen_graph_path)
+        else:
+            graph_def = self.freeze()
+        self.graph_def = graph_def
+        self._create_session(graph_def)
+
+    def inference(self, images):
+        """Build the inference graph of the net
+
+        Returns:
+          outputs: dict of name to output tensor
+        """
+        predicts = self.net.inference(images)
+        if not isinstance(predicts, dict):
+            predicts = {"predicts": predicts}
+        return predicts
+
+    def freeze(self):
+        """Restore the checkpoint into a fresh inference graph and freeze it
+
+        Returns:
+          graph_def: the frozen and folded GraphDef
+        """
+        graph = tf.Graph()
+        with graph.as_default():
+            images = tf.placeholder(
+                tf.float32,
+                (self.batch_size, self.height, self.width, 3),
+                name=INPUT_NAME)
+            outputs = self.inference(images)
+            output_names = []
+            with tf.name_scope(OUTPUT_SCOPE):
+                for name, tensor in outputs.items():
+                    output_names.append(tf.identity(tensor, name=name).op.name)
+
+            saver = tf.train.Saver()
+            with tf.Session(graph=graph) as sess:
+                saver.restore(sess, self.pretrain_path)
+                # only the sub graph the outputs depend on is kept, so the
+                # loss and the optimizer never make it into the frozen graph
+                graph_def = tf.graph_util.convert_variables_to_constants(
+                    sess, graph.as_graph_def(), output_names)
+
+        if TransformGraph is not None:
+            graph_def = TransformGraph(
+                graph_def, [INPUT_NAME], output_names,
+                ['strip_unused_nodes(type=float, shape="%d,%d,%d,3")' % (
+                    self.batch_size, self.height, self.width),
+                 'fold_constants(ignore_errors=true)',
+                 'fold_batch_norms',
+                 'fold_old_batch_norms'])
+        return graph_def
+
+    def export_graph(self, graph_path):
+        """Write the frozen graph, it can be loaded again with `frozen_graph_path`"""
+        with tf.gfile.GFile(graph_path, "wb") as f:
+            f.write(self.graph_def.SerializeToString())
+
+    def load_graph(self, graph_path):
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(graph_path, "rb") as f:
+            graph_def.ParseFromString(f.read())
+        return graph_def
+
+    def _create_session(self, graph_def):
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name="")
+        self.sess = tf.Session(graph=self.graph)
+
+        self.input_tensor = self.graph.get_tensor_by_name(INPUT_NAME + ":0")
+        self.output_tensors = {}
+        constant_tensors = {}
+        for node in graph_def.node:
+            if not node.name.startswith(OUTPUT_SCOPE + "/"):
+                continue
+            name = node.name[len(OUTPUT_SCOPE) + 1:]
+            tensor = self.graph.get_tensor_by_name(node.name + ":0")
+            if name in self.constant_outputs:
+                constant_tensors[name] = tensor
+            else:
+                self.output_tensors[name] = tensor
+        self.constants = self.sess.run(constant_tensors)
+
+        # the input buffer is reused by every call of `predict()`
+        self._input_buffer = np.zeros(
+            (self.batch_size, self.height, self.width, 3), dtype=np.float32)
+
+    def preprocess(self, image):
+        """Convert a BGR image (as read by cv2) to the input of the net"""
+        image = cv2.resize(image, (self.width, self.height))
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image = image.astype(np.float32)
+        return image / 255 * 2 - 1
+
+    def predict(self, images):
+        """Run the frozen graph on a batch of preprocessed images
+
+        Args:
+          images: 4-D array [n, height, width, 3], n may be any size, the
+          images are processed in chunks of `batch_size`
+        Returns:
+          outputs: dict of name to array with n rows
+        """
+        num = len(images)
+        results = dict((name, []) for name in self.output_tensors)
+        for start in range(0, num, self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            self._input_buffer[:len(chunk)] = chunk
+            outputs = self.sess.run(
+                self.output_tensors,
+                feed_dict={self.input_tensor: self._input_buffer})
+            for name, value in outputs.items():
+                results[name].append(value[:len(chunk)])
+        return dict((name, np.concatenate(value, axis=0))
+                    for name, value in results.items())
+
+    def decode(self, outputs):
+        """Convert the raw outputs of `predict()` to one result per image"""
+        num = len(next(iter(outputs.values())))
+        return [dict((name, value[i]) for name, value in outputs.items())
+                for i in range(num)]
+
+    def predict_images(self, images):
+        """Preprocess, predict and decode a list of BGR images"""
+        batch = np.stack([self.preprocess(image) for image in images])
+        return self.decode(self.predict(batch))
+
+    def close(self):
+        self.sess.close()
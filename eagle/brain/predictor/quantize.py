@@ -0,0 +1,89 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+try:
+    from tensorflow.tools.graph_transforms import TransformGraph
+except ImportError:
+    TransformGraph = None
+
+
+def freeze_keras_model(model, sess):
+    """Convert the variables of a loaded keras model to constants
+
+    Call `K.set_learning_phase(0)` before the model is loaded, otherwise the
+    batch normalization and dropout of the training phase end up in the graph.
+    Returns:
+      graph_def, input_names, output_names
+    """
+    input_names = [tensor.op.name for tensor in model.inputs]
+    output_names = [tensor.op.name for tensor in model.outputs]
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        sess, sess.graph.as_graph_def(), output_names)
+    return graph_def, input_names, output_names
+
+
+def optimize_graph(graph_def, input_names, output_names, quantize=False):
+    """Strip and fold the frozen graph, optionally with 8-bit weights
+
+    With `quantize` every float constant with more than 1024 elements (the
+    conv kernels) is stored as uint8 with its min/max range and dequantized
+    when the graph is loaded, the activations stay float32.
+    """
+    if TransformGraph is None:
+        raise ValueError("graph transforms are not available in this "
+                         "tensorflow build (tensorflow.tools.graph_transforms)")
+    transforms = ['strip_unused_nodes',
+                  'remove_nodes(op=Identity, op=CheckNumerics)',
+                  'fold_constants(ignore_errors=true)',
+                  'fold_batch_norms',
+                  'fold_old_batch_norms']
+    if quantize:
+        transforms.append('quantize_weights')
+    transforms += ['strip_unused_nodes', 'sort_by_execution_order']
+    return TransformGraph(graph_def, input_names, output_names, transforms)
+
+
+class FrozenGraphRunner(object):
+    """Run a frozen graph with one input and one output in its own session"""
+
+    def __init__(self, graph_def, input_name, output_name):
+        self.graph_def = graph_def
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name="")
+        self.sess = tf.Session(graph=self.graph)
+        self.input_tensor = self.graph.get_tensor_by_name(input_name + ":0")
+        self.output_tensor = self.graph.get_tensor_by_name(output_name + ":0")
+        self.latencies = []
+
+    @property
+    def size(self):
+        """Size of the serialized graph in bytes"""
+        return self.graph_def.ByteSize()
+
+    def run(self, images):
+        start_time = time.time()
+        outputs = self.sess.run(self.output_tensor,
+                                feed_dict={self.input_tensor: images})
+        self.latencies.append(time.time() - start_time)
+        return outputs
+
+    def latency_ms(self):
+        latencies = np.array(self.latencies) * 1000
+        p50, p90 = np.percentile(latencies, [50, 90])
+        return {"mean": latencies.mean(), "p50": p50, "p90": p90}
+
+    def close(self):
+        self.sess.close()
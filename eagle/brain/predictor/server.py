@@ -0,0 +1,284 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import time
+import queue
+import struct
+import threading
+import collections
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import cv2
+import numpy as np
+
+
+class InferenceRequest(object):
+    """A single image waiting in the queue of the InferenceServer"""
+
+    def __init__(self, image):
+        self.image = image
+        self.result = None
+        self.error = None
+        self.submit_time = time.time()
+        self._done = threading.Event()
+
+    def set_result(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise ValueError("inference request timed out after %s sec" % timeout)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class InferenceServer(object):
+    """Collect concurrent single image requests into micro batches
+
+    A worker thread takes the first waiting request and keeps collecting until
+    `max_batch_size` requests are gathered or `max_wait_ms` passed, then runs
+    the whole micro batch with one `predictor.predict()` call and hands every
+    request its own decoded result.
+    """
+
+    def __init__(self, predictor, max_batch_size=None, max_wait_ms=5,
+                 stats_window=10000):
+        self.predictor = predictor
+        if max_batch_size is None:
+            max_batch_size = predictor.batch_size
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = float(max_wait_ms) / 1000
+
+        self.requests = queue.Queue()
+        # latency of the last `stats_window` requests / batches in seconds
+        self.queue_times = collections.deque(maxlen=stats_window)
+        self.compute_times = collections.deque(maxlen=stats_window)
+        self.batch_sizes = collections.deque(maxlen=stats_window)
+        self._stats_lock = threading.Lock()
+
+        self._running = False
+        self._worker = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self._serve_forever)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def stop(self):
+        self._running = False
+        # wake up the worker if it waits for the first request
+        self.requests.put(None)
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        # the requests left in the queue are never run, fail them instead of
+        # letting `predict(timeout=None)` wait forever
+        error = ValueError("the inference server was stopped")
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.set_result(error=error)
+
+    def submit(self, image):
+        """Queue a BGR image, the preprocessing runs in the calling thread
+
+        Returns:
+          request: call `request.wait()` to get the decoded result
+        """
+        request = InferenceRequest(self.predictor.preprocess(image))
+        self.requests.put(request)
+        return request
+
+    def predict(self, image, timeout=None):
+        return self.submit(image).wait(timeout)
+
+    def _collect_batch(self):
+        request = self.requests.get()
+        if request is None:
+            return []
+        batch = [request]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                break
+            batch.append(request)
+        return batch
+
+    def _serve_forever(self):
+        while self._running:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            start_time = time.time()
+            try:
+                images = np.stack([request.image for request in batch])
+                results = self.predictor.decode(self.predictor.predict(images))
+            except Exception as e:
+                for request in batch:
+                    request.set_result(error=e)
+                continue
+            duration = time.time() - start_time
+
+            with self._stats_lock:
+                for request in batch:
+                    self.queue_times.append(start_time - request.submit_time)
+                self.compute_times.append(duration)
+                self.batch_sizes.append(len(batch))
+            for request, result in zip(batch, results):
+                request.set_result(result)
+
+    def stats(self):
+        """Queueing and compute latency percentiles in milliseconds"""
+        with self._stats_lock:
+            queue_times = np.array(self.queue_times) * 1000
+            compute_times = np.array(self.compute_times) * 1000
+            batch_sizes = np.array(self.batch_sizes)
+
+        def percentiles(values):
+            if len(values) == 0:
+                return {}
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            return {"p50": p50, "p90": p90, "p99": p99}
+
+        return {
+            "requests": len(queue_times),
+            "batches": len(batch_sizes),
+            "mean_batch_size": float(batch_sizes.mean()) if len(batch_sizes) else 0.0,
+            "queue_ms": percentiles(queue_times),
+            "compute_ms": percentiles(compute_times)
+        }
+
+
+def to_json(result):
+    """Convert a decoded result (tuples, numpy arrays/scalars) to json"""
+    def convert(value):
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, (list, tuple)):
+            return [convert(v) for v in value]
+        if isinstance(value, dict):
+            return dict((k, convert(v)) for k, v in value.items())
+        return value
+    return json.dumps(convert(result))
+
+
+def decode_image(data):
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("the request body is not an encoded image")
+    return image
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_http_server(server, host="127.0.0.1", port=8080):
+    """HTTP front end
+
+    POST /predict  body: encoded image (jpg, png ...), answer: json result
+    GET  /stats    answer: latency percentiles
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            body = body.encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/stats":
+                return self._reply(404, json.dumps({"error": "not found"}))
+            self._reply(200, to_json(server.stats()))
+
+        def do_POST(self):
+            if self.path != "/predict":
+                return self._reply(404, json.dumps({"error": "not found"}))
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                image = decode_image(self.rfile.read(length))
+            except ValueError as e:
+                return self._reply(400, json.dumps({"error": str(e)}))
+            # the errors of the worker (e.g. a failed session run) are raised
+            # again by `wait()`, answer them instead of dropping the connection
+            try:
+                body = to_json(server.predict(image))
+            except Exception as e:
+                return self._reply(500, json.dumps({"error": str(e)}))
+            self._reply(200, body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return _ThreadingHTTPServer((host, port), Handler)
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn,
+                           socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _read_exactly(rfile, size):
+    data = rfile.read(size)
+    if len(data) < size:
+        return None
+    return data
+
+
+def make_unix_server(server, socket_path):
+    """UNIX socket front end
+
+    Every message is a 4 byte big endian length followed by the payload. The
+    client sends encoded images and gets a json result for each of them.
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                header = _read_exactly(self.rfile, 4)
+                if header is None:
+                    break
+                data = _read_exactly(self.rfile, struct.unpack(">I", header)[0])
+                if data is None:
+                    break
+                try:
+                    body = to_json(server.predict(decode_image(data)))
+                except Exception as e:
+                    # keep the stream open for the next images of the client
+                    body = json.dumps({"error": str(e)})
+                body = body.encode("utf-8")
+                self.wfile.write(struct.pack(">I", len(body)) + body)
+
+    return _ThreadingUnixServer(socket_path, Handler)
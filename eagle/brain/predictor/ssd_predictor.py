@@ -0,0 +1,59 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from eagle.brain.predictor.predictor import Predictor
+from eagle.brain.ssd.box_encode_decode_utils import decode_y2
+
+
+class SSDPredictor(Predictor):
+    """Predictor for the tensorflow SSD nets (SSDVGG, dilated SSDVGG)
+
+    The anchors only depend on the net, they are folded into a constant of
+    the frozen graph and fetched once instead of with every batch.
+    """
+    constant_outputs = ("anchors",)
+
+    def __init__(self, net, common_params, solver_params, box_encoder_params):
+        if not isinstance(box_encoder_params, dict):
+            raise TypeError("box_encoder_params must be dict")
+
+        self.coords = str(box_encoder_params['coords'])
+        self.normalize_coords = True if box_encoder_params[
+            'normalize_coords'] == "True" else False
+        self.confidence_thresh = float(
+            solver_params.get('confidence_thresh', 0.5))
+        self.iou_threshold = float(solver_params.get('iou_threshold', 0.45))
+        self.top_k = str(solver_params.get('top_k', "all"))
+        if self.top_k != "all":
+            self.top_k = int(self.top_k)
+        super(SSDPredictor, self).__init__(net, common_params, solver_params)
+
+    def inference(self, images):
+        model_spec = self.net.inference(images)
+        return {
+            "predictions": model_spec["predictions"],
+            "anchors": model_spec["anchors"]
+        }
+
+    def decode(self, outputs):
+        """
+        Returns:
+          list of arrays [boxes, 6] in the format
+          `[class_id, confidence, xmin, xmax, ymin, ymax]`
+        """
+        return decode_y2(outputs["predictions"],
+                         confidence_thresh=self.confidence_thresh,
+                         iou_threshold=self.iou_threshold,
+                         top_k=self.top_k,
+                         input_coords=self.coords,
+                         normalize_coords=self.normalize_coords,
+                         img_height=self.height,
+                         img_width=self.width,
+                         anchors=self.constants["anchors"])
@@ -0,0 +1,403 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from eagle.brain.evaluate.detection_eval import iou_matrix
+from eagle.brain.ssd.box_encode_decode_utils import class_aware_nms
+
+
+def tile_offsets(height, width, tile_height, tile_width, overlap):
+    """Top left corners of the tiles of a frame
+
+    The same walk as `crop_image` of Others/satellite/prepare_trainsamples.py:
+    the stride is tile - overlap and the last row/column is moved back so it
+    ends at the border of the frame.
+    Returns:
+      list of (x, y)
+    """
+    offsets = []
+    for h in range(0, height, tile_height - overlap):
+        for w in range(0, width, tile_width - overlap):
+            if h + tile_height >= height:
+                h = max(0, height - tile_height)
+            if w + tile_width >= width:
+                w = max(0, width - tile_width)
+            if (w, h) not in offsets:
+                offsets.append((w, h))
+    return offsets
+
+
+def num_recalled(reference, detections, iou_threshold=0.5):
+    """Number of reference boxes with a detection of the same class
+
+    Both are arrays [k, 6] `[class_id, confidence, xmin, xmax, ymin, ymax]`.
+    """
+    if len(reference) == 0 or len(detections) == 0:
+        return 0
+    ious = iou_matrix(reference[:, [2, 4, 3, 5]], detections[:, [2, 4, 3, 5]])
+    ious[reference[:, 0][:, np.newaxis] != detections[:, 0]] = 0
+    return int(np.sum(ious.max(axis=1) >= iou_threshold))
+
+
+class TiledDetector(object):
+    """Detect on frames much larger than the input of the net
+
+    The frame is cut into overlapping tiles of the input size of the
+    predictor, all tiles of a frame go through the warm session in batches of
+    `batch_size`, the detections are moved back to frame coordinates and the
+    duplicates on the tile seams are merged with a class aware NMS.
+    """
+
+    def __init__(self, predictor, overlap=80, iou_threshold=0.45,
+                 read_ahead=2):
+        """
+        Args:
+          predictor: a Predictor whose `decode()` returns arrays in the format
+            `[class_id, confidence, xmin, xmax, ymin, ymax]`
+          overlap: overlap of neighbouring tiles in pixel (SUB_OVERLAP)
+          read_ahead: number of prepared frames waiting for the detector
+        """
+        self.predictor = predictor
+        self.tile_width = predictor.width
+        self.tile_height = predictor.height
+        # the stride tile - overlap must be positive, otherwise tile_offsets
+        # fails (stride 0) or returns no tile at all (negative stride)
+        if not 0 <= overlap < min(self.tile_height, self.tile_width):
+            raise ValueError("overlap must be in [0, %d) for %dx%d tiles" % (
+                min(self.tile_height, self.tile_width), self.tile_width,
+                self.tile_height), overlap)
+        self.overlap = overlap
+        self.iou_threshold = iou_threshold
+        self.read_ahead = read_ahead
+        self.stats = {"frames": 0, "tiles": 0, "prepare": 0.0, "detect": 0.0}
+
+    def _pad(self, frame):
+        """Frames smaller than a tile are padded at the bottom and right"""
+        height, width = frame.shape[:2]
+        if height < self.tile_height or width < self.tile_width:
+            frame = cv2.copyMakeBorder(
+                frame, 0, max(0, self.tile_height - height),
+                0, max(0, self.tile_width - width), cv2.BORDER_CONSTANT)
+        return frame
+
+    def prepare(self, frame):
+        """Cut a BGR frame into the input tiles of the predictor
+
+        Returns:
+          tiles: 4-D array [num_tiles, tile_height, tile_width, 3]
+          offsets: 2-D array [num_tiles, 2] (x, y) of every tile
+        """
+        start_time = time.time()
+        height, width = frame.shape[:2]
+        # 整帧只做一次颜色转换和归一化，切片不再单独处理
+        image = cv2.cvtColor(self._pad(frame), cv2.COLOR_BGR2RGB)
+        image = image.astype(np.float32) / 255 * 2 - 1
+        offsets = tile_offsets(height, width, self.tile_height,
+                               self.tile_width, self.overlap)
+        tiles = np.stack([image[y:y + self.tile_height, x:x + self.tile_width]
+                          for x, y in offsets])
+        self.stats["prepare"] += time.time() - start_time
+        return tiles, np.array(offsets, dtype=np.float32)
+
+    def _tile_detections(self, tiles, offsets):
+        """Detections of every tile in frame coordinates"""
+        detections = self.predictor.decode(self.predictor.predict(tiles))
+        results = []
+        for dets, (x, y) in zip(detections, offsets):
+            dets = np.array(dets, dtype=np.float32).reshape(-1, 6)
+            dets[:, 2:4] += x
+            dets[:, 4:6] += y
+            results.append(dets)
+        return results
+
+    def _merge(self, tile_detections):
+        """Merge the duplicates on the seams of the tiles"""
+        merged = np.concatenate(tile_detections, axis=0)
+        if self.iou_threshold:
+            merged = class_aware_nms(merged, self.iou_threshold)
+        return merged
+
+    def detect_tiles(self, tiles, offsets):
+        """
+        Returns:
+          2-D array [k, 6] of the frame `[class_id, confidence, xmin, xmax, ymin, ymax]`
+        """
+        start_time = time.time()
+        merged = self._merge(self._tile_detections(tiles, offsets))
+        self.stats["frames"] += 1
+        self.stats["tiles"] += len(tiles)
+        self.stats["detect"] += time.time() - start_time
+        return merged
+
+    def detect(self, frame):
+        return self.detect_tiles(*self.prepare(frame))
+
+    def _read_forever(self, frames, outputs):
+        try:
+            for item in frames:
+                frame = cv2.imread(item) if isinstance(item, str) else item
+                if frame is None:
+                    raise ValueError("can not read the frame", item)
+                outputs.put((item, self.prepare(frame)))
+        except Exception as e:
+            outputs.put((None, e))
+            return
+        outputs.put(None)
+
+    def detect_frames(self, frames):
+        """Detect on a sequence of frames (arrays or image paths)
+
+        Reading and tiling of the next frames run on another thread while the
+        session works on the current frame.
+        Yields:
+          (item, detections) for every item of `frames`
+        """
+        outputs = queue.Queue(maxsize=self.read_ahead)
+        reader = threading.Thread(target=self._read_forever,
+                                  args=(frames, outputs))
+        reader.daemon = True
+        reader.start()
+        while True:
+            result = outputs.get()
+            if result is None:
+                break
+            item, prepared = result
+            if item is None:
+                raise prepared
+            yield item, self.detect_tiles(*prepared)
+        reader.join()
+
+    def report(self):
+        frames = max(self.stats["frames"], 1)
+        return ("%d frames, %.1f tiles per frame, prepare %.1f ms, "
+                "detect %.1f ms per frame" % (
+                    self.stats["frames"], self.stats["tiles"] / frames,
+                    self.stats["prepare"] * 1000 / frames,
+                    self.stats["detect"] * 1000 / frames))
+
+
+class ChangeGatedTiledDetector(TiledDetector):
+    """Tiled detection on staring video, only changed tiles are detected again
+
+    Every tile keeps the downsampled gray patch of the frame it was last
+    detected on. The change score of a tile is the mean absolute difference
+    to that patch, the tiles below `change_threshold` reuse their previous
+    detections. Comparing against the last detected frame instead of the
+    previous frame lets slow changes add up until they pass the threshold,
+    and a tile is detected again after `refresh_interval` frames anyway.
+
+    With `audit_every` every N-th frame is also detected on all tiles and the
+    recall of the gated detections against it is recorded.
+    """
+
+    def __init__(self, predictor, overlap=80, iou_threshold=0.45,
+                 read_ahead=2, change_threshold=4.0, refresh_interval=30,
+                 downsample=8, audit_every=0):
+        """
+        Args:
+          change_threshold: mean absolute gray difference (0-255) of a tile
+          refresh_interval: frames after which a tile is always detected
+          downsample: factor of the frame used for the change scores
+          audit_every: compare with the full detection every N frames, 0 off
+        """
+        super(ChangeGatedTiledDetector, self).__init__(
+            predictor, overlap, iou_threshold, read_ahead)
+        self.change_threshold = change_threshold
+        self.refresh_interval = refresh_interval
+        self.downsample = downsample
+        self.audit_every = audit_every
+        # total_tiles: all tiles of the frames, tiles: the detected ones
+        self.stats.update({"total_tiles": 0, "audits": 0, "audit_recall": 0,
+                           "audit_boxes": 0})
+        self.reset()
+
+    def reset(self):
+        """Forget the cached tiles, e.g. at the start of another video"""
+        self.references = None
+        self.tile_cache = None
+        self.ages = None
+
+    def prepare(self, frame):
+        """
+        Returns:
+          tiles, offsets as `TiledDetector.prepare()` and the downsampled
+          gray frame for the change scores
+        """
+        tiles, offsets = super(ChangeGatedTiledDetector, self).prepare(frame)
+        start_time = time.time()
+        gray = cv2.cvtColor(self._pad(frame), cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (gray.shape[1] // self.downsample,
+                                  gray.shape[0] // self.downsample),
+                           interpolation=cv2.INTER_AREA).astype(np.float32)
+        self.stats["prepare"] += time.time() - start_time
+        return tiles, offsets, small
+
+    def _patches(self, small, offsets):
+        d = self.downsample
+        return [small[int(y) // d:(int(y) + self.tile_height) // d,
+                      int(x) // d:(int(x) + self.tile_width) // d]
+                for x, y in offsets]
+
+    def change_scores(self, patches):
+        return np.array([np.mean(np.abs(patch - reference))
+                         for patch, reference in zip(patches, self.references)])
+
+    def detect_tiles(self, tiles, offsets, small):
+        start_time = time.time()
+        patches = self._patches(small, offsets)
+        if self.references is None or len(self.references) != len(patches):
+            selected = np.ones(len(patches), dtype=np.bool_)
+            self.references = patches
+            self.tile_cache = [None] * len(patches)
+            self.ages = np.zeros(len(patches), dtype=np.int64)
+        else:
+            selected = ((self.change_scores(patches) >= self.change_threshold) |
+                        (self.ages >= self.refresh_interval))
+
+        index = np.nonzero(selected)[0]
+        if len(index):
+            for i, dets in zip(index, self._tile_detections(tiles[index],
+                                                            offsets[index])):
+                self.tile_cache[i] = dets
+                self.references[i] = patches[i]
+        self.ages[selected] = 0
+        self.ages[~selected] += 1
+        merged = self._merge(self.tile_cache)
+
+        self.stats["frames"] += 1
+        self.stats["tiles"] += len(index)
+        self.stats["total_tiles"] += len(tiles)
+        self.stats["detect"] += time.time() - start_time
+
+        if self.audit_every and self.stats["frames"] % self.audit_every == 0:
+            self._audit(merged, tiles, offsets)
+        return merged
+
+    def _audit(self, merged, tiles, offsets):
+        """Recall of the gated detections against the detection of all tiles"""
+        full = self._merge(self._tile_detections(tiles, offsets))
+        self.stats["audits"] += 1
+        self.stats["audit_boxes"] += len(full)
+        self.stats["audit_recall"] += num_recalled(full, merged)
+
+    def report(self):
+        frames = max(self.stats["frames"], 1)
+        skipped = self.stats["total_tiles"] - self.stats["tiles"]
+        skipped_share = skipped / max(self.stats["total_tiles"], 1)
+        report = ("%d frames, %.1f of %.1f tiles detected per frame, "
+                  "%.1f skipped by the gate (%.1f%% detector compute saved), "
+                  "prepare %.1f ms, detect %.1f ms per frame" % (
+                      self.stats["frames"], self.stats["tiles"] / frames,
+                      self.stats["total_tiles"] / frames, skipped / frames,
+                      100.0 * skipped_share,
+                      self.stats["prepare"] * 1000 / frames,
+                      self.stats["detect"] * 1000 / frames))
+        if self.stats["audits"]:
+            report += ", recall against full detection %.2f%% (%d frames)" % (
+                100.0 * self.stats["audit_recall"] /
+                max(self.stats["audit_boxes"], 1), self.stats["audits"])
+        return report
+
+
+class CascadeTiledDetector(TiledDetector):
+    """Two stage tiled detection, a cheap gate model picks the tiles
+
+    All tiles go through the gate predictor (e.g. YoloTinyNet) at its own,
+    usually lower, input resolution. Only the tiles where the gate finds a
+    box with a confidence of at least `gate_threshold` are detected with the
+    expensive predictor (e.g. SSDVGG), the other tiles count as empty.
+
+    With `audit_every` every N-th frame is also detected with the expensive
+    predictor on all tiles and the recall of the cascade against it is
+    recorded.
+    """
+
+    def __init__(self, predictor, gate_predictor, gate_threshold=0.3,
+                 overlap=80, iou_threshold=0.45, read_ahead=2, audit_every=0):
+        """
+        Args:
+          gate_predictor: a Predictor with the same input normalization, its
+            cfg should use a low confidence_thresh so the gate sees weak boxes
+          gate_threshold: minimal confidence of a gate box to pass a tile
+        """
+        super(CascadeTiledDetector, self).__init__(
+            predictor, overlap, iou_threshold, read_ahead)
+        self.gate_predictor = gate_predictor
+        self.gate_threshold = gate_threshold
+        self.audit_every = audit_every
+        self.stats.update({"gate_tiles": 0, "gate": 0.0, "audits": 0,
+                           "audit_recall": 0, "audit_boxes": 0})
+
+    def gate_scores(self, tiles):
+        """Highest gate confidence of every tile"""
+        size = (self.gate_predictor.width, self.gate_predictor.height)
+        if size != (self.tile_width, self.tile_height):
+            tiles = np.stack([cv2.resize(tile, size,
+                                         interpolation=cv2.INTER_AREA)
+                              for tile in tiles])
+        detections = self.gate_predictor.decode(
+            self.gate_predictor.predict(tiles))
+        scores = []
+        for dets in detections:
+            dets = np.asarray(dets, dtype=np.float32).reshape(-1, 6)
+            scores.append(dets[:, 1].max() if len(dets) else 0.0)
+        return np.array(scores)
+
+    def detect_tiles(self, tiles, offsets):
+        start_time = time.time()
+        selected = self.gate_scores(tiles) >= self.gate_threshold
+        gate_time = time.time() - start_time
+
+        index = np.nonzero(selected)[0]
+        if len(index):
+            merged = self._merge(self._tile_detections(tiles[index],
+                                                       offsets[index]))
+        else:
+            merged = np.zeros((0, 6), dtype=np.float32)
+
+        self.stats["frames"] += 1
+        self.stats["gate_tiles"] += len(tiles)
+        self.stats["tiles"] += len(index)
+        self.stats["gate"] += gate_time
+        self.stats["detect"] += time.time() - start_time - gate_time
+
+        if self.audit_every and self.stats["frames"] % self.audit_every == 0:
+            full = self._merge(self._tile_detections(tiles, offsets))
+            self.stats["audits"] += 1
+            self.stats["audit_boxes"] += len(full)
+            self.stats["audit_recall"] += num_recalled(full, merged)
+        return merged
+
+    def report(self):
+        frames = max(self.stats["frames"], 1)
+        report = ("%d frames, gate: %.1f tiles per frame, %.1f tiles/sec; "
+                  "detector: %.1f tiles per frame (%.1f%% forwarded), "
+                  "%.1f tiles/sec; %.1f ms per frame" % (
+                      self.stats["frames"], self.stats["gate_tiles"] / frames,
+                      self.stats["gate_tiles"] / max(self.stats["gate"], 1e-6),
+                      self.stats["tiles"] / frames,
+                      100.0 * self.stats["tiles"] /
+                      max(self.stats["gate_tiles"], 1),
+                      self.stats["tiles"] / max(self.stats["detect"], 1e-6),
+                      (self.stats["gate"] + self.stats["detect"]) * 1000 /
+                      frames))
+        if self.stats["audits"]:
+            report += ", recall against the detector on all tiles " \
+                      "%.2f%% (%d frames)" % (
+                          100.0 * self.stats["audit_recall"] /
+                          max(self.stats["audit_boxes"], 1),
+                          self.stats["audits"])
+        return report
@@ -0,0 +1,267 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from eagle.brain.evaluate.detection_eval import iou_matrix
+from eagle.brain.predictor.tiled import TiledDetector
+
+
+class VideoReader(object):
+    """Decode a video file on a read-ahead thread
+
+    Iterating yields (frame_index, frame), at most `read_ahead` decoded
+    frames wait in memory.
+    """
+
+    def __init__(self, video_path, read_ahead=8):
+        self.capture = cv2.VideoCapture(video_path)
+        if not self.capture.isOpened():
+            raise ValueError("can not open the video", video_path)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frames = queue.Queue(maxsize=read_ahead)
+        self.stopped = False
+        self.thread = threading.Thread(target=self._read_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read_forever(self):
+        index = 0
+        while not self.stopped:
+            ok, frame = self.capture.read()
+            if not ok:
+                break
+            self.frames.put((index, frame))
+            index += 1
+        self.frames.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            yield item
+
+    def close(self):
+        self.stopped = True
+        # 清空队列，读线程不会阻塞在put上
+        while self.thread.is_alive():
+            try:
+                self.frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.capture.release()
+
+
+class IoUTracker(object):
+    """Carry detections over the frames the detector skips
+
+    On a detector frame the detections are matched greedily to the tracks of
+    the same class: pairs with an IoU of at least `iou_threshold` come first,
+    by IoU, then the other pairs (also those with a small overlap) by their
+    centroid distance, if it is smaller than the size of the track box. The centroid motion
+    between two matches gives the velocity, the skipped frames move the
+    boxes by it.
+    Boxes are `[class_id, confidence, xmin, xmax, ymin, ymax]`.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=2):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.boxes = np.zeros((0, 6), dtype=np.float32)
+        self.velocity = np.zeros((0, 2), dtype=np.float32)
+        # centroids of the tracks on the last detector frame they matched
+        self.last_centroids = np.zeros((0, 2), dtype=np.float32)
+        self.missed = np.zeros(0, dtype=np.int64)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.next_id = 0
+
+    @staticmethod
+    def _centroids(boxes):
+        return np.stack([(boxes[:, 2] + boxes[:, 3]) / 2,
+                         (boxes[:, 4] + boxes[:, 5]) / 2], axis=1)
+
+    def _match(self, detections):
+        if len(self.boxes) == 0 or len(detections) == 0:
+            return []
+        ious = iou_matrix(self.boxes[:, [2, 4, 3, 5]],
+                          detections[:, [2, 4, 3, 5]])
+        distance = np.linalg.norm(
+            self._centroids(self.boxes)[:, np.newaxis] -
+            self._centroids(detections)[np.newaxis], axis=2)
+        size = np.maximum(self.boxes[:, 3] - self.boxes[:, 2],
+                          self.boxes[:, 5] - self.boxes[:, 4])
+        # IoU >= threshold scores 1 + IoU, every other pair 1 - the centroid
+        # distance relative to the track size, so the IoU matches go first
+        score = np.where(ious >= self.iou_threshold, 1 + ious,
+                         1 - distance / np.maximum(size[:, np.newaxis], 1e-6))
+        score[self.boxes[:, 0][:, np.newaxis] != detections[:, 0]] = 0
+
+        matches = []
+        used_tracks = np.zeros(len(self.boxes), dtype=np.bool_)
+        used_dets = np.zeros(len(detections), dtype=np.bool_)
+        for flat in np.argsort(-score, axis=None):
+            t, d = np.unravel_index(flat, score.shape)
+            if score[t, d] <= 0:
+                break
+            if used_tracks[t] or used_dets[d]:
+                continue
+            used_tracks[t] = used_dets[d] = True
+            matches.append((t, d))
+        return matches
+
+    def update(self, detections, num_frames=1):
+        """Correct the tracks with the detections of a detector frame
+
+        Args:
+          num_frames: frames since the previous detector frame
+        Returns:
+          2-D array [k, 6] of the current boxes
+        """
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+        matches = self._match(detections)
+        matched_tracks = np.array([t for t, _ in matches], dtype=np.int64)
+        matched_dets = np.array([d for _, d in matches], dtype=np.int64)
+
+        velocity = self.velocity.copy()
+        last_centroids = self.last_centroids.copy()
+        missed = self.missed + 1
+        boxes = self.boxes.copy()
+        if len(matches):
+            centroids = self._centroids(detections[matched_dets])
+            # missed already counts this detector frame: the intervals since
+            # the last match of the track, not only the last one
+            velocity[matched_tracks] = (
+                centroids - last_centroids[matched_tracks]) / (
+                num_frames * missed[matched_tracks, np.newaxis])
+            last_centroids[matched_tracks] = centroids
+            missed[matched_tracks] = 0
+            boxes[matched_tracks] = detections[matched_dets]
+
+        keep = missed <= self.max_missed
+        new = np.ones(len(detections), dtype=np.bool_)
+        new[matched_dets] = False
+        num_new = int(new.sum())
+        self.boxes = np.concatenate([boxes[keep], detections[new]])
+        self.velocity = np.concatenate(
+            [velocity[keep], np.zeros((num_new, 2), dtype=np.float32)])
+        self.last_centroids = np.concatenate(
+            [last_centroids[keep], self._centroids(detections[new])])
+        self.missed = np.concatenate(
+            [missed[keep], np.zeros(num_new, dtype=np.int64)])
+        self.ids = np.concatenate(
+            [self.ids[keep], self.next_id + np.arange(num_new)])
+        self.next_id += num_new
+        return self.boxes[self.missed == 0]
+
+    def predict(self):
+        """Move the tracks to the next frame without the detector"""
+        self.boxes[:, 2:4] += self.velocity[:, 0:1]
+        self.boxes[:, 4:6] += self.velocity[:, 1:2]
+        return self.boxes[self.missed == 0]
+
+    def active_ids(self):
+        """Track ids of the boxes returned by `update()` and `predict()`"""
+        return self.ids[self.missed == 0]
+
+
+class VideoDetector(object):
+    """Detect on a video, the detector only runs on every N-th frame
+
+    The frames to detect on are collected to batches of the predictor, the
+    frames in between are filled by the tracker. The results come out in
+    frame order, late by at most one batch.
+    """
+
+    def __init__(self, detector, detect_every=1, tracker=None):
+        """
+        Args:
+          detector: a Predictor (the frame is resized to its input) or a
+            TiledDetector for frames larger than the input
+          detect_every: run the detector on every N-th frame, 1 for all
+        """
+        self.detector = detector
+        self.detect_every = detect_every
+        self.tracker = tracker if tracker is not None else IoUTracker()
+        if isinstance(detector, TiledDetector):
+            self.batch_size = 1
+        else:
+            self.batch_size = detector.batch_size
+        self.stats = {"frames": 0, "detected": 0, "detect": 0.0, "track": 0.0}
+        # run() restarts the clock, report() also works before it
+        self.start_time = time.time()
+
+    def _detect(self, frames):
+        start_time = time.time()
+        if isinstance(self.detector, TiledDetector):
+            results = [self.detector.detect(frame) for frame in frames]
+        else:
+            results = []
+            for frame, dets in zip(frames, self.detector.predict_images(frames)):
+                dets = np.array(dets, dtype=np.float32).reshape(-1, 6)
+                dets[:, 2:4] *= frame.shape[1] / self.detector.width
+                dets[:, 4:6] *= frame.shape[0] / self.detector.height
+                results.append(dets)
+        self.stats["detect"] += time.time() - start_time
+        self.stats["detected"] += len(frames)
+        return results
+
+    def _flush(self, window):
+        keys = [frame for index, frame in window
+                if index % self.detect_every == 0]
+        detections = iter(self._detect(keys)) if keys else iter([])
+        for index, frame in window:
+            start_time = time.time()
+            if index % self.detect_every == 0:
+                boxes = self.tracker.update(next(detections),
+                                            num_frames=self.detect_every)
+            else:
+                boxes = self.tracker.predict()
+            self.stats["track"] += time.time() - start_time
+            self.stats["frames"] += 1
+            yield index, frame, boxes
+
+    def run(self, frames):
+        """
+        Args:
+          frames: iterable of (frame_index, frame), e.g. a VideoReader
+        Yields:
+          (frame_index, frame, boxes [k, 6])
+        """
+        self.start_time = time.time()
+        window = []
+        num_keys = 0
+        for index, frame in frames:
+            window.append((index, frame))
+            if index % self.detect_every == 0:
+                num_keys += 1
+            # 凑满一个batch的检测帧后再统一推理
+            if num_keys == self.batch_size:
+                for result in self._flush(window):
+                    yield result
+                window, num_keys = [], 0
+        for result in self._flush(window):
+            yield result
+
+    def report(self):
+        duration = max(time.time() - self.start_time, 1e-6)
+        frames = max(self.stats["frames"], 1)
+        return ("%d frames, %.2f frames/sec, detector on %d frames "
+                "(%.1f ms each), tracker %.2f ms per frame" % (
+                    self.stats["frames"], self.stats["frames"] / duration,
+                    self.stats["detected"],
+                    self.stats["detect"] * 1000 / max(self.stats["detected"], 1),
+                    self.stats["track"] * 1000 / frames))
@@ -0,0 +1,42 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from eagle.brain.predictor.predictor import Predictor
+from eagle.brain.yolo.decoder import YoloDecoder, decode_params
+
+
+class YoloPredictor(Predictor):
+    """Predictor for the single grid yolo nets (YoloNet, YoloTinyNet)"""
+
+    # the outputs the boxes are decoded from
+    grid_outputs = ("predicts",)
+
+    def __init__(self, net, common_params, solver_params):
+        self.num_classes = int(common_params['num_classes'])
+        self.boxes_per_cell = net.boxes_per_cell
+        super(YoloPredictor, self).__init__(net, common_params, solver_params)
+        self.decoder = YoloDecoder(self.num_classes, self.boxes_per_cell,
+                                   self.height, self.width,
+                                   **decode_params(solver_params))
+
+    def decode(self, outputs):
+        """
+        Returns:
+          list of arrays [boxes, 6] in the format
+          `[class_id, confidence, xmin, xmax, ymin, ymax]`
+        """
+        return self.decoder([outputs[name] for name in self.grid_outputs])
+
+
+class YoloUPredictor(YoloPredictor):
+    """Predictor for YoloUNet, the 9x9 and the 15x15 grid are decoded together
+    and share one NMS"""
+
+    grid_outputs = ("predicts_g9", "predicts_g15")
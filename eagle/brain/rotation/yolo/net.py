@@ -8,6 +8,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from eagle.brain.yolo.net import batch_loss, batch_iou
+
 
 class Net(object):
     def __init__(self, common_params, net_params):
@@ -34,3 +36,11 @@ class Net(object):
           objects_num: 1-D tensor [batch_size]
         """
         raise NotImplementedError
+
+    def batch_loss(self, predicts, labels, objects_num):
+        """Yolo loss terms of the whole batch, see `batch_loss`"""
+        return batch_loss(self, predicts, labels, objects_num)
+
+    def batch_iou(self, boxes1, boxes2):
+        """calculate ious, see `batch_iou`"""
+        return batch_iou(boxes1, boxes2)
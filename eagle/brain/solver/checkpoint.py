@@ -0,0 +1,113 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import time
+import queue
+import threading
+from datetime import datetime
+
+import tensorflow as tf
+
+
+class AsyncCheckpointer(object):
+    """Write checkpoints on a background thread
+
+    `save()` only copies the variable values to host memory with one
+    `sess.run`, the checkpoint files are written by a worker thread from a
+    mirror graph on the CPU, whose variables have the same names as the
+    trained ones. The checkpoints can be restored with a plain
+    `tf.train.Saver`.
+
+    At most `max_in_flight` snapshots wait for the writer, `save()` blocks
+    when there are more, so the host memory used stays bounded.
+    """
+
+    def __init__(self, var_list=None, max_to_keep=3, max_in_flight=1):
+        if var_list is None:
+            var_list = tf.global_variables()
+        self.var_list = list(var_list)
+        # restore runs in the training graph as usual
+        self.restore_saver = tf.train.Saver(self.var_list)
+
+        self.mirror_graph = tf.Graph()
+        with self.mirror_graph.as_default(), tf.device("/cpu:0"):
+            self.placeholders = []
+            mirror_vars = {}
+            for var in self.var_list:
+                placeholder = tf.placeholder(
+                    var.dtype.base_dtype, var.get_shape())
+                mirror_vars[var.op.name] = tf.Variable(
+                    placeholder, trainable=False, collections=[],
+                    name=var.op.name)
+                self.placeholders.append(placeholder)
+            # running the initializer loads the fed snapshot
+            self.load_op = tf.variables_initializer(list(mirror_vars.values()))
+            self.mirror_saver = tf.train.Saver(
+                mirror_vars, max_to_keep=max_to_keep)
+        self.mirror_sess = tf.Session(
+            graph=self.mirror_graph,
+            config=tf.ConfigProto(device_count={"GPU": 0}))
+
+        self.snapshots = queue.Queue(maxsize=max(1, int(max_in_flight)))
+        self.write_times = []
+        self.error = None
+        self._writer = threading.Thread(target=self._write_forever)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def restore(self, sess, save_path):
+        self.restore_saver.restore(sess, save_path)
+
+    def save(self, sess, save_path, global_step=None):
+        """Snapshot the variables and queue them for writing
+
+        Returns:
+          the time in seconds the training loop was blocked
+        """
+        if self.error is not None:
+            raise self.error
+        start_time = time.time()
+        values = sess.run(self.var_list)
+        self.snapshots.put((values, save_path, global_step))
+        return time.time() - start_time
+
+    def _write_forever(self):
+        while True:
+            snapshot = self.snapshots.get()
+            if snapshot is None:
+                self.snapshots.task_done()
+                break
+            values, save_path, global_step = snapshot
+            start_time = time.time()
+            try:
+                self.mirror_sess.run(
+                    self.load_op,
+                    feed_dict=dict(zip(self.placeholders, values)))
+                self.mirror_saver.save(
+                    self.mirror_sess, save_path, global_step=global_step,
+                    write_meta_graph=False)
+            except Exception as e:
+                # the error is raised in the training loop on the next save
+                self.error = e
+            duration = time.time() - start_time
+            self.write_times.append(duration)
+            print('%s: checkpoint step %s written in %.3f sec (background)' % (
+                datetime.now(), global_step, duration))
+            sys.stdout.flush()
+            self.snapshots.task_done()
+
+    def close(self):
+        """Wait until every queued checkpoint has been written"""
+        self.snapshots.put(None)
+        self._writer.join()
+        self.mirror_sess.close()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,163 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import time
+
+import tensorflow as tf
+
+from eagle.brain.solver.ssd_solver import SSDSolver
+
+
+class DistributedSSDSolver(SSDSolver):
+    """Data parallel SSD training on a parameter server cluster
+
+    Every worker process builds the whole model with its variables placed on
+    the parameter servers by `replica_device_setter` and feeds it from its own
+    dataset shard. With `sync_replicas` the gradients of all workers are
+    aggregated by a SyncReplicasOptimizer before every update, otherwise the
+    workers update the parameters asynchronously.
+
+    cluster_params:
+      ps_hosts:      list of "host:port" of the parameter servers
+      worker_hosts:  list of "host:port" of the workers
+      job_name:      "ps" or "worker"
+      task_index:    index of this process in its job
+      sync_replicas: True or False
+      intra_op_threads: intra-op threads of this process, 0 for the
+                        TensorFlow default (all cores)
+      inter_op_threads: inter-op threads of this process, 0 for the default
+
+    Several processes on one host must split the cores with the thread
+    counts, otherwise every process starts thread pools of full size.
+    """
+
+    def __init__(self, dataset, net, common_params, solver_params,
+                 cluster_params):
+        if not isinstance(cluster_params, dict):
+            raise TypeError("cluster_params must be dict")
+
+        self.job_name = str(cluster_params["job_name"])
+        if self.job_name not in ("ps", "worker"):
+            raise ValueError("`job_name` must be ps or worker.")
+        self.task_index = int(cluster_params["task_index"])
+        self.num_workers = len(cluster_params["worker_hosts"])
+        self.sync_replicas = bool(cluster_params.get("sync_replicas", False))
+
+        self.cluster = tf.train.ClusterSpec({
+            "ps": list(cluster_params["ps_hosts"]),
+            "worker": list(cluster_params["worker_hosts"])})
+        # 只看见ps和自己，线程数按照同一台机器上的进程数划分
+        self.session_config = tf.ConfigProto(
+            intra_op_parallelism_threads=int(
+                cluster_params.get("intra_op_threads", 0)),
+            inter_op_parallelism_threads=int(
+                cluster_params.get("inter_op_threads", 0)),
+            device_filters=["/job:ps",
+                            "/job:%s/task:%d" % (self.job_name,
+                                                 self.task_index)])
+        self.server = tf.train.Server(
+            self.cluster, job_name=self.job_name, task_index=self.task_index,
+            config=self.session_config)
+        if self.job_name == "ps":
+            return
+
+        self.sync_opt = None
+        self.worker_device = "/job:worker/task:%d" % self.task_index
+        super(DistributedSSDSolver, self).__init__(
+            dataset, net, common_params, solver_params)
+
+        self.is_chief = self.task_index == 0
+        self.summary_dir = os.path.join(
+            self.train_dir, "worker_%d" % self.task_index)
+
+    def build_model(self):
+        # replica_device_setter puts every variable on the ps, the gradient
+        # accumulators are partial sums of this worker and must stay local
+        self.accumulator_device = self.worker_device
+        device_setter = tf.train.replica_device_setter(
+            worker_device=self.worker_device,
+            cluster=self.cluster)
+        with tf.device(device_setter):
+            super(DistributedSSDSolver, self).build_model()
+
+    def build_train_op(self, opt, loss, global_step):
+        if self.sync_replicas:
+            opt = tf.train.SyncReplicasOptimizer(
+                opt,
+                replicas_to_aggregate=self.num_workers,
+                total_num_replicas=self.num_workers)
+            self.sync_opt = opt
+        return super(DistributedSSDSolver, self).build_train_op(
+            opt, loss, global_step)
+
+    def create_session(self, init, saver):
+        is_chief = self.is_chief
+        local_init_op = tf.local_variables_initializer()
+        ready_for_local_init_op = None
+        if self.sync_opt is not None:
+            step_init_op = (self.sync_opt.chief_init_op if is_chief
+                            else self.sync_opt.local_step_init_op)
+            local_init_op = tf.group(local_init_op, step_init_op)
+            ready_for_local_init_op = self.sync_opt.ready_for_local_init_op
+            chief_queue_runner = self.sync_opt.get_chief_queue_runner()
+            init_tokens_op = self.sync_opt.get_init_tokens_op()
+
+        def init_fn(sess):
+            if self.pretrain_path != "None":
+                saver.restore(sess, self.pretrain_path)
+
+        # the chief initializes (or restores) the variables on the parameter
+        # servers, the other workers wait until they are ready
+        self.supervisor = tf.train.Supervisor(
+            is_chief=is_chief,
+            logdir=None,
+            init_op=tf.global_variables_initializer(),
+            local_init_op=local_init_op,
+            ready_for_local_init_op=ready_for_local_init_op,
+            init_fn=init_fn,
+            summary_op=None,
+            saver=None,
+            global_step=self.global_step)
+        sess = self.supervisor.prepare_or_wait_for_session(
+            self.server.target, config=self.session_config)
+
+        if self.sync_opt is not None and is_chief:
+            sess.run(init_tokens_op)
+            self.supervisor.start_queue_runners(sess, [chief_queue_runner])
+
+        self.train_start_time = time.time()
+        return sess
+
+    def close_session(self, sess):
+        self.train_duration = time.time() - self.train_start_time
+        self.supervisor.stop()
+        sess.close()
+
+    def solve(self):
+        if self.job_name == "ps":
+            self.server.join()
+            return
+
+        super(DistributedSSDSolver, self).solve()
+        duration = self.train_duration
+        examples_per_sec = self.max_iterators * self.batch_size / duration
+        print("worker %d: %.1f examples/sec" % (
+            self.task_index, examples_per_sec))
+
+        # the launcher sums these up to compute the scaling efficiency
+        throughput_path = os.path.join(
+            self.train_dir, "throughput_worker_%d.json" % self.task_index)
+        with open(throughput_path, "w") as f:
+            json.dump({"task_index": self.task_index,
+                       "num_workers": self.num_workers,
+                       "examples_per_sec": examples_per_sec,
+                       "duration": duration}, f)
@@ -8,6 +8,30 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import json
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.contrib.staging import StagingArea
+
+from eagle.brain.solver.checkpoint import AsyncCheckpointer
+
+
+# feed_dict: 每一步在python中读取batch并通过feed_dict传入
+# dataset:   使用tf.data.Dataset.from_generator包装数据集并预取
+# staging:   使用StagingArea双缓冲，计算第N步的同时传入第N+1个batch
+FEED_MODES = ("feed_dict", "dataset", "staging")
+# sync:  在训练循环中直接调用saver.save写盘
+# async: 只用一次sess.run把变量拷贝到内存，后台线程写checkpoint文件
+CHECKPOINT_MODES = ("sync", "async")
+# data_wait: 等待dataset.batch()产生下一个batch的时间
+# feed:      把batch转换为placeholder对应dtype的连续数组的时间
+# compute:   sess.run的时间(包括数据拷贝到设备上的时间)
+TIMINGS = ("data_wait", "feed", "compute")
+
 
 class Solver(object):
     def __init__(self, dataset, net, common_params, solver_params):
@@ -16,5 +40,250 @@ class Solver(object):
         if not isinstance(solver_params, dict):
             raise TypeError("solver_params must be dict")
 
+        self.dataset = dataset
+
+        self.feed_mode = str(solver_params.get("feed_mode", "feed_dict"))
+        if self.feed_mode not in FEED_MODES:
+            raise ValueError(
+                "Unexpected value for `feed_mode`. "
+                "Supported values are %s." % ", ".join(FEED_MODES))
+        self.prefetch_size = int(solver_params.get("prefetch_size", 2))
+
+        self.checkpoint_mode = str(solver_params.get("checkpoint_mode", "sync"))
+        if self.checkpoint_mode not in CHECKPOINT_MODES:
+            raise ValueError(
+                "Unexpected value for `checkpoint_mode`. "
+                "Supported values are %s." % ", ".join(CHECKPOINT_MODES))
+        self.max_checkpoints_in_flight = int(
+            solver_params.get("max_checkpoints_in_flight", 1))
+        # 累积K个小batch的梯度后再更新一次参数，等效batch为K * batch_size
+        self.accumulate_steps = int(solver_params.get("accumulate_steps", 1))
+        if self.accumulate_steps < 1:
+            raise ValueError("`accumulate_steps` must be at least 1.")
+        self.accumulate_op = None
+        # device of the gradient accumulators, None places them with the
+        # variables
+        self.accumulator_device = None
+        # 冻结的变量作用域(json列表，例如["conv1_1", "conv1_2"])，这些变量不计算
+        # 梯度，反向传播在第一个可训练的层停止
+        self.freeze_scopes = json.loads(
+            str(solver_params.get("freeze_scopes", "[]")))
+
+        self.input_placeholders = None
+        self.stage_op = None
+        self.timings = dict((name, []) for name in TIMINGS)
+
     def solve(self):
         raise NotImplementedError
+
+    def build_train_op(self, opt, loss, global_step):
+        """Compute the gradients of `loss` and apply them with `opt`
+
+        The variables in `freeze_scopes` get no gradients.
+
+        With `accumulate_steps` K > 1 the gradients are summed up in local
+        variables, `self.accumulate_op` only accumulates the gradients of the
+        current batch. The returned op additionally applies the mean of the K
+        accumulated gradients, so the learning rate keeps its meaning, and
+        resets the accumulators afterwards. Use `train_op_for_step` to pick
+        the op to run.
+        """
+        grads = opt.compute_gradients(
+            loss, var_list=self.trainable_variables())
+        if self.accumulate_steps == 1:
+            return opt.apply_gradients(grads, global_step=global_step)
+
+        grads = [(grad, var) for grad, var in grads if grad is not None]
+
+        def create_accumulators():
+            return [
+                tf.Variable(tf.zeros(var.get_shape(),
+                                     dtype=var.dtype.base_dtype),
+                            trainable=False,
+                            collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                            name=var.op.name + "/accumulator")
+                for _, var in grads]
+        if self.accumulator_device is None:
+            accumulators = create_accumulators()
+        else:
+            with tf.device(self.accumulator_device):
+                accumulators = create_accumulators()
+        self.accumulate_op = tf.group(*[
+            tf.assign_add(acc, grad)
+            for acc, (grad, _) in zip(accumulators, grads)])
+
+        # read_value() creates the read inside the control dependencies, the
+        # implicit conversion of a ref variable would reuse a snapshot that is
+        # not ordered after the last assign_add
+        with tf.control_dependencies([self.accumulate_op]):
+            apply_gradient_op = opt.apply_gradients(
+                [(acc.read_value() / self.accumulate_steps, var)
+                 for acc, (_, var) in zip(accumulators, grads)],
+                global_step=global_step)
+        with tf.control_dependencies([apply_gradient_op]):
+            train_op = tf.group(*[
+                tf.assign(acc, tf.zeros_like(acc)) for acc in accumulators])
+        return train_op
+
+    def trainable_variables(self):
+        """The trainable variables outside of `freeze_scopes`
+
+        The gradients are only computed for these, so the backward pass does
+        not reach the layers below the lowest trainable one at all.
+        """
+        variables = tf.trainable_variables()
+        if not self.freeze_scopes:
+            return variables
+
+        def in_scope(var, scope):
+            scope = scope.rstrip("/")
+            return var.op.name == scope or var.op.name.startswith(scope + "/")
+
+        train_vars, frozen_vars = [], []
+        for var in variables:
+            if any(in_scope(var, scope) for scope in self.freeze_scopes):
+                frozen_vars.append(var)
+            else:
+                train_vars.append(var)
+        for scope in self.freeze_scopes:
+            if not any(in_scope(var, scope) for var in frozen_vars):
+                raise ValueError("no trainable variable in the freeze scope",
+                                 scope)
+        if not train_vars:
+            raise ValueError("`freeze_scopes` freeze every trainable variable")
+
+        def num_params(var_list):
+            return sum(int(np.prod(var.get_shape().as_list()))
+                       for var in var_list)
+        print("%s: freeze %d variables (%d parameters), train %d variables "
+              "(%d parameters)" % (datetime.now(), len(frozen_vars),
+                                   num_params(frozen_vars), len(train_vars),
+                                   num_params(train_vars)))
+        sys.stdout.flush()
+        return train_vars
+
+    def train_op_for_step(self, step):
+        """The op to run at `step`, every K-th step updates the parameters"""
+        if self.accumulate_op is None or (step + 1) % self.accumulate_steps == 0:
+            return self.train_op
+        return self.accumulate_op
+
+    def build_inputs(self, dtypes, shapes):
+        """Create the input tensors of the graph according to `feed_mode`
+
+        Args:
+          dtypes: the dtypes of the tensors returned by `dataset.batch()`
+          shapes: the shapes of these tensors, unknown dimensions may be None
+        Returns:
+          inputs: list of tensors to build the model on. Without a dataset
+          (e.g. for prediction) these are always plain placeholders.
+        """
+        shapes = [tf.TensorShape(shape) for shape in shapes]
+
+        if self.feed_mode == "dataset" and self.dataset is not None:
+            dataset = tf.data.Dataset.from_generator(
+                self._generate_batches, tuple(dtypes), tuple(shapes))
+            dataset = dataset.prefetch(self.prefetch_size)
+            iterator = dataset.make_one_shot_iterator()
+            return list(iterator.get_next())
+
+        self.input_placeholders = [
+            tf.placeholder(dtype, shape) for dtype, shape in zip(dtypes, shapes)]
+
+        if self.feed_mode == "staging" and self.dataset is not None:
+            area = StagingArea(dtypes=dtypes, shapes=shapes)
+            self.stage_op = area.put(self.input_placeholders)
+            inputs = area.get()
+            for tensor, shape in zip(inputs, shapes):
+                tensor.set_shape(shape)
+            return list(inputs)
+
+        return list(self.input_placeholders)
+
+    def _generate_batches(self):
+        while True:
+            yield tuple(self.dataset.batch())
+
+    def next_feed(self):
+        """Fetch the next batch from the dataset as a feed_dict
+
+        Returns None in `dataset` mode, where TensorFlow pulls the batches.
+        """
+        if self.input_placeholders is None:
+            return None
+        start_time = time.time()
+        batch = self.dataset.batch()
+        data_time = time.time()
+        # convert here, otherwise sess.run converts and it counts as compute
+        batch = [np.ascontiguousarray(value, dtype=placeholder.dtype.as_numpy_dtype)
+                 for placeholder, value in zip(self.input_placeholders, batch)]
+        feed_time = time.time()
+        self.timings["data_wait"].append(data_time - start_time)
+        self.timings["feed"].append(feed_time - data_time)
+        return dict(zip(self.input_placeholders, batch))
+
+    def start_inputs(self, sess):
+        """Stage the first batch before the training loop in `staging` mode"""
+        if self.stage_op is not None:
+            sess.run(self.stage_op, feed_dict=self.next_feed())
+
+    def run_step(self, sess, fetches, feed_dict):
+        """Run `fetches` on the batch consumed by this step
+
+        In `staging` mode the batch given by `feed_dict` is put into the
+        staging area in the same run, so it is transferred while the
+        previously staged batch is being computed.
+        """
+        start_time = time.time()
+        if self.stage_op is None:
+            results = sess.run(fetches, feed_dict=feed_dict)
+        else:
+            results = sess.run([fetches, self.stage_op], feed_dict=feed_dict)[0]
+        self.timings["compute"].append(time.time() - start_time)
+        return results
+
+    def write_timings(self, summary_writer, step):
+        """Emit the mean step times since the last call as TensorBoard scalars
+
+        Returns:
+          dict of name to the mean time in seconds
+        """
+        means = {}
+        for name in TIMINGS:
+            values = self.timings[name]
+            means[name] = sum(values) / len(values) if values else 0.0
+            self.timings[name] = []
+        summary = tf.Summary(value=[
+            tf.Summary.Value(tag="time/" + name, simple_value=means[name])
+            for name in TIMINGS])
+        summary_writer.add_summary(summary, step)
+        return means
+
+    def build_saver(self, var_list=None, max_to_keep=3):
+        """Create the saver for the training checkpoints
+
+        Call it after the graph is built, `save_checkpoint` and
+        `close_saver` accept both kinds of savers.
+        """
+        if self.checkpoint_mode == "async":
+            return AsyncCheckpointer(
+                var_list, max_to_keep=max_to_keep,
+                max_in_flight=self.max_checkpoints_in_flight)
+        return tf.train.Saver(var_list, max_to_keep=max_to_keep)
+
+    def save_checkpoint(self, sess, saver, save_path, global_step=None):
+        """Save a checkpoint and report how long the training loop waited"""
+        start_time = time.time()
+        saver.save(sess, save_path, global_step=global_step)
+        duration = time.time() - start_time
+        if isinstance(saver, AsyncCheckpointer):
+            format_str = '%s: checkpoint step %s snapshot in %.3f sec'
+        else:
+            format_str = '%s: checkpoint step %s written in %.3f sec'
+        print(format_str % (datetime.now(), global_step, duration))
+        sys.stdout.flush()
+
+    def close_saver(self, saver):
+        """Wait for the checkpoints still written in the background"""
+        if isinstance(saver, AsyncCheckpointer):
+            saver.close()
@@ -17,6 +17,8 @@ import tensorflow as tf
 
 from eagle.brain.solver.solver import Solver
 
+TRAIN_MODES = ("full", "heads")
+
 
 class SSDSolver(Solver):
     def __init__(self, dataset, net, common_params, solver_params):
@@ -36,10 +38,22 @@ class SSDSolver(Solver):
         self.train_dir = str(solver_params['train_dir'])
         self.max_iterators = int(solver_params['max_iterators'])
         self.pretrain_path = str(solver_params['pretrain_model_path'])
+        # full:  训练整个网络，输入为图像
+        # heads: backbone冻结，只用特征缓存(FeatureCacheDataSet)训练预测层
+        self.train_mode = str(solver_params.get('train_mode', "full"))
+        if self.train_mode not in TRAIN_MODES:
+            raise ValueError(
+                "Unexpected value for `train_mode`. "
+                "Supported values are %s." % ", ".join(TRAIN_MODES))
 
         self.dataset = dataset
         self.net = net
 
+        # summaries and checkpoints, only the chief writes checkpoints when
+        # several replicas are trained together
+        self.summary_dir = self.train_dir
+        self.is_chief = True
+
         # construct graph
         self.build_model()
 
@@ -49,18 +63,24 @@ class SSDSolver(Solver):
             beta1=self.beta_1,
             beta2=self.beta_2,
             epsilon=self.epsilon)
-        grads = opt.compute_gradients(self.total_loss)
-        apply_gradient_op = opt.apply_gradients(grads,
-                                                global_step=self.global_step)
+        apply_gradient_op = self.build_train_op(
+            opt, self.total_loss, self.global_step)
         return apply_gradient_op
 
     def build_model(self):
         self.global_step = tf.Variable(0, trainable=False)
-        self.images = tf.placeholder(
-            tf.float32,
-            shape=(self.batch_size, self.height, self.width, 3))
-        model_spec = self.net.inference(self.images)
+        if self.train_mode == "heads":
+            model_spec = self.build_heads_model()
+        else:
+            # the label shape depends on the predictor layers of the net, it
+            # is fixed after the inference graph has been built
+            self.images, self.labels = self.build_inputs(
+                dtypes=[tf.float32, tf.float32],
+                shapes=[(self.batch_size, self.height, self.width, 3),
+                        (self.batch_size, None, None)])
+            model_spec = self.net.inference(self.images)
         self.predicts = model_spec["predictions"]
+        self.anchors = model_spec["anchors"]
         predict_shape = model_spec["predictions"].get_shape().as_list()
         boxes_num = predict_shape[1]
         encode_length = predict_shape[2]
@@ -74,11 +94,11 @@ class SSDSolver(Solver):
         [32,  3,  3, 4, 8]
         [32,  1,  1, 4, 8]
         ==> 37^2*4 + 18^2*6 + 9^2*6 + 5^2*6 + 3^2*6 + 1^2*4 = 8096
+        The anchors are held once in model_spec["anchors"], so both the
+        predictions and the labels are (batch, 8096, num_classes + 4)
         '''
 
-        self.labels = tf.placeholder(
-            tf.float32,
-            shape=(self.batch_size, boxes_num, encode_length))
+        self.labels.set_shape((self.batch_size, boxes_num, encode_length))
 
         self.total_loss = self.net.loss(y_true=self.labels,
                                         y_pred=self.predicts)
@@ -86,53 +106,105 @@ class SSDSolver(Solver):
         tf.summary.scalar('loss', self.total_loss)
         self.train_op = self._train()
 
-    def solve(self):
-        saver = tf.train.Saver(max_to_keep=3)
-
-        init = tf.global_variables_initializer()
-        summary_op = tf.summary.merge_all()
+    def build_heads_model(self):
+        """Build the predictor layers on the cached backbone features
+
+        The backbone is still built on an image placeholder that is never fed,
+        so its variables are restored from `pretrain_model_path` and saved
+        together with the heads, the checkpoints stay complete models.
+        The backbone gets no gradients, the loss does not depend on it.
+        """
+        if not hasattr(self.net, "backbone"):
+            raise ValueError("train_mode heads needs a net with "
+                             "backbone() and heads()", type(self.net).__name__)
+        layer_names = list(self.net.FEATURE_LAYERS)
+        if list(self.dataset.layer_names) != layer_names:
+            raise ValueError("the feature cache does not fit the net",
+                             self.dataset.layer_names)
+        if self.dataset.meta.get("pretrain_model_path") != self.pretrain_path:
+            print("warning: the feature cache was built from %s, "
+                  "the backbone is restored from %s" % (
+                      self.dataset.meta.get("pretrain_model_path"),
+                      self.pretrain_path))
 
+        self.images = tf.placeholder(
+            tf.float32, (self.batch_size, self.height, self.width, 3),
+            name="images")
+        backbone = self.net.backbone(self.images)
+        shapes = [(self.batch_size,) + tuple(shape)
+                  for shape in self.dataset.feature_shapes]
+        for name, shape in zip(layer_names, shapes):
+            if backbone[name].get_shape().as_list() != list(shape):
+                raise ValueError("the cached %s does not fit the net" % name,
+                                 shape)
+
+        inputs = self.build_inputs(
+            dtypes=[tf.float32] * (len(shapes) + 1),
+            shapes=shapes + [(self.batch_size, None, None)])
+        self.labels = inputs[-1]
+        return self.net.heads(dict(zip(layer_names, inputs[:-1])))
+
+    def create_session(self, init, saver):
         sess = tf.Session()
         sess.run(init)
         if self.pretrain_path != "None":
             saver.restore(sess, self.pretrain_path)
+        return sess
+
+    def close_session(self, sess):
+        sess.close()
+
+    def solve(self):
+        saver = self.build_saver(max_to_keep=3)
+
+        # the gradient accumulators are local variables
+        init = tf.group(tf.global_variables_initializer(),
+                        tf.local_variables_initializer())
+        summary_op = tf.summary.merge_all()
+
+        sess = self.create_session(init, saver)
 
-        summary_writer = tf.summary.FileWriter(self.train_dir, sess.graph)
+        summary_writer = tf.summary.FileWriter(self.summary_dir, sess.graph)
+        self.start_inputs(sess)
 
         for step in range(self.max_iterators):
             start_time = time.time()
-            np_images, np_labels = self.dataset.batch()
+            feed_dict = self.next_feed()
 
-            _, loss_value = sess.run(
-                [self.train_op, self.total_loss],
-                feed_dict={
-                    self.images: np_images,
-                    self.labels: np_labels
-                })
+            fetches = [self.train_op_for_step(step), self.total_loss]
+            if step % 1000 == 0:
+                # 训练步骤的前向计算同时产生summary，不再额外前向一次
+                fetches.append(summary_op)
+            results = self.run_step(sess, fetches, feed_dict)
+            loss_value = results[1]
 
             duration = time.time() - start_time
 
             assert not np.isnan(loss_value), 'Model diverged with loss = NaN'
 
             if step % 10 == 0:
+                timings = self.write_timings(summary_writer, step)
                 num_examples_per_step = self.dataset.batch_size
                 examples_per_sec = num_examples_per_step / duration
                 sec_per_batch = float(duration)
 
                 format_str = ('%s: step %d, loss = %.2f '
-                              '(%.1f examples/sec; %.3f sec/batch)')
+                              '(%.1f examples/sec; %.3f sec/batch; '
+                              'data_wait %.3f, feed %.3f, compute %.3f)')
                 print(format_str % (datetime.now(), step, loss_value,
-                                    examples_per_sec, sec_per_batch))
+                                    examples_per_sec, sec_per_batch,
+                                    timings["data_wait"], timings["feed"],
+                                    timings["compute"]))
                 sys.stdout.flush()
             if step % 1000 == 0:
-                summary_str = sess.run(summary_op,
-                                       feed_dict={
-                                           self.images: np_images,
-                                           self.labels: np_labels
-                                       })
-                summary_writer.add_summary(summary_str, step)
-            if step % 2000 == 0:
-                saver.save(sess,
-                           self.train_dir + '/model.ckpt', global_step=step)
-        saver.save(sess, self.train_dir + '/model.ckpt', global_step=step)
-        sess.close()
+                summary_writer.add_summary(results[-1], step)
+            if step % 2000 == 0 and self.is_chief:
+                self.save_checkpoint(sess, saver,
+                                     self.train_dir + '/model.ckpt',
+                                     global_step=step)
+        if self.is_chief:
+            self.save_checkpoint(sess, saver,
+                                 self.train_dir + '/model.ckpt',
+                                 global_step=step)
+        self.close_saver(saver)
+        self.close_session(sess)
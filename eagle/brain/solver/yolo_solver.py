@@ -15,6 +15,7 @@ from datetime import datetime
 import numpy as np
 import tensorflow as tf
 
+from datum.models.yolo.yolo_targets import target_depth
 from eagle.brain.solver.solver import Solver
 
 
@@ -27,6 +28,7 @@ class YoloSolver(Solver):
         self.height = int(common_params['image_size'])
         self.batch_size = int(common_params['batch_size'])
         self.max_objects = int(common_params['max_objects_per_image'])
+        self.num_classes = int(common_params['num_classes'])
 
         self.moment = float(solver_params['moment'])
         self.learning_rate = float(solver_params['lr'])
@@ -36,6 +38,11 @@ class YoloSolver(Solver):
 
         self.dataset = dataset
         self.net = net
+        # 数据集在读取线程中计算好每个cell的目标，loss直接使用
+        self.precompute_targets = getattr(dataset, "precompute_targets", False)
+        if self.precompute_targets and dataset.cell_size != net.cell_size:
+            raise ValueError("the cell_size of the dataset targets and the net differ",
+                             dataset.cell_size, net.cell_size)
 
         # construct graph
         self.construct_graph()
@@ -54,34 +61,41 @@ class YoloSolver(Solver):
         """
 
         opt = tf.train.MomentumOptimizer(self.learning_rate, self.moment)
-        grads = opt.compute_gradients(self.total_loss)
-
-        apply_gradient_op = opt.apply_gradients(grads,
-                                                global_step=self.global_step)
+        apply_gradient_op = self.build_train_op(
+            opt, self.total_loss, self.global_step)
 
         return apply_gradient_op
 
     def construct_graph(self):
         # construct graph
         self.global_step = tf.Variable(0, trainable=False)
-        self.images = tf.placeholder(tf.float32, (
-        self.batch_size, self.height, self.width, 3))
-        self.labels = tf.placeholder(tf.float32,
-                                     (self.batch_size, self.max_objects, 5))
-        self.objects_num = tf.placeholder(tf.int32, (self.batch_size))
+        if self.precompute_targets:
+            label_shape = (self.batch_size, self.net.cell_size,
+                           self.net.cell_size, target_depth(self.num_classes))
+        else:
+            label_shape = (self.batch_size, self.max_objects, 5)
+        self.images, self.labels, self.objects_num = self.build_inputs(
+            dtypes=[tf.float32, tf.float32, tf.int32],
+            shapes=[(self.batch_size, self.height, self.width, 3),
+                    label_shape,
+                    (self.batch_size,)])
 
         self.predicts = self.net.inference(self.images)
-        self.total_loss, self.nilboy = self.net.loss(self.predicts, self.labels,
-                                                     self.objects_num)
+        self.total_loss, self.nilboy = self.net.loss(
+            self.predicts, self.labels, self.objects_num,
+            precomputed_targets=self.precompute_targets)
 
         tf.summary.scalar('loss', self.total_loss)
         self.train_op = self._train()
 
     def solve(self):
         saver_pretrain = tf.train.Saver(self.net.pretrained_collection)
-        saver_train = tf.train.Saver(self.net.trainable_collection, max_to_keep=3)
+        saver_train = self.build_saver(self.net.trainable_collection,
+                                       max_to_keep=3)
 
-        init = tf.global_variables_initializer()
+        # the gradient accumulators are local variables
+        init = tf.group(tf.global_variables_initializer(),
+                        tf.local_variables_initializer())
 
         summary_op = tf.summary.merge_all()
 
@@ -91,40 +105,42 @@ class YoloSolver(Solver):
         saver_pretrain.restore(sess, self.pretrain_path)
 
         summary_writer = tf.summary.FileWriter(self.train_dir, sess.graph)
+        self.start_inputs(sess)
 
         for step in range(self.max_iterators):
             start_time = time.time()
-            np_images, np_labels, np_objects_num = self.dataset.batch()
-
-            _, loss_value, nilboy = sess.run(
-                [self.train_op, self.total_loss, self.nilboy],
-                feed_dict={self.images: np_images, self.labels: np_labels,
-                           self.objects_num: np_objects_num})
-            # loss_value, nilboy = sess.run([self.total_loss, self.nilboy], feed_dict={self.images: np_images, self.labels: np_labels, self.objects_num: np_objects_num})
+            feed_dict = self.next_feed()
 
+            fetches = [self.train_op_for_step(step), self.total_loss, self.nilboy]
+            if step % 1000 == 0:
+                # 训练步骤的前向计算同时产生summary，不再额外前向一次
+                fetches.append(summary_op)
+            results = self.run_step(sess, fetches, feed_dict)
+            loss_value = results[1]
 
             duration = time.time() - start_time
 
             assert not np.isnan(loss_value), 'Model diverged with loss = NaN'
 
             if step % 10 == 0:
+                timings = self.write_timings(summary_writer, step)
                 num_examples_per_step = self.dataset.batch_size
                 examples_per_sec = num_examples_per_step / duration
                 sec_per_batch = float(duration)
 
                 format_str = ('%s: step %d, loss = %.2f '
-                              '(%.1f examples/sec; %.3f sec/batch)')
+                              '(%.1f examples/sec; %.3f sec/batch; '
+                              'data_wait %.3f, feed %.3f, compute %.3f)')
                 print(format_str % (datetime.now(), step, loss_value,
-                                    examples_per_sec, sec_per_batch))
+                                    examples_per_sec, sec_per_batch,
+                                    timings["data_wait"], timings["feed"],
+                                    timings["compute"]))
                 sys.stdout.flush()
             if step % 1000 == 0:
-                summary_str = sess.run(summary_op,
-                                       feed_dict={self.images: np_images,
-                                                  self.labels: np_labels,
-                                                  self.objects_num: np_objects_num})
-                summary_writer.add_summary(summary_str, step)
+                summary_writer.add_summary(results[-1], step)
             if step % 5000 == 0:
-                saver_train.save(sess,
-                                 self.train_dir + '/model.ckpt',
-                                 global_step=step)
+                self.save_checkpoint(sess, saver_train,
+                                     self.train_dir + '/model.ckpt',
+                                     global_step=step)
+        self.close_saver(saver_train)
         sess.close()
@@ -16,6 +16,7 @@ import numpy as np
 import tensorflow as tf
 
 from eagle.brain.solver.solver import Solver
+from eagle.brain.yolo.decoder import YoloDecoder, decode_params
 
 
 class YoloUSolver(Solver):
@@ -36,6 +37,9 @@ class YoloUSolver(Solver):
 
         self.dataset = dataset
         self.net = net
+        self.decoder = YoloDecoder(int(common_params['num_classes']),
+                                   net.boxes_per_cell, self.height, self.width,
+                                   **decode_params(solver_params))
 
         # construct graph
         self.construct_graph()
@@ -54,28 +58,25 @@ class YoloUSolver(Solver):
         """
 
         opt = tf.train.MomentumOptimizer(self.learning_rate, self.moment)
-        grads = opt.compute_gradients(self.total_loss)
-
-        apply_gradient_op = opt.apply_gradients(grads,
-                                                global_step=self.global_step)
+        apply_gradient_op = self.build_train_op(
+            opt, self.total_loss, self.global_step)
 
         return apply_gradient_op
 
     def construct_graph(self):
         # construct graph
         self.global_step = tf.Variable(0, trainable=False)
-        self.images = tf.placeholder(tf.float32, (
-        self.batch_size, self.height, self.width, 3))
-        self.labels = tf.placeholder(tf.float32,
-                                     (self.batch_size, self.max_objects, 5))
-        self.objects_num = tf.placeholder(tf.int32, (self.batch_size))
+        self.images, self.labels, self.objects_num = self.build_inputs(
+            dtypes=[tf.float32, tf.float32, tf.int32],
+            shapes=[(self.batch_size, self.height, self.width, 3),
+                    (self.batch_size, self.max_objects, 5),
+                    (self.batch_size,)])
 
         self.predicts = self.net.inference(self.images)
 
-        self.net.set_cell_size(grid_size=9)
+        # 损失的格子大小取自各自输出的形状
         total_loss_g9, nilboy_g9 = self.net.loss(
             self.predicts["predicts_g9"], self.labels, self.objects_num)
-        self.net.set_cell_size(grid_size=15)
         total_loss_g15, nilboy_g15 = self.net.loss(
             self.predicts["predicts_g15"], self.labels, self.objects_num)
 
@@ -87,9 +88,11 @@ class YoloUSolver(Solver):
 
     def solve(self):
         saver_pretrain = tf.train.Saver(max_to_keep=3)
-        saver_train = tf.train.Saver(max_to_keep=3)
+        saver_train = self.build_saver(max_to_keep=3)
 
-        init = tf.global_variables_initializer()
+        # the gradient accumulators are local variables
+        init = tf.group(tf.global_variables_initializer(),
+                        tf.local_variables_initializer())
 
         summary_op = tf.summary.merge_all()
 
@@ -100,87 +103,45 @@ class YoloUSolver(Solver):
             saver_pretrain.restore(sess, self.pretrain_path)
 
         summary_writer = tf.summary.FileWriter(self.train_dir, sess.graph)
+        self.start_inputs(sess)
 
         for step in range(self.max_iterators):
             start_time = time.time()
-            np_images, np_labels, np_objects_num = self.dataset.batch()
+            feed_dict = self.next_feed()
 
-            _, loss_value = sess.run(
-                [self.train_op, self.total_loss],
-                feed_dict={
-                    self.images: np_images,
-                    self.labels: np_labels,
-                    self.objects_num: np_objects_num
-                })
+            fetches = [self.train_op_for_step(step), self.total_loss]
+            if step % 1000 == 0:
+                # 训练步骤的前向计算同时产生summary，不再额外前向一次
+                fetches.append(summary_op)
+            results = self.run_step(sess, fetches, feed_dict)
+            loss_value = results[1]
 
             duration = time.time() - start_time
 
             assert not np.isnan(loss_value), 'Model diverged with loss = NaN'
 
             if step % 1 == 0:
+                timings = self.write_timings(summary_writer, step)
                 num_examples_per_step = self.dataset.batch_size
                 examples_per_sec = num_examples_per_step / duration
                 sec_per_batch = float(duration)
 
                 format_str = ('%s: step %d, loss = %.2f '
-                              '(%.1f examples/sec; %.3f sec/batch)')
+                              '(%.1f examples/sec; %.3f sec/batch; '
+                              'data_wait %.3f, feed %.3f, compute %.3f)')
                 print(format_str % (datetime.now(), step, loss_value,
-                                    examples_per_sec, sec_per_batch))
+                                    examples_per_sec, sec_per_batch,
+                                    timings["data_wait"], timings["feed"],
+                                    timings["compute"]))
                 sys.stdout.flush()
             if step % 1000 == 0:
-                summary_str = sess.run(
-                    summary_op,
-                    feed_dict={
-                        self.images: np_images,
-                        self.labels: np_labels,
-                        self.objects_num: np_objects_num
-                    })
-                summary_writer.add_summary(summary_str, step)
+                summary_writer.add_summary(results[-1], step)
             if step % 5000 == 0:
-                saver_train.save(sess,
-                                 self.train_dir + '/model.ckpt')
+                self.save_checkpoint(sess, saver_train,
+                                     self.train_dir + '/model.ckpt')
+        self.close_saver(saver_train)
         sess.close()
 
-    def process_predicts(self, predicts, cell_size):
-        p_classes = predicts[0, :, :, 0:1]
-        C = predicts[0, :, :, 1:3]
-        coordinate = predicts[0, :, :, 3:]
-
-        p_classes = np.reshape(p_classes, (cell_size, cell_size, 1, 1))
-        C = np.reshape(C, (cell_size, cell_size, 2, 1))
-
-        P = C * p_classes
-
-        # print P[5,1, 0, :]
-
-        index = np.argmax(P)
-        index = np.unravel_index(index, P.shape)
-        class_num = index[3]
-
-        coordinate = np.reshape(coordinate, (cell_size, cell_size, 2, 4))
-        max_coordinate = coordinate[index[0], index[1], index[2], :]
-
-        xcenter = max_coordinate[0]
-        ycenter = max_coordinate[1]
-        w = max_coordinate[2]
-        h = max_coordinate[3]
-
-        xcenter = (index[1] + xcenter) * (self.width / cell_size)
-        ycenter = (index[0] + ycenter) * (self.height / cell_size)
-
-        w = w * self.width
-        h = h * self.height
-
-        xmin = xcenter - w / 2.0
-        ymin = ycenter - h / 2.0
-
-        xmax = xmin + w
-        ymax = ymin + h
-
-        xmin = max(0, xmin)
-        xmax = max(0, xmax)
-        return xmin, ymin, xmax, ymax, class_num
-
     def model_predict(self, single_image):
         saver_pretrain = tf.train.Saver(max_to_keep=3)
 
@@ -201,10 +162,9 @@ class YoloUSolver(Solver):
 
         duration = time.time() - start_time
 
-        xmin, ymin, xmax, ymax, class_num = self.process_predicts(
-            predics_info["predicts_g9"], cell_size=9)
-        # xmin, ymin, xmax, ymax, class_num = self.process_predicts(
-        #     predics_info["predicts_g15"])
+        # 两个尺度的所有格子、所有box一起解码，合并后做一次按类别的NMS
+        detections = self.decoder([predics_info["predicts_g9"],
+                                   predics_info["predicts_g15"]])
         sess.close()
 
-        return (xmin, ymin, xmax, ymax, class_num)
+        return detections
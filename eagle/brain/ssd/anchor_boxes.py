@@ -15,7 +15,8 @@ import tensorflow as tf
 from keras.engine.topology import Layer
 from keras.engine.topology import InputSpec
 
-from eagle.brain.ssd.box_encode_decode_utils import convert_coordinates
+from eagle.brain.ssd.box_encode_decode_utils import generate_anchor_boxes
+from eagle.brain.ssd.box_encode_decode_utils import count_anchor_boxes
 
 
 class AnchorBoxes(Layer):
@@ -34,7 +35,8 @@ class AnchorBoxes(Layer):
                  aspect_ratios=[0.5, 1.0, 2.0],
                  two_boxes_for_ar1=True,
                  variances=[1.0, 1.0, 1.0, 1.0],
-                 coords='centroids', normalize_coords=False, **kwargs):
+                 coords='centroids', normalize_coords=False, box_mask=None,
+                 **kwargs):
         '''
         this_scale (float): A float in [0, 1], the scaling factor for the size of the generated anchor boxes
                 as a fraction of the shorter side of the input image.
@@ -56,6 +58,8 @@ class AnchorBoxes(Layer):
                 `(xmin, xmax, ymin, ymax)`. Defaults to 'centroids'.
         normalize_coords (bool, optional): Set to `True` if the model uses relative instead of absolute coordinates,
                 i.e. if the model predicts box coordinates within [0,1] instead of absolute coordinates. Defaults to `False`.
+        box_mask (list, optional): One 0/1 entry per box of a cell in the order of `anchor_box_shapes()`, only the
+                boxes with 1 are generated. Defaults to `None`, all boxes.
         '''
         if (this_scale < 0) or (this_scale > 1) or (next_scale < 0):
             raise ValueError("this_scale or next_scale must be in [0, 1]")
@@ -69,12 +73,10 @@ class AnchorBoxes(Layer):
         self.variances = variances
         self.coords = coords
         self.normalize_coords = normalize_coords
-        
+        self.box_mask = None if box_mask is None else [bool(m) for m in box_mask]
+
         # Compute the number of boxes per cell
-        if (1 in aspect_ratios) & two_boxes_for_ar1:
-            self.n_boxes = len(aspect_ratios) + 1
-        else:
-            self.n_boxes = len(aspect_ratios)
+        self.n_boxes = count_anchor_boxes(aspect_ratios, two_boxes_for_ar1, box_mask)
 
         super(AnchorBoxes, self).__init__(**kwargs)
 
@@ -83,74 +85,21 @@ class AnchorBoxes(Layer):
         super(AnchorBoxes, self).build(input_shape)
 
     def call(self, x, mask=None):
-        # Compute box width and height for each aspect ratio
-        # The shorter side of the image will be used to compute `w` and `h` using `scale` and `aspect_ratios`.
-        self.aspect_ratios = np.sort(self.aspect_ratios)
-        size = min(self.img_height, self.img_width)
-        # Compute the box widths and and heights for all aspect ratios
-        wh_list = []
-        for ar in self.aspect_ratios:
-            if (ar == 1) & self.two_boxes_for_ar1:
-                # Compute the regular default box for aspect ratio 1 and...
-                w = self.this_scale * size * np.sqrt(ar)
-                h = self.this_scale * size / np.sqrt(ar)
-                wh_list.append((w, h))
-                # ...also compute one slightly larger version using the geometric mean of this scale value and the next
-                w = np.sqrt(self.this_scale * self.next_scale) * size * np.sqrt(ar)
-                h = np.sqrt(self.this_scale * self.next_scale) * size / np.sqrt(ar)
-                wh_list.append((w, h))
-            else:
-                w = self.this_scale * size * np.sqrt(ar)
-                h = self.this_scale * size / np.sqrt(ar)
-                wh_list.append((w, h))
-        wh_list = np.array(wh_list)
-
         # We need the shape of the input tensor
         batch_size, feature_map_height, feature_map_width, feature_map_channels = x.get_shape().as_list()
 
-        # Compute the grid of box center points. They are identical for all aspect ratios
-        cell_width = self.img_width / feature_map_width
-        cell_height = self.img_height / feature_map_height
-        cx = np.linspace(cell_width/2, self.img_width-cell_width/2, feature_map_width)
-        cy = np.linspace(cell_height/2, self.img_height-cell_height/2, feature_map_height)
-        cx_grid, cy_grid = np.meshgrid(cx, cy)
-        # This is necessary for np.tile() to do what we want further down
-        cx_grid = np.expand_dims(cx_grid, -1)
-        # This is necessary for np.tile() to do what we want further down
-        cy_grid = np.expand_dims(cy_grid, -1)
-
-        # Create a 4D tensor template of shape `(feature_map_height, feature_map_width, n_boxes, 4)`
-        # where the last dimension will contain `(cx, cy, w, h)`
-        boxes_tensor = np.zeros((feature_map_height, feature_map_width, self.n_boxes, 4))
-
-        boxes_tensor[:, :, :, 0] = np.tile(cx_grid, (1, 1, self.n_boxes)) # Set cx
-        boxes_tensor[:, :, :, 1] = np.tile(cy_grid, (1, 1, self.n_boxes)) # Set cy
-        boxes_tensor[:, :, :, 2] = wh_list[:, 0] # Set w
-        boxes_tensor[:, :, :, 3] = wh_list[:, 1] # Set h
-
-        # Convert `(cx, cy, w, h)` to `(xmin, xmax, ymin, ymax)`
-        boxes_tensor = convert_coordinates(
-            boxes_tensor, start_index=0, conversion='centroids2minmax')
-
-        # `normalize_coords` is enabled, normalize the coordinates to be within [0,1]
-        if self.normalize_coords:
-            boxes_tensor[:, :, :, :2] /= self.img_width
-            boxes_tensor[:, :, :, 2:] /= self.img_height
-
-        if self.coords == 'centroids':
-            # TODO: Implement box limiting directly for `(cx, cy, w, h)` so that we don't have to unnecessarily convert back and forth
-            # Convert `(xmin, xmax, ymin, ymax)` back to `(cx, cy, w, h)`
-            boxes_tensor = convert_coordinates(
-                boxes_tensor, start_index=0, conversion='minmax2centroids')
-
-        # 4: Create a tensor to contain the variances and append it to `boxes_tensor`. This tensor has the same shape
-        #    as `boxes_tensor` and simply contains the same 4 variance values for every position in the last axis.
-        # Has shape `(feature_map_height, feature_map_width, n_boxes, 4)`
-        variances_tensor = np.zeros_like(boxes_tensor)
-        # Long live broadcasting
-        variances_tensor += self.variances
-        # Now `boxes_tensor` becomes a tensor of shape `(feature_map_height, feature_map_width, n_boxes, 8)`
-        boxes_tensor = np.concatenate((boxes_tensor, variances_tensor), axis=-1)
+        # Has shape `(feature_map_height, feature_map_width, n_boxes, 8)`
+        boxes_tensor = generate_anchor_boxes(
+            self.img_height, self.img_width,
+            feature_map_size=(feature_map_height, feature_map_width),
+            this_scale=self.this_scale,
+            next_scale=self.next_scale,
+            aspect_ratios=self.aspect_ratios,
+            two_boxes_for_ar1=self.two_boxes_for_ar1,
+            variances=self.variances,
+            coords=self.coords,
+            normalize_coords=self.normalize_coords,
+            box_mask=self.box_mask)
 
         # Now prepend one dimension to `boxes_tensor` to account for the batch size and tile it along
         # The result will be a 5D tensor of shape `(batch_size, feature_map_height, feature_map_width, n_boxes, 8)`
@@ -175,7 +124,8 @@ class AnchorBoxes(Layer):
             'two_boxes_for_ar1': self.two_boxes_for_ar1,
             'variances': list(self.variances),
             'coords': self.coords,
-            'normalize_coords': self.normalize_coords
+            'normalize_coords': self.normalize_coords,
+            'box_mask': self.box_mask
         }
         base_config = super(AnchorBoxes, self).get_config()
         return dict(list(base_config.items()) + list(config.items()))
@@ -16,6 +16,8 @@ Includes:
  * Class to encode targets for SSD training
 """
 
+import json
+
 import numpy as np
 
 
@@ -160,6 +162,194 @@ def _greedy_nms2(predictions, iou_threshold=0.45, coords='minmax'):
         boxes_left = boxes_left[similarities <= iou_threshold] # ...so that we can remove the ones that overlap too much with the maximum box
     return np.array(maxima)
 
+def class_aware_nms(predictions, iou_threshold=0.45, top_k='all'):
+    '''
+    Greedy non-maximum suppression where only boxes of the same class suppress each other.
+    The boxes are shifted apart by their class ID so that boxes of different classes never
+    overlap, then a single greedy pass over the boxes sorted by score suppresses the remaining
+    boxes against every kept box at once.
+    Arguments:
+        predictions (array): A 2D Numpy array of shape `(k, 6)` in the Others
+            `[class_id, score, xmin, xmax, ymin, ymax]`.
+        iou_threshold (float, optional): Boxes with a Jaccard similarity of greater than `iou_threshold`
+            with a kept box of the same class are removed. Defaults to 0.45.
+        top_k (int, optional): 'all' or the maximal number of boxes to keep. Defaults to 'all'.
+    Returns:
+        The kept predictions sorted by descending score, in the same Others as the input.
+    '''
+    if predictions.shape[0] == 0:
+        return predictions
+    predictions = predictions[np.argsort(-predictions[:,1], kind='mergesort')]
+    coords = predictions[:,2:].astype(np.float64)
+    coords += ((coords.max() - coords.min() + 1) * predictions[:,0])[:, np.newaxis] # Boxes of different classes are moved apart
+    areas = (coords[:,1] - coords[:,0]) * (coords[:,3] - coords[:,2])
+    suppressed = np.zeros(predictions.shape[0], dtype=np.bool_)
+    keep = []
+    for i in range(predictions.shape[0]):
+        if suppressed[i]: continue
+        keep.append(i)
+        if top_k != 'all' and len(keep) == top_k: break
+        rest = coords[i+1:]
+        intersection = np.maximum(0, np.minimum(rest[:,1], coords[i,1]) - np.maximum(rest[:,0], coords[i,0])) * np.maximum(0, np.minimum(rest[:,3], coords[i,3]) - np.maximum(rest[:,2], coords[i,2]))
+        union = areas[i] + areas[i+1:] - intersection
+        suppressed[i+1:] |= intersection > iou_threshold * np.maximum(union, 1e-10)
+    return predictions[keep]
+
+def _split_anchors(y_pred, anchors=None):
+    '''
+    Locate the anchor boxes and variances that belong to `y_pred`.
+    Returns:
+        The index in the last axis of `y_pred` where the 4 coordinate offsets end, and the anchor box
+        coordinates and variances, each of which can be broadcast against `y_pred[:,:,:4]`.
+    '''
+    if anchors is None:
+        # The anchors are carried along in the last 8 entries of every box
+        return y_pred.shape[-1] - 8, y_pred[:,:,-8:-4], y_pred[:,:,-4:]
+    if anchors.shape[0] != y_pred.shape[1]:
+        raise ValueError("`anchors` must have one row per box, but has {} rows for {} boxes.".format(anchors.shape[0], y_pred.shape[1]))
+    anchors = np.expand_dims(anchors, axis=0)
+    return y_pred.shape[-1], anchors[:,:,:4], anchors[:,:,4:]
+
+def anchor_box_shapes(aspect_ratios, two_boxes_for_ar1=True):
+    '''
+    The anchor boxes of one cell in the order of `generate_anchor_boxes()`.
+    Returns:
+        A list of `(aspect_ratio, second_box)` tuples, `second_box` is `True` for the slightly
+        larger second box of aspect ratio 1.
+    '''
+    shapes = []
+    for ar in np.sort(aspect_ratios):
+        shapes.append((float(ar), False))
+        if (ar == 1) & two_boxes_for_ar1:
+            shapes.append((float(ar), True))
+    return shapes
+
+def count_anchor_boxes(aspect_ratios, two_boxes_for_ar1=True, box_mask=None):
+    '''
+    The number of anchor boxes per cell of a predictor layer, i.e. the boxes the layer predicts.
+    '''
+    if box_mask is not None:
+        return int(np.sum(np.asarray(box_mask, dtype=bool)))
+    return len(anchor_box_shapes(aspect_ratios, two_boxes_for_ar1))
+
+def parse_anchor_masks(anchor_masks, aspect_ratios_per_layer, two_boxes_for_ar1=True):
+    '''
+    Check the per-layer anchor masks of the config against the aspect ratios.
+    Arguments:
+        anchor_masks (str or list): "None" or a json list with one 0/1 list per predictor layer,
+            one entry per box of `anchor_box_shapes()`, see `datum/models/ssd/anchor_stats.py`.
+        aspect_ratios_per_layer (list): The aspect ratios of every predictor layer.
+        two_boxes_for_ar1 (bool, optional): Whether aspect ratio 1 has a second box.
+    Returns:
+        `None` or a list with one boolean list per predictor layer.
+    '''
+    if isinstance(anchor_masks, str):
+        anchor_masks = None if anchor_masks.strip() == "None" else json.loads(anchor_masks)
+    if anchor_masks is None:
+        return None
+    if len(anchor_masks) != len(aspect_ratios_per_layer):
+        raise ValueError("len(anchor_masks) != len(aspect_ratios_per_layer)")
+    masks = []
+    for box_mask, aspect_ratios in zip(anchor_masks, aspect_ratios_per_layer):
+        n_boxes = len(anchor_box_shapes(aspect_ratios, two_boxes_for_ar1))
+        if len(box_mask) != n_boxes:
+            raise ValueError("anchor mask {} does not fit the {} boxes of the aspect ratios {}".format(
+                box_mask, n_boxes, aspect_ratios))
+        if not any(box_mask):
+            raise ValueError("anchor mask {} removes all boxes of the layer".format(box_mask))
+        masks.append([bool(m) for m in box_mask])
+    return masks
+
+def generate_anchor_boxes(img_height, img_width, feature_map_size,
+                          this_scale, next_scale, aspect_ratios,
+                          two_boxes_for_ar1=True, variances=[1.0, 1.0, 1.0, 1.0],
+                          coords='centroids', normalize_coords=False,
+                          box_mask=None):
+    '''
+    Compute the anchor boxes of one predictor layer.
+    Arguments:
+        img_height (int): The height of the input images.
+        img_width (int): The width of the input images.
+        feature_map_size (tuple): `[feature_map_height, feature_map_width]` of the predictor layer.
+        this_scale (float): The scaling factor for the size of the anchor boxes as a fraction of the
+            shorter side of the input image.
+        next_scale (float): The next larger scaling factor. Only relevant if `two_boxes_for_ar1` is `True`.
+        aspect_ratios (list): The aspect ratios for which anchor boxes are generated.
+        two_boxes_for_ar1 (bool, optional): Whether to generate a second, slightly larger box for aspect ratio 1.
+        variances (list, optional): The 4 variances that are stored along with every anchor box.
+        coords (str, optional): The coordinate Others of the anchor boxes, 'centroids' or 'minmax'.
+        normalize_coords (bool, optional): Whether the coordinates are relative to the image size.
+        box_mask (list, optional): One 0/1 entry per box of a cell in the order of `anchor_box_shapes()`,
+            only the boxes with 1 are generated. Defaults to `None`, all boxes.
+    Returns:
+        A Numpy array of shape `(feature_map_height, feature_map_width, n_boxes, 8)` where the last axis
+        contains the 4 anchor box coordinates followed by the 4 variances. Reshaping it with C-like index
+        order gives the same box order as the reshaped predictor layer.
+    '''
+    # Compute box width and height for each aspect ratio
+    # The shorter side of the image will be used to compute `w` and `h` using `scale` and `aspect_ratios`.
+    aspect_ratios = np.sort(aspect_ratios)
+    size = min(img_height, img_width)
+    wh_list = []
+    for ar in aspect_ratios:
+        if (ar == 1) & two_boxes_for_ar1:
+            # Compute the regular anchor box for aspect ratio 1 and...
+            w = this_scale * size * np.sqrt(ar)
+            h = this_scale * size / np.sqrt(ar)
+            wh_list.append((w, h))
+            # ...also compute one slightly larger version using the geometric mean of this scale value and the next
+            w = np.sqrt(this_scale * next_scale) * size * np.sqrt(ar)
+            h = np.sqrt(this_scale * next_scale) * size / np.sqrt(ar)
+            wh_list.append((w, h))
+        else:
+            w = this_scale * size * np.sqrt(ar)
+            h = this_scale * size / np.sqrt(ar)
+            wh_list.append((w, h))
+    wh_list = np.array(wh_list)
+    if box_mask is not None:
+        if len(box_mask) != len(wh_list):
+            raise ValueError("len(box_mask) == {}, but the layer has {} boxes per cell.".format(
+                len(box_mask), len(wh_list)))
+        wh_list = wh_list[np.asarray(box_mask, dtype=bool)]
+        if len(wh_list) == 0:
+            raise ValueError("box_mask removes all boxes of the layer")
+    n_boxes = len(wh_list)
+
+    # Compute the grid of box center points. They are identical for all aspect ratios
+    feature_map_height, feature_map_width = feature_map_size[0], feature_map_size[1]
+    cell_width = img_width / feature_map_width
+    cell_height = img_height / feature_map_height
+    cx = np.linspace(cell_width/2, img_width-cell_width/2, feature_map_width)
+    cy = np.linspace(cell_height/2, img_height-cell_height/2, feature_map_height)
+    cx_grid, cy_grid = np.meshgrid(cx, cy)
+    cx_grid = np.expand_dims(cx_grid, -1)
+    cy_grid = np.expand_dims(cy_grid, -1)
+
+    # A 4D tensor of shape `(feature_map_height, feature_map_width, n_boxes, 4)`
+    # where the last dimension contains `(cx, cy, w, h)`
+    boxes_tensor = np.zeros((feature_map_height, feature_map_width, n_boxes, 4))
+    boxes_tensor[:, :, :, 0] = np.tile(cx_grid, (1, 1, n_boxes)) # Set cx
+    boxes_tensor[:, :, :, 1] = np.tile(cy_grid, (1, 1, n_boxes)) # Set cy
+    boxes_tensor[:, :, :, 2] = wh_list[:, 0] # Set w
+    boxes_tensor[:, :, :, 3] = wh_list[:, 1] # Set h
+
+    # Convert `(cx, cy, w, h)` to `(xmin, xmax, ymin, ymax)`
+    boxes_tensor = convert_coordinates(boxes_tensor, start_index=0, conversion='centroids2minmax')
+
+    # `normalize_coords` is enabled, normalize the coordinates to be within [0,1]
+    if normalize_coords:
+        boxes_tensor[:, :, :, :2] /= img_width
+        boxes_tensor[:, :, :, 2:] /= img_height
+
+    if coords == 'centroids':
+        # Convert `(xmin, xmax, ymin, ymax)` back to `(cx, cy, w, h)`
+        boxes_tensor = convert_coordinates(boxes_tensor, start_index=0, conversion='minmax2centroids')
+
+    # Append the variances, the result has shape `(feature_map_height, feature_map_width, n_boxes, 8)`
+    variances_tensor = np.zeros_like(boxes_tensor)
+    variances_tensor += variances # Long live broadcasting
+    return np.concatenate((boxes_tensor, variances_tensor), axis=-1)
+
 def decode_y(y_pred,
              confidence_thresh=0.01,
              iou_threshold=0.45,
@@ -167,7 +357,8 @@ def decode_y(y_pred,
              input_coords='centroids',
              normalize_coords=False,
              img_height=None,
-             img_width=None):
+             img_width=None,
+             anchors=None):
     '''
     Convert model prediction output back to a Others that contains only the positive box predictions
     (i.e. the same Others that `enconde_y()` takes as input).
@@ -202,6 +393,9 @@ def decode_y(y_pred,
             coordinates. Requires `img_height` and `img_width` if set to `True`. Defaults to `False`.
         img_height (int, optional): The height of the input images. Only needed if `normalize_coords` is `True`.
         img_width (int, optional): The width of the input images. Only needed if `normalize_coords` is `True`.
+        anchors (array, optional): A Numpy array of shape `(#boxes, 8)` with the 4 anchor box coordinates and
+            the 4 variances of every box. If given, `y_pred` only contains `[classes, 4 predicted coordinate offsets]`
+            and the anchors are looked up by the box index instead of being read from `y_pred`.
     Returns:
         A python list of length `batch_size` where each list element represents the predicted boxes
         for one image and contains a Numpy array of shape `(boxes, 6)` where each row is a box prediction for
@@ -212,19 +406,20 @@ def decode_y(y_pred,
 
     # 1: Convert the box coordinates from the predicted anchor box offsets to predicted absolute coordinates
 
-    y_pred_decoded_raw = np.copy(y_pred[:,:,:-8]) # Slice out the classes and the four offsets, throw away the anchor coordinates and variances, resulting in a tensor of shape `[batch, n_boxes, n_classes + 4 coordinates]`
+    offsets_end, anchor_boxes, variances = _split_anchors(y_pred, anchors)
+    y_pred_decoded_raw = np.copy(y_pred[:,:,:offsets_end]) # Slice out the classes and the four offsets, throw away the anchor coordinates and variances, resulting in a tensor of shape `[batch, n_boxes, n_classes + 4 coordinates]`
 
     if input_coords == 'centroids':
-        y_pred_decoded_raw[:,:,[-2,-1]] = np.exp(y_pred_decoded_raw[:,:,[-2,-1]] * y_pred[:,:,[-2,-1]]) # exp(ln(w(pred)/w(anchor)) / w_variance * w_variance) == w(pred) / w(anchor), exp(ln(h(pred)/h(anchor)) / h_variance * h_variance) == h(pred) / h(anchor)
-        y_pred_decoded_raw[:,:,[-2,-1]] *= y_pred[:,:,[-6,-5]] # (w(pred) / w(anchor)) * w(anchor) == w(pred), (h(pred) / h(anchor)) * h(anchor) == h(pred)
-        y_pred_decoded_raw[:,:,[-4,-3]] *= y_pred[:,:,[-4,-3]] * y_pred[:,:,[-6,-5]] # (delta_cx(pred) / w(anchor) / cx_variance) * cx_variance * w(anchor) == delta_cx(pred), (delta_cy(pred) / h(anchor) / cy_variance) * cy_variance * h(anchor) == delta_cy(pred)
-        y_pred_decoded_raw[:,:,[-4,-3]] += y_pred[:,:,[-8,-7]] # delta_cx(pred) + cx(anchor) == cx(pred), delta_cy(pred) + cy(anchor) == cy(pred)
+        y_pred_decoded_raw[:,:,[-2,-1]] = np.exp(y_pred_decoded_raw[:,:,[-2,-1]] * variances[:,:,[2,3]]) # exp(ln(w(pred)/w(anchor)) / w_variance * w_variance) == w(pred) / w(anchor), exp(ln(h(pred)/h(anchor)) / h_variance * h_variance) == h(pred) / h(anchor)
+        y_pred_decoded_raw[:,:,[-2,-1]] *= anchor_boxes[:,:,[2,3]] # (w(pred) / w(anchor)) * w(anchor) == w(pred), (h(pred) / h(anchor)) * h(anchor) == h(pred)
+        y_pred_decoded_raw[:,:,[-4,-3]] *= variances[:,:,[0,1]] * anchor_boxes[:,:,[2,3]] # (delta_cx(pred) / w(anchor) / cx_variance) * cx_variance * w(anchor) == delta_cx(pred), (delta_cy(pred) / h(anchor) / cy_variance) * cy_variance * h(anchor) == delta_cy(pred)
+        y_pred_decoded_raw[:,:,[-4,-3]] += anchor_boxes[:,:,[0,1]] # delta_cx(pred) + cx(anchor) == cx(pred), delta_cy(pred) + cy(anchor) == cy(pred)
         y_pred_decoded_raw = convert_coordinates(y_pred_decoded_raw, start_index=-4, conversion='centroids2minmax')
     elif input_coords == 'minmax':
-        y_pred_decoded_raw[:,:,-4:] *= y_pred[:,:,-4:] # delta(pred) / size(anchor) / variance * variance == delta(pred) / size(anchor) for all four coordinates, where 'size' refers to w or h, respectively
-        y_pred_decoded_raw[:,:,[-4,-3]] *= np.expand_dims(y_pred[:,:,-7] - y_pred[:,:,-8], axis=-1) # delta_xmin(pred) / w(anchor) * w(anchor) == delta_xmin(pred), delta_xmax(pred) / w(anchor) * w(anchor) == delta_xmax(pred)
-        y_pred_decoded_raw[:,:,[-2,-1]] *= np.expand_dims(y_pred[:,:,-5] - y_pred[:,:,-6], axis=-1) # delta_ymin(pred) / h(anchor) * h(anchor) == delta_ymin(pred), delta_ymax(pred) / h(anchor) * h(anchor) == delta_ymax(pred)
-        y_pred_decoded_raw[:,:,-4:] += y_pred[:,:,-8:-4] # delta(pred) + anchor == pred for all four coordinates
+        y_pred_decoded_raw[:,:,-4:] *= variances # delta(pred) / size(anchor) / variance * variance == delta(pred) / size(anchor) for all four coordinates, where 'size' refers to w or h, respectively
+        y_pred_decoded_raw[:,:,[-4,-3]] *= np.expand_dims(anchor_boxes[:,:,1] - anchor_boxes[:,:,0], axis=-1) # delta_xmin(pred) / w(anchor) * w(anchor) == delta_xmin(pred), delta_xmax(pred) / w(anchor) * w(anchor) == delta_xmax(pred)
+        y_pred_decoded_raw[:,:,[-2,-1]] *= np.expand_dims(anchor_boxes[:,:,3] - anchor_boxes[:,:,2], axis=-1) # delta_ymin(pred) / h(anchor) * h(anchor) == delta_ymin(pred), delta_ymax(pred) / h(anchor) * h(anchor) == delta_ymax(pred)
+        y_pred_decoded_raw[:,:,-4:] += anchor_boxes # delta(pred) + anchor == pred for all four coordinates
     else:
         raise ValueError("Unexpected value for `input_coords`. Supported input coordinate formats are 'minmax' and 'centroids'.")
 
@@ -267,7 +462,8 @@ def decode_y2(y_pred,
               input_coords='centroids',
               normalize_coords=False,
               img_height=None,
-              img_width=None):
+              img_width=None,
+              anchors=None):
     '''
     Convert model prediction output back to a Others that contains only the positive box predictions
     (i.e. the same Others that `enconde_y()` takes as input).
@@ -305,6 +501,9 @@ def decode_y2(y_pred,
             coordinates. Requires `img_height` and `img_width` if set to `True`. Defaults to `False`.
         img_height (int, optional): The height of the input images. Only needed if `normalize_coords` is `True`.
         img_width (int, optional): The width of the input images. Only needed if `normalize_coords` is `True`.
+        anchors (array, optional): A Numpy array of shape `(#boxes, 8)` with the 4 anchor box coordinates and
+            the 4 variances of every box. If given, `y_pred` only contains `[classes, 4 predicted coordinate offsets]`
+            and the anchors are looked up by the box index instead of being read from `y_pred`.
     Returns:
         A python list of length `batch_size` where each list element represents the predicted boxes
         for one image and contains a Numpy array of shape `(boxes, 6)` where each row is a box prediction for
@@ -314,22 +513,23 @@ def decode_y2(y_pred,
         raise ValueError("If relative box coordinates are supposed to be converted to absolute coordinates, the decoder needs the image size in order to decode the predictions, but `img_height == {}` and `img_width == {}`".format(img_height, img_width))
 
     # 1: Convert the classes from one-hot encoding to their class ID
-    y_pred_converted = np.copy(y_pred[:,:,-14:-8]) # Slice out the four offset predictions plus two elements whereto we'll write the class IDs and confidences in the next step
-    y_pred_converted[:,:,0] = np.argmax(y_pred[:,:,:-12], axis=-1) # The indices of the highest confidence values in the one-hot class vectors are the class ID
-    y_pred_converted[:,:,1] = np.amax(y_pred[:,:,:-12], axis=-1) # Store the confidence values themselves, too
+    offsets_end, anchor_boxes, variances = _split_anchors(y_pred, anchors)
+    y_pred_converted = np.copy(y_pred[:,:,offsets_end-6:offsets_end]) # Slice out the four offset predictions plus two elements whereto we'll write the class IDs and confidences in the next step
+    y_pred_converted[:,:,0] = np.argmax(y_pred[:,:,:offsets_end-4], axis=-1) # The indices of the highest confidence values in the one-hot class vectors are the class ID
+    y_pred_converted[:,:,1] = np.amax(y_pred[:,:,:offsets_end-4], axis=-1) # Store the confidence values themselves, too
 
     # 2: Convert the box coordinates from the predicted anchor box offsets to predicted absolute coordinates
     if input_coords == 'centroids':
-        y_pred_converted[:,:,[4,5]] = np.exp(y_pred_converted[:,:,[4,5]] * y_pred[:,:,[-2,-1]]) # exp(ln(w(pred)/w(anchor)) / w_variance * w_variance) == w(pred) / w(anchor), exp(ln(h(pred)/h(anchor)) / h_variance * h_variance) == h(pred) / h(anchor)
-        y_pred_converted[:,:,[4,5]] *= y_pred[:,:,[-6,-5]] # (w(pred) / w(anchor)) * w(anchor) == w(pred), (h(pred) / h(anchor)) * h(anchor) == h(pred)
-        y_pred_converted[:,:,[2,3]] *= y_pred[:,:,[-4,-3]] * y_pred[:,:,[-6,-5]] # (delta_cx(pred) / w(anchor) / cx_variance) * cx_variance * w(anchor) == delta_cx(pred), (delta_cy(pred) / h(anchor) / cy_variance) * cy_variance * h(anchor) == delta_cy(pred)
-        y_pred_converted[:,:,[2,3]] += y_pred[:,:,[-8,-7]] # delta_cx(pred) + cx(anchor) == cx(pred), delta_cy(pred) + cy(anchor) == cy(pred)
+        y_pred_converted[:,:,[4,5]] = np.exp(y_pred_converted[:,:,[4,5]] * variances[:,:,[2,3]]) # exp(ln(w(pred)/w(anchor)) / w_variance * w_variance) == w(pred) / w(anchor), exp(ln(h(pred)/h(anchor)) / h_variance * h_variance) == h(pred) / h(anchor)
+        y_pred_converted[:,:,[4,5]] *= anchor_boxes[:,:,[2,3]] # (w(pred) / w(anchor)) * w(anchor) == w(pred), (h(pred) / h(anchor)) * h(anchor) == h(pred)
+        y_pred_converted[:,:,[2,3]] *= variances[:,:,[0,1]] * anchor_boxes[:,:,[2,3]] # (delta_cx(pred) / w(anchor) / cx_variance) * cx_variance * w(anchor) == delta_cx(pred), (delta_cy(pred) / h(anchor) / cy_variance) * cy_variance * h(anchor) == delta_cy(pred)
+        y_pred_converted[:,:,[2,3]] += anchor_boxes[:,:,[0,1]] # delta_cx(pred) + cx(anchor) == cx(pred), delta_cy(pred) + cy(anchor) == cy(pred)
         y_pred_converted = convert_coordinates(y_pred_converted, start_index=-4, conversion='centroids2minmax')
     elif input_coords == 'minmax':
-        y_pred_converted[:,:,2:] *= y_pred[:,:,-4:] # delta(pred) / size(anchor) / variance * variance == delta(pred) / size(anchor) for all four coordinates, where 'size' refers to w or h, respectively
-        y_pred_converted[:,:,[2,3]] *= np.expand_dims(y_pred[:,:,-7] - y_pred[:,:,-8], axis=-1) # delta_xmin(pred) / w(anchor) * w(anchor) == delta_xmin(pred), delta_xmax(pred) / w(anchor) * w(anchor) == delta_xmax(pred)
-        y_pred_converted[:,:,[4,5]] *= np.expand_dims(y_pred[:,:,-5] - y_pred[:,:,-6], axis=-1) # delta_ymin(pred) / h(anchor) * h(anchor) == delta_ymin(pred), delta_ymax(pred) / h(anchor) * h(anchor) == delta_ymax(pred)
-        y_pred_converted[:,:,2:] += y_pred[:,:,-8:-4] # delta(pred) + anchor == pred for all four coordinates
+        y_pred_converted[:,:,2:] *= variances # delta(pred) / size(anchor) / variance * variance == delta(pred) / size(anchor) for all four coordinates, where 'size' refers to w or h, respectively
+        y_pred_converted[:,:,[2,3]] *= np.expand_dims(anchor_boxes[:,:,1] - anchor_boxes[:,:,0], axis=-1) # delta_xmin(pred) / w(anchor) * w(anchor) == delta_xmin(pred), delta_xmax(pred) / w(anchor) * w(anchor) == delta_xmax(pred)
+        y_pred_converted[:,:,[4,5]] *= np.expand_dims(anchor_boxes[:,:,3] - anchor_boxes[:,:,2], axis=-1) # delta_ymin(pred) / h(anchor) * h(anchor) == delta_ymin(pred), delta_ymax(pred) / h(anchor) * h(anchor) == delta_ymax(pred)
+        y_pred_converted[:,:,2:] += anchor_boxes # delta(pred) + anchor == pred for all four coordinates
     else:
         raise ValueError("Unexpected value for `coords`. Supported values are 'minmax' and 'centroids'.")
 
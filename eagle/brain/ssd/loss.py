@@ -13,7 +13,8 @@ import tensorflow as tf
 
 class Loss:
 
-    def __init__(self, neg_pos_ratio=3, n_neg_min=0, alpha=1.0):
+    def __init__(self, neg_pos_ratio=3, n_neg_min=0, alpha=1.0,
+                 n_anchor_columns=8):
         """
         Arguments:
             neg_pos_ratio (int, optional): The maximum ratio of negative (i.e. background)
@@ -31,10 +32,14 @@ class Loss:
                 stands in reasonable proportion to the batch size used for training.
             alpha (float, optional): A factor to weight the localization loss in the
                 computation of the total loss. Defaults to 1.0 following the paper.
+            n_anchor_columns (int, optional): The number of trailing anchor box and variance entries
+                in the last axis of `y_true` and `y_pred`. Defaults to 8 for models that carry the anchors
+                in their output, set it to 0 if the model only outputs the classes and the 4 offsets.
         """
         self.neg_pos_ratio = neg_pos_ratio
         self.n_neg_min = n_neg_min
         self.alpha = alpha
+        self.n_anchor_columns = n_anchor_columns
 
     def smooth_L1_loss(self, y_true, y_pred):
         '''
@@ -80,11 +85,11 @@ class Loss:
         '''
         Compute the loss of the SSD model prediction against the ground truth.
         Arguments:
-            y_true (array): A Numpy array of shape `(batch_size, #boxes, #classes + 12)`,
+            y_true (array): A Numpy array of shape `(batch_size, #boxes, #classes + 4 + n_anchor_columns)`,
                 where `#boxes` is the total number of boxes that the model predicts
                 per image. Be careful to make sure that the index of each given
                 box in `y_true` is the same as the index for the corresponding
-                box in `y_pred`. The last axis must have length `#classes + 12` and contain
+                box in `y_pred`. With the default `n_anchor_columns` the last axis must have length `#classes + 12` and contain
                 `[classes one-hot encoded, 4 ground truth box coordinate offsets, 8 arbitrary entries]`
                 in this order, including the background class. The last eight entries of the
                 last axis are not used by this function and therefore their contents are
@@ -109,20 +114,23 @@ class Loss:
         # Output dtype: tf.int32, note that `n_boxes` in this context denotes the total number of boxes per image,
         # not the number of boxes per cell
         n_boxes = tf.shape(y_pred)[1]
+        # The classes end and the 4 offsets start at `-offsets_start` of the last axis
+        offsets_start = self.n_anchor_columns + 4
+        offsets_end = -self.n_anchor_columns if self.n_anchor_columns else None
 
         # 1: Compute the losses for class and box predictions for every box
 
         # Output shape: (batch_size, n_boxes)
         classification_loss = tf.to_float(
             self.log_loss(
-                y_true[:, :, :-12],
-                y_pred[:, :, :-12])
+                y_true[:, :, :-offsets_start],
+                y_pred[:, :, :-offsets_start])
         )
         # Output shape: (batch_size, n_boxes)
         localization_loss = tf.to_float(
             self.smooth_L1_loss(
-                y_true[:, :, -12:-8],
-                y_pred[:, :, -12:-8])
+                y_true[:, :, -offsets_start:offsets_end],
+                y_pred[:, :, -offsets_start:offsets_end])
         )
 
         # 2: Compute the classification losses for the positive and negative targets
@@ -131,7 +139,7 @@ class Loss:
         # Tensor of shape (batch_size, n_boxes)
         negatives = y_true[:, :, 0]
         # Tensor of shape (batch_size, n_boxes)
-        positives = tf.to_float(tf.reduce_max(y_true[:, :, 1:-12], axis=-1))
+        positives = tf.to_float(tf.reduce_max(y_true[:, :, 1:-offsets_start], axis=-1))
 
         # Count the number of positive boxes (classes 1 to n) in y_true across the whole batch
         n_positive = tf.reduce_sum(positives)
@@ -8,6 +8,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 from keras.layers import Activation, Conv2D, Concatenate
 from keras.layers import BatchNormalization
 
@@ -19,16 +20,69 @@ def _fire(x, filters, name="fire"):
     x = Concatenate(axis=-1, name=name+"/concate")([expand1, expand2])
     return x
 
-def _fire_with_bn(x, filters, name="fire"):
+def _fire_with_bn(x, filters, name="fire", fold_bn=False):
+    """fold_bn: 不建BatchNormalization层，卷积的kernel和bias中已经包含了BN(推理用)"""
     sq_filters, ex1_filters, ex2_filters = filters
     squeeze = Conv2D(sq_filters, (1, 1), activation="relu", padding="same", kernel_initializer="he_normal", name=name+"/squeeze1x1")(x)
-    expand1 = Activation(activation="relu", name=name+"/relu_expand1x1")(BatchNormalization(name=name+"/expand1x1/bn")(Conv2D(ex1_filters, (1, 1), strides=(1, 1), padding="same", kernel_initializer="he_normal", name=name+"/expand1x1")(squeeze)))
-    expand2 = Activation(activation="relu", name=name+"/relu_expand3x3")(BatchNormalization(name=name+"/expand3x3/bn")(Conv2D(ex2_filters, (3, 3), strides=(1, 1), padding="same", kernel_initializer="he_normal", name=name+"/expand3x3")(squeeze)))
+
+    def expand(n_filters, k_size, expand_name):
+        y = Conv2D(n_filters, k_size, strides=(1, 1), padding="same", kernel_initializer="he_normal", name=name+"/"+expand_name)(squeeze)
+        if not fold_bn:
+            y = BatchNormalization(name=name+"/"+expand_name+"/bn")(y)
+        return Activation(activation="relu", name=name+"/relu_"+expand_name)(y)
+
+    expand1 = expand(ex1_filters, (1, 1), "expand1x1")
+    expand2 = expand(ex2_filters, (3, 3), "expand3x3")
     x = Concatenate(axis=-1, name=name+"/concate")([expand1, expand2])
     return x
 
-def _conv2D_with_bn(x, n_filters, k_size, k_stride, name, pad="same"):
+def _conv2D_with_bn(x, n_filters, k_size, k_stride, name, pad="same", fold_bn=False):
     x = Conv2D(n_filters, k_size, strides=(k_stride, k_stride), padding=pad, kernel_initializer="he_normal", name=name+"/conv")(x)
-    x = BatchNormalization(name=name+"/bn")(x)
+    if not fold_bn:
+        x = BatchNormalization(name=name+"/bn")(x)
     x = Activation(activation="relu", name=name+"/relu")(x)
     return x
+
+def _inbound_layer(layer):
+    # keras >= 2.1.3 keeps the nodes in `_inbound_nodes`
+    nodes = getattr(layer, "_inbound_nodes", None) or layer.inbound_nodes
+    return nodes[0].inbound_layers[0]
+
+def fold_batch_norm_weights(model, folded_model):
+    """Copy the weights of `model` to the same model built with `fold_bn=True`
+
+    Every BatchNormalization of `model` follows a conv, in inference mode it
+    is an affine transform per channel and is merged into that conv:
+      scale = gamma / sqrt(moving_variance + epsilon)
+      kernel' = kernel * scale, bias' = (bias - moving_mean) * scale + beta
+    The other layers are copied by name.
+    """
+    folded = {}
+    for layer in model.layers:
+        if not isinstance(layer, BatchNormalization):
+            continue
+        conv = _inbound_layer(layer)
+        if not isinstance(conv, Conv2D) or layer.axis not in (-1, 3):
+            raise ValueError("only a BatchNormalization on the channels of a "
+                             "Conv2D can be folded", layer.name)
+        weights = layer.get_weights()
+        gamma = weights.pop(0) if layer.scale else 1.0
+        beta = weights.pop(0) if layer.center else 0.0
+        moving_mean, moving_variance = weights
+        scale = gamma / np.sqrt(moving_variance + layer.epsilon)
+
+        conv_weights = conv.get_weights()
+        kernel = conv_weights[0]
+        bias = conv_weights[1] if conv.use_bias else np.zeros(kernel.shape[-1])
+        folded[conv.name] = [kernel * scale,
+                             (bias - moving_mean) * scale + beta]
+
+    for layer in folded_model.layers:
+        if not layer.weights:
+            continue
+        if layer.name in folded:
+            layer.set_weights(folded.pop(layer.name))
+        else:
+            layer.set_weights(model.get_layer(layer.name).get_weights())
+    if folded:
+        raise ValueError("the folded model misses the convs", list(folded))
@@ -8,8 +8,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 
+from eagle.brain.ssd.box_encode_decode_utils import generate_anchor_boxes
+from eagle.brain.ssd.box_encode_decode_utils import count_anchor_boxes
+
 
 class Net(object):
     def __init__(self, common_params, net_params):
@@ -22,6 +26,8 @@ class Net(object):
         self.pretrained_collection = []
         # trainable variable collection
         self.trainable_collection = []
+        # anchor box masks of the predictor layers, None keeps all boxes
+        self.anchor_masks = None
 
     def _variable_on_cpu(self, name, shape, initializer, pretrain=True,
                          train=True):
@@ -172,6 +178,45 @@ class Net(object):
         mask = tf.cast(bool_mask, dtype=dtype)
         return 1.0 * mask * x + alpha * (1 - mask) * x
 
+    def box_mask(self, layer):
+        if self.anchor_masks is None:
+            return None
+        return self.anchor_masks[layer]
+
+    def count_boxes(self):
+        """The number of boxes per cell of every predictor layer"""
+        return [count_anchor_boxes(aspect_ratios, self.two_boxes_for_ar1,
+                                   self.box_mask(i))
+                for i, aspect_ratios in enumerate(self.aspect_ratios_per_layer)]
+
+    def generate_anchors(self, predictor_layers):
+        """Anchor boxes of all predictor layers
+
+        The anchors only depend on the shape of the predictor layers, so they
+        are computed once instead of being replicated for every batch item.
+
+        Args:
+          predictor_layers: list of 4-D tensors [batch_size, height, width, channels]
+        Returns:
+          anchors: 2-D numpy array [n_boxes_total, 8], the 4 anchor box
+          coordinates and the 4 variances of every box in prediction order
+        """
+        anchors = []
+        for i, layer in enumerate(predictor_layers):
+            boxes = generate_anchor_boxes(
+                self.image_height, self.image_width,
+                feature_map_size=layer.get_shape().as_list()[1:3],
+                this_scale=self.scales[i],
+                next_scale=self.scales[i + 1],
+                aspect_ratios=self.aspect_ratios_per_layer[i],
+                two_boxes_for_ar1=self.two_boxes_for_ar1,
+                variances=self.variances,
+                coords=self.coords,
+                normalize_coords=self.normalize_coords,
+                box_mask=self.box_mask(i))
+            anchors.append(np.reshape(boxes, (-1, 8)))
+        return np.concatenate(anchors, axis=0).astype(np.float32)
+
     def inference(self, images):
         """Build the yolo model
 
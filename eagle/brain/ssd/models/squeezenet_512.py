@@ -18,6 +18,8 @@ from keras.layers import Input, Activation, Conv2D, Lambda, Reshape, Concatenate
 from keras.layers import MaxPooling2D, BatchNormalization
 
 from eagle.brain.ssd.anchor_boxes import AnchorBoxes
+from eagle.brain.ssd.box_encode_decode_utils import count_anchor_boxes
+from eagle.brain.ssd.box_encode_decode_utils import parse_anchor_masks
 from eagle.brain.ssd.models.components import _fire, _fire_with_bn, _conv2D_with_bn
 
 
@@ -27,7 +29,9 @@ def base_feature_model(image_size, n_classes,
                        two_boxes_for_ar1=True, limit_boxes=False,
                        variances=[0.1, 0.1, 0.2, 0.2],
                        coords='centroids',
-                       normalize_coords=False):
+                       normalize_coords=False,
+                       anchor_masks=None,
+                       fold_bn=False):
     n_predictor_layers = 6  # The number of predictor conv layers in the network is 6 for the original SSD300
     # Get a few exceptions out of the way first
     if aspect_ratios_global is None and aspect_ratios_per_layer is None:
@@ -91,6 +95,13 @@ def base_feature_model(image_size, n_classes,
         # n_boxes_conv8_2 = n_boxes
         # n_boxes_conv9_2 = n_boxes
 
+    # Remove the anchor boxes that are masked out, see `datum/models/ssd/anchor_stats.py`
+    pl_box_masks = [None] * n_predictor_layers
+    if anchor_masks is not None:
+        pl_box_masks = parse_anchor_masks(anchor_masks, pl_aspect_ratios, two_boxes_for_ar1)
+        for idx in range(0, n_predictor_layers):
+            pl_n_boxes[idx] = count_anchor_boxes(pl_aspect_ratios[idx], two_boxes_for_ar1, pl_box_masks[idx])
+
     # Input image Others
     img_height, img_width, img_channels = image_size[0], image_size[1], image_size[2]
 
@@ -137,7 +148,10 @@ def base_feature_model(image_size, n_classes,
     pool5 = MaxPooling2D(pool_size=(3, 3), strides=(2, 2), name='pool5', padding="same")(concat_d21_d12_f5)
 
     fire5_conv_bn = Conv2D(256, (3, 3), strides=(1, 1), kernel_initializer="he_normal", name="fire5_conv_bn")(concat_d21_d12_f5)
-    fire5_bn = BatchNormalization(name="fire5_bn")(fire5_conv_bn)
+    if fold_bn:
+        fire5_bn = fire5_conv_bn
+    else:
+        fire5_bn = BatchNormalization(name="fire5_bn")(fire5_conv_bn)
 
     dilated_conv31 = Conv2D(96, kernel_size=(3, 3), strides=(1, 1), dilation_rate=(2, 2), padding="same", activation="relu", kernel_initializer="he_normal", name="dilated_conv31")(concat_d21_d12_f5)
     dilated_pool31 = MaxPooling2D(pool_size=(3, 3), strides=(2, 2), name="dilated_pool31", padding="same")(dilated_conv31)
@@ -151,21 +165,21 @@ def base_feature_model(image_size, n_classes,
     concat_d31_d22_d13_f7 = Concatenate(name='concat_d31_d22_d13_f7')([dilated_pool31, concat_d22_d13_f7])
 
     fire8 = _fire(concat_d31_d22_d13_f7, (96, 256, 256), name="fire8")
-    fire9 = _fire_with_bn(fire8, (96, 256, 256), name="fire9")
+    fire9 = _fire_with_bn(fire8, (96, 256, 256), name="fire9", fold_bn=fold_bn)
     pool9 = MaxPooling2D(pool_size=(3, 3), strides=(2, 2), name='pool9', padding="same")(fire9)
 
 #-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#
 
-    fire10 = _fire_with_bn(pool9, (96, 256, 256), name="fire10")
+    fire10 = _fire_with_bn(pool9, (96, 256, 256), name="fire10", fold_bn=fold_bn)
     pool10 = MaxPooling2D(pool_size=(3, 3), strides=(2, 2), name='pool10', padding="same")(fire10)
 
 #-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#
 
-    fire11 = _fire_with_bn(pool10, (96, 256, 256), name="fire11")
-    conv12_1 = _conv2D_with_bn(fire11, 128, (1, 1), 1, name="conv12_1")
-    conv12_2 = _conv2D_with_bn(conv12_1, 256, (3, 3), 2, name="conv12_2")
-    conv13_1 = _conv2D_with_bn(conv12_2, 64, (1, 1), 1, name="conv13_1")
-    conv13_2 = _conv2D_with_bn(conv13_1, 128, (3, 3), 2, pad="valid", name="conv13_2")
+    fire11 = _fire_with_bn(pool10, (96, 256, 256), name="fire11", fold_bn=fold_bn)
+    conv12_1 = _conv2D_with_bn(fire11, 128, (1, 1), 1, name="conv12_1", fold_bn=fold_bn)
+    conv12_2 = _conv2D_with_bn(conv12_1, 256, (3, 3), 2, name="conv12_2", fold_bn=fold_bn)
+    conv13_1 = _conv2D_with_bn(conv12_2, 64, (1, 1), 1, name="conv13_1", fold_bn=fold_bn)
+    conv13_2 = _conv2D_with_bn(conv13_1, 128, (3, 3), 2, pad="valid", name="conv13_2", fold_bn=fold_bn)
 
 #-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#-------------#
 
@@ -192,17 +206,17 @@ def base_feature_model(image_size, n_classes,
     ### Generate the anchor boxes (called "priors" in the original Caffe/C++ implementation, so I'll keep their layer names)
     # Output shape of anchors: `(batch, height, width, n_boxes, 8)`
     fire5_bn_mbox_priorbox = AnchorBoxes(img_height, img_width, this_scale=scales[0], next_scale=scales[1], aspect_ratios=pl_aspect_ratios[0],
-                                             two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, name='fire5_bn_mbox_priorbox')(fire5_bn_mbox_loc)
+                                             two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, box_mask=pl_box_masks[0], name='fire5_bn_mbox_priorbox')(fire5_bn_mbox_loc)
     fire9_mbox_priorbox = AnchorBoxes(img_height, img_width, this_scale=scales[1], next_scale=scales[2], aspect_ratios=pl_aspect_ratios[1],
-                                    two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, name='fire9_mbox_priorbox')(fire9_mbox_loc)
+                                    two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, box_mask=pl_box_masks[1], name='fire9_mbox_priorbox')(fire9_mbox_loc)
     fire10_mbox_priorbox = AnchorBoxes(img_height, img_width, this_scale=scales[2], next_scale=scales[3], aspect_ratios=pl_aspect_ratios[2],
-                                        two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, name='fire10_mbox_priorbox')(fire10_mbox_loc)
+                                        two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, box_mask=pl_box_masks[2], name='fire10_mbox_priorbox')(fire10_mbox_loc)
     fire11_mbox_priorbox = AnchorBoxes(img_height, img_width, this_scale=scales[3], next_scale=scales[4], aspect_ratios=pl_aspect_ratios[3],
-                                        two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, name='fire11_mbox_priorbox')(fire11_mbox_loc)
+                                        two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, box_mask=pl_box_masks[3], name='fire11_mbox_priorbox')(fire11_mbox_loc)
     conv12_2_mbox_priorbox = AnchorBoxes(img_height, img_width, this_scale=scales[4], next_scale=scales[5], aspect_ratios=pl_aspect_ratios[4],
-                                        two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, name='conv12_2_mbox_priorbox')(conv12_2_mbox_loc)
+                                        two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, box_mask=pl_box_masks[4], name='conv12_2_mbox_priorbox')(conv12_2_mbox_loc)
     conv13_2_mbox_priorbox = AnchorBoxes(img_height, img_width, this_scale=scales[5], next_scale=scales[6], aspect_ratios=pl_aspect_ratios[5],
-                                        two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, name='conv13_2_mbox_priorbox')(conv13_2_mbox_loc)
+                                        two_boxes_for_ar1=two_boxes_for_ar1, limit_boxes=limit_boxes, variances=variances, coords=coords, normalize_coords=normalize_coords, box_mask=pl_box_masks[5], name='conv13_2_mbox_priorbox')(conv13_2_mbox_loc)
 
     ### Reshape
     # Reshape the class predictions, yielding 3D tensors of shape `(batch, height * width * n_boxes, n_classes)`
@@ -11,12 +11,16 @@ from __future__ import print_function
 import numpy as np
 import tensorflow as tf
 
+from eagle.brain.ssd.box_encode_decode_utils import parse_anchor_masks
 from eagle.brain.ssd.loss import Loss
 from eagle.brain.ssd.models.net import Net
-from eagle.brain.ssd.anchor_boxes import AnchorBoxes
 
 
 class SSDVGG(Net):
+    # 预测层(mbox_conf/mbox_loc)的输入特征，按anchor的顺序排列
+    FEATURE_LAYERS = ("conv4_3_norm", "fc7", "conv6_2", "conv7_2",
+                      "conv8_2", "conv9_2")
+
     def __init__(self, common_params, net_params, box_encoder_params):
         super(SSDVGG, self).__init__(common_params, net_params)
         ## 解析common_params
@@ -91,6 +95,11 @@ class SSDVGG(Net):
 
         self.check_valid()
 
+        # 每一层保留哪些anchor box（可选，由anchor_stats统计数据集后生成）
+        self.anchor_masks = parse_anchor_masks(
+            box_encoder_params.get("anchor_masks", "None"),
+            self.aspect_ratios_per_layer, self.two_boxes_for_ar1)
+
         ## 现在要先创造出loss的损失函数的管理对象
         self.model_loss_obj = None
 
@@ -117,36 +126,15 @@ class SSDVGG(Net):
                 "Unexpected value for `coords`. Supported values are 'minmax' and 'centroids'.")
 
     def inference(self, images):
-        # Set the aspect ratios for each predictor layer. These are only needed for the anchor box layers.
-        aspect_ratios_conv4_3 = self.aspect_ratios_per_layer[0]
-        aspect_ratios_fc7 = self.aspect_ratios_per_layer[1]
-        aspect_ratios_conv6_2 = self.aspect_ratios_per_layer[2]
-        aspect_ratios_conv7_2 = self.aspect_ratios_per_layer[3]
-        aspect_ratios_conv8_2 = self.aspect_ratios_per_layer[4]
-        aspect_ratios_conv9_2 = self.aspect_ratios_per_layer[5]
+        return self.heads(self.backbone(images))
 
-        # Compute the number of boxes to be predicted per cell for each predictor layer.
-        # We need this so that we know how many channels the predictor layers need to have.
-        n_boxes = []
-        for aspect_ratios in self.aspect_ratios_per_layer:
-            # +1 for the second box for aspect ratio 1
-            if (1 in aspect_ratios) & self.two_boxes_for_ar1:
-                n_boxes.append(len(aspect_ratios) + 1)
-            else:
-                n_boxes.append(len(aspect_ratios))
-        # 4 boxes per cell for the original implementation
-        n_boxes_conv4_3 = n_boxes[0]
-        # 6 boxes per cell for the original implementation
-        n_boxes_fc7 = n_boxes[1]
-        # 6 boxes per cell for the original implementation
-        n_boxes_conv6_2 = n_boxes[2]
-        # 6 boxes per cell for the original implementation
-        n_boxes_conv7_2 = n_boxes[3]
-        # 4 boxes per cell for the original implementation
-        n_boxes_conv8_2 = n_boxes[4]
-        # 4 boxes per cell for the original implementation
-        n_boxes_conv9_2 = n_boxes[5]
+    def backbone(self, images):
+        """The VGG base network and the extra feature layers
 
+        Returns:
+          dict of the layer name in `FEATURE_LAYERS` to the feature map the
+          predictor layers are built on
+        """
         ### Design the actual network
         conv1_1 = tf.layers.Conv2D(
             filters=64,
@@ -401,6 +389,44 @@ class SSDVGG(Net):
         # conv4_3_norm = L2Normalization(gamma_init=20,
         #                                name='conv4_3_norm')(conv4_3)
 
+        return {
+            "conv4_3_norm": conv4_3_norm,
+            "fc7": fc7,
+            "conv6_2": conv6_2,
+            "conv7_2": conv7_2,
+            "conv8_2": conv8_2,
+            "conv9_2": conv9_2
+        }
+
+    def heads(self, features):
+        """The predictor layers on the feature maps of `backbone()`
+
+        The features may also come from a feature cache of a frozen backbone.
+        """
+        conv4_3_norm = features["conv4_3_norm"]
+        fc7 = features["fc7"]
+        conv6_2 = features["conv6_2"]
+        conv7_2 = features["conv7_2"]
+        conv8_2 = features["conv8_2"]
+        conv9_2 = features["conv9_2"]
+
+        # Compute the number of boxes to be predicted per cell for each predictor layer.
+        # We need this so that we know how many channels the predictor layers need to have.
+        # +1 for the second box for aspect ratio 1, minus the masked boxes
+        n_boxes = self.count_boxes()
+        # 4 boxes per cell for the original implementation
+        n_boxes_conv4_3 = n_boxes[0]
+        # 6 boxes per cell for the original implementation
+        n_boxes_fc7 = n_boxes[1]
+        # 6 boxes per cell for the original implementation
+        n_boxes_conv6_2 = n_boxes[2]
+        # 6 boxes per cell for the original implementation
+        n_boxes_conv7_2 = n_boxes[3]
+        # 4 boxes per cell for the original implementation
+        n_boxes_conv8_2 = n_boxes[4]
+        # 4 boxes per cell for the original implementation
+        n_boxes_conv9_2 = n_boxes[5]
+
         ### Build the convolutional predictor layers on top of the base network
 
         # We precidt `n_classes` confidence values for each box, hence the confidence predictors have depth `n_boxes * n_classes`
@@ -503,173 +529,70 @@ class SSDVGG(Net):
             name='conv9_2_mbox_loc'
         )(conv9_2)
 
-        # Output shape of anchors: `(batch, height, width, n_boxes, 8)`
-        conv4_3_norm_mbox_priorbox = AnchorBoxes(
-            self.image_height,
-            self.image_width,
-            this_scale=self.scales[0],
-            next_scale=self.scales[1],
-            aspect_ratios=aspect_ratios_conv4_3,
-            two_boxes_for_ar1=self.two_boxes_for_ar1,
-            variances=self.variances,
-            coords=self.coords,
-            normalize_coords=self.normalize_coords,
-            name='conv4_3_norm_mbox_priorbox')(conv4_3_norm_mbox_loc)
-
-        fc7_mbox_priorbox = AnchorBoxes(
-            self.image_height,
-            self.image_width,
-            this_scale=self.scales[1],
-            next_scale=self.scales[2],
-            aspect_ratios=aspect_ratios_fc7,
-            two_boxes_for_ar1=self.two_boxes_for_ar1,
-            variances=self.variances,
-            coords=self.coords,
-            normalize_coords=self.normalize_coords,
-            name='fc7_mbox_priorbox')(fc7_mbox_loc)
-
-        conv6_2_mbox_priorbox = AnchorBoxes(
-            self.image_height,
-            self.image_width,
-            this_scale=self.scales[2],
-            next_scale=self.scales[3],
-            aspect_ratios=aspect_ratios_conv6_2,
-            two_boxes_for_ar1=self.two_boxes_for_ar1,
-            variances=self.variances,
-            coords=self.coords,
-            normalize_coords=self.normalize_coords,
-            name='conv6_2_mbox_priorbox')(conv6_2_mbox_loc)
-
-        conv7_2_mbox_priorbox = AnchorBoxes(
-            self.image_height, self.image_width,
-            this_scale=self.scales[3],
-            next_scale=self.scales[4],
-            aspect_ratios=aspect_ratios_conv7_2,
-            two_boxes_for_ar1=self.two_boxes_for_ar1,
-            variances=self.variances,
-            coords=self.coords,
-            normalize_coords=self.normalize_coords,
-            name='conv7_2_mbox_priorbox')(conv7_2_mbox_loc)
-
-        conv8_2_mbox_priorbox = AnchorBoxes(
-            self.image_height,
-            self.image_width,
-            this_scale=self.scales[4],
-            next_scale=self.scales[5],
-            aspect_ratios=aspect_ratios_conv8_2,
-            two_boxes_for_ar1=self.two_boxes_for_ar1,
-            variances=self.variances,
-            coords=self.coords,
-            normalize_coords=self.normalize_coords,
-            name='conv8_2_mbox_priorbox')(conv8_2_mbox_loc)
-
-        conv9_2_mbox_priorbox = AnchorBoxes(
-            self.image_height,
-            self.image_width,
-            this_scale=self.scales[5],
-            next_scale=self.scales[6],
-            aspect_ratios=aspect_ratios_conv9_2,
-            two_boxes_for_ar1=self.two_boxes_for_ar1,
-            variances=self.variances,
-            coords=self.coords,
-            normalize_coords=self.normalize_coords,
-            name='conv9_2_mbox_priorbox')(conv9_2_mbox_loc)
-
         # Reshape the class predictions, yielding 3D tensors of shape `(batch, height * width * n_boxes, n_classes)`
         # We want the classes isolated in the last axis to perform softmax on them
         conv4_3_norm_mbox_conf_reshape = tf.reshape(
             conv4_3_norm_mbox_conf,
-            (-1, self.num_classes),
+            (self.batch_size, -1, self.num_classes),
             name="conv4_3_norm_mbox_conf_reshape")
 
         fc7_mbox_conf_reshape = tf.reshape(
             fc7_mbox_conf,
-            (-1, self.num_classes),
+            (self.batch_size, -1, self.num_classes),
             name='fc7_mbox_conf_reshape')
 
         conv6_2_mbox_conf_reshape = tf.reshape(
             conv6_2_mbox_conf,
-            (-1, self.num_classes),
+            (self.batch_size, -1, self.num_classes),
             name='conv6_2_mbox_conf_reshape')
 
         conv7_2_mbox_conf_reshape = tf.reshape(
             conv7_2_mbox_conf,
-            (-1, self.num_classes),
+            (self.batch_size, -1, self.num_classes),
             name='conv7_2_mbox_conf_reshape')
 
         conv8_2_mbox_conf_reshape = tf.reshape(
             conv8_2_mbox_conf,
-            (-1, self.num_classes),
+            (self.batch_size, -1, self.num_classes),
             name='conv8_2_mbox_conf_reshape')
 
         conv9_2_mbox_conf_reshape = tf.reshape(
             conv9_2_mbox_conf,
-            (-1, self.num_classes),
+            (self.batch_size, -1, self.num_classes),
             name='conv9_2_mbox_conf_reshape')
 
         # Reshape the box predictions, yielding 3D tensors of shape `(batch, height * width * n_boxes, 4)`
         # We want the four box coordinates isolated in the last axis to compute the smooth L1 loss
         conv4_3_norm_mbox_loc_reshape = tf.reshape(
             conv4_3_norm_mbox_loc,
-            (-1, 4),
+            (self.batch_size, -1, 4),
             name='conv4_3_norm_mbox_loc_reshape')
 
         fc7_mbox_loc_reshape = tf.reshape(
             fc7_mbox_loc,
-            (-1, 4),
+            (self.batch_size, -1, 4),
             name='fc7_mbox_loc_reshape')
 
         conv6_2_mbox_loc_reshape = tf.reshape(
             conv6_2_mbox_loc,
-            (-1, 4),
+            (self.batch_size, -1, 4),
             name='conv6_2_mbox_loc_reshape')
 
         conv7_2_mbox_loc_reshape = tf.reshape(
             conv7_2_mbox_loc,
-            (-1, 4),
+            (self.batch_size, -1, 4),
             name='conv7_2_mbox_loc_reshape')
 
         conv8_2_mbox_loc_reshape = tf.reshape(
             conv8_2_mbox_loc,
-            (-1, 4),
+            (self.batch_size, -1, 4),
             name='conv8_2_mbox_loc_reshape')
 
         conv9_2_mbox_loc_reshape = tf.reshape(
             conv9_2_mbox_loc,
-            (-1, 4),
+            (self.batch_size, -1, 4),
             name='conv9_2_mbox_loc_reshape')
 
-        # Reshape the anchor box tensors, yielding 3D tensors of shape `(batch, height * width * n_boxes, 8)`
-        conv4_3_norm_mbox_priorbox_reshape = tf.reshape(
-            conv4_3_norm_mbox_priorbox,
-            (-1, 8),
-            name='conv4_3_norm_mbox_priorbox_reshape')
-
-        fc7_mbox_priorbox_reshape = tf.reshape(
-            fc7_mbox_priorbox,
-            (-1, 8),
-            name='fc7_mbox_priorbox_reshape')
-
-        conv6_2_mbox_priorbox_reshape = tf.reshape(
-            conv6_2_mbox_priorbox,
-            (-1, 8),
-            name='conv6_2_mbox_priorbox_reshape')
-
-        conv7_2_mbox_priorbox_reshape = tf.reshape(
-            conv7_2_mbox_priorbox,
-            (-1, 8),
-            name='conv7_2_mbox_priorbox_reshape')
-
-        conv8_2_mbox_priorbox_reshape = tf.reshape(
-            conv8_2_mbox_priorbox,
-            (-1, 8),
-            name='conv8_2_mbox_priorbox_reshape')
-
-        conv9_2_mbox_priorbox_reshape = tf.reshape(
-            conv9_2_mbox_priorbox,
-            (-1, 8),
-            name='conv9_2_mbox_priorbox_reshape')
-
         ### Concatenate the predictions from the different layers
 
         # Axis 0 (batch) and axis 2 (n_classes or 4, respectively) are identical for all layer predictions,
@@ -682,7 +605,7 @@ class SSDVGG(Net):
             conv7_2_mbox_conf_reshape,
             conv8_2_mbox_conf_reshape,
             conv9_2_mbox_conf_reshape],
-            axis=0, name='mbox_conf')
+            axis=1, name='mbox_conf')
 
         # Output shape of `mbox_loc`: (batch, n_boxes_total, 4)
         mbox_loc = tf.concat([
@@ -692,35 +615,30 @@ class SSDVGG(Net):
             conv7_2_mbox_loc_reshape,
             conv8_2_mbox_loc_reshape,
             conv9_2_mbox_loc_reshape],
-            axis=0, name='mbox_loc')
-
-        # Output shape of `mbox_priorbox`: (batch, n_boxes_total, 8)
-        mbox_priorbox = tf.concat([
-            conv4_3_norm_mbox_priorbox_reshape,
-            fc7_mbox_priorbox_reshape,
-            conv6_2_mbox_priorbox_reshape,
-            conv7_2_mbox_priorbox_reshape,
-            conv8_2_mbox_priorbox_reshape,
-            conv9_2_mbox_priorbox_reshape],
-            axis=0, name='mbox_priorbox')
+            axis=1, name='mbox_loc')
+
+        # The anchor boxes are the same for every image, hold them once as a constant
+        # Output shape of `mbox_priorbox`: (n_boxes_total, 8)
+        self.anchor_boxes = self.generate_anchors([
+            conv4_3_norm_mbox_loc,
+            fc7_mbox_loc,
+            conv6_2_mbox_loc,
+            conv7_2_mbox_loc,
+            conv8_2_mbox_loc,
+            conv9_2_mbox_loc])
+        mbox_priorbox = tf.constant(self.anchor_boxes, name='mbox_priorbox')
 
         # The box coordinate predictions will go into the loss function just the way they are,
         # but for the class predictions, we'll apply a softmax activation layer first
         mbox_conf_softmax = tf.nn.softmax(mbox_conf, name='mbox_conf_softmax')
 
-        # Concatenate the class and box predictions and the anchors to one large predictions vector
-        # Output shape of `predictions`: (batch, n_boxes_total, n_classes + 4 + 8)
+        # Concatenate the class and box predictions to one large predictions vector,
+        # the anchors are looked up by the box index in the loss and the decoder
+        # Output shape of `predictions`: (batch, n_boxes_total, n_classes + 4)
         predictions = tf.concat([
             mbox_conf_softmax,
-            mbox_loc,
-            mbox_priorbox],
-            axis=1, name='predictions')
-        predict_shape = predictions.get_shape().as_list()
-        predictions = tf.reshape(
-            predictions,
-            shape=(self.batch_size,
-                   predict_shape[0] // self.batch_size,
-                   self.num_classes + 4 + 8))
+            mbox_loc],
+            axis=2, name='predictions')
 
         # Get the spatial dimensions (height, width) of the predictor conv layers, we need them to
         # be able to generate the default boxes for the matching process outside of the model during training.
@@ -737,6 +655,7 @@ class SSDVGG(Net):
 
         res = {
             "predictions": predictions,
+            "anchors": mbox_priorbox,
             "predictor_sizes": predictor_sizes
         }
         return res
@@ -746,5 +665,6 @@ class SSDVGG(Net):
             self.model_loss_obj = Loss(
                 neg_pos_ratio=self.neg_pos_ratio,
                 n_neg_min=self.n_neg_min,
-                alpha=self.loss_alpha)
+                alpha=self.loss_alpha,
+                n_anchor_columns=0)
         return self.model_loss_obj.compute_loss(y_true, y_pred)
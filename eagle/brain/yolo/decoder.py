@@ -0,0 +1,139 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+import numpy as np
+
+from eagle.brain.ssd.box_encode_decode_utils import class_aware_nms
+
+
+def decode_params(solver_params):
+    """Thresholds of the decoder from the solver params
+
+    `confidence_thresh` is a float or a json list with one threshold per class.
+    """
+    top_k = str(solver_params.get('top_k', "all"))
+    return {
+        "confidence_thresh": json.loads(
+            str(solver_params.get('confidence_thresh', "0.2"))),
+        "iou_threshold": float(solver_params.get('iou_threshold', 0.45)),
+        "top_k": top_k if top_k == "all" else int(top_k)
+    }
+
+
+class YoloDecoder(object):
+    """Decode every cell and box of the yolo grid outputs of a whole batch
+
+    The grid size is read from the shape of the predicts, so the same decoder
+    works for the 7x7 grid of YoloTinyNet and decodes the 9x9 and 15x15 grids
+    of YoloUNet together.
+    The detections are in the format of `decode_y2`
+    `[class_id, confidence, xmin, xmax, ymin, ymax]` in pixel of the input
+    image, the class ids start at 0 (yolo has no background class).
+    """
+
+    def __init__(self, num_classes, boxes_per_cell, img_height, img_width,
+                 confidence_thresh=0.2, iou_threshold=0.45, top_k='all'):
+        """
+        Args:
+          confidence_thresh: minimal class specific confidence
+            (box confidence * class probability), a float or one per class
+          iou_threshold: None to skip the non maximum suppression
+        """
+        self.num_classes = num_classes
+        self.boxes_per_cell = boxes_per_cell
+        self.img_height = img_height
+        self.img_width = img_width
+        self.confidence_thresh = np.broadcast_to(
+            np.asarray(confidence_thresh, dtype=np.float32), (num_classes,))
+        self.iou_threshold = iou_threshold
+        self.top_k = top_k
+        # cell_size -> offsets of the cells [cell_size, cell_size, 1, 2]
+        self._offsets = {}
+
+    def _cell_offsets(self, cell_size):
+        if cell_size not in self._offsets:
+            offsets = np.zeros((cell_size, cell_size, 1, 2), dtype=np.float32)
+            offsets[:, :, 0, 0] = np.arange(cell_size)
+            offsets[:, :, 0, 1] = np.arange(cell_size)[:, np.newaxis]
+            self._offsets[cell_size] = offsets
+        return self._offsets[cell_size]
+
+    def decode_boxes(self, predicts):
+        """Boxes and class specific scores of every cell and box
+
+        Args:
+          predicts: 4-D array [batch_size, cell_size, cell_size, num_classes + 5 * boxes_per_cell]
+        Returns:
+          boxes: 3-D array [batch_size, cell_size * cell_size * boxes_per_cell, 4]
+            `[xmin, xmax, ymin, ymax]` in pixel
+          scores: 3-D array [batch_size, cell_size * cell_size * boxes_per_cell, num_classes]
+        """
+        batch_size, cell_size = predicts.shape[0], predicts.shape[1]
+        n1 = self.num_classes
+        n2 = n1 + self.boxes_per_cell
+        p_classes = predicts[:, :, :, np.newaxis, 0:n1]
+        C = predicts[:, :, :, n1:n2, np.newaxis]
+        coordinate = np.reshape(predicts[:, :, :, n2:],
+                                (batch_size, cell_size, cell_size,
+                                 self.boxes_per_cell, 4))
+
+        scores = C * p_classes
+        center = ((coordinate[..., 0:2] + self._cell_offsets(cell_size)) *
+                  [self.img_width / cell_size, self.img_height / cell_size])
+        half = coordinate[..., 2:4] * [self.img_width / 2.0, self.img_height / 2.0]
+
+        boxes = np.empty(coordinate.shape, dtype=np.float32)
+        boxes[..., 0] = np.clip(center[..., 0] - half[..., 0], 0, self.img_width)
+        boxes[..., 1] = np.clip(center[..., 0] + half[..., 0], 0, self.img_width)
+        boxes[..., 2] = np.clip(center[..., 1] - half[..., 1], 0, self.img_height)
+        boxes[..., 3] = np.clip(center[..., 1] + half[..., 1], 0, self.img_height)
+        return (np.reshape(boxes, (batch_size, -1, 4)),
+                np.reshape(scores, (batch_size, -1, self.num_classes)))
+
+    def select(self, boxes, scores):
+        """Threshold and suppress the candidates of one image
+
+        Every box is a candidate for each class its score passes the
+        threshold of, the candidates of all classes go through one class
+        aware NMS.
+        Args:
+          boxes: 2-D array [num_boxes, 4], scores: 2-D array [num_boxes, num_classes]
+        Returns:
+          2-D array [k, 6] `[class_id, confidence, xmin, xmax, ymin, ymax]`
+        """
+        box_index, class_id = np.nonzero(scores >= self.confidence_thresh)
+        detections = np.empty((len(box_index), 6), dtype=np.float32)
+        detections[:, 0] = class_id
+        detections[:, 1] = scores[box_index, class_id]
+        detections[:, 2:] = boxes[box_index]
+        if self.iou_threshold:
+            return class_aware_nms(detections, self.iou_threshold, self.top_k)
+        order = np.argsort(-detections[:, 1], kind="mergesort")
+        if self.top_k != 'all':
+            order = order[:self.top_k]
+        return detections[order]
+
+    def __call__(self, predicts):
+        """
+        Args:
+          predicts: 4-D array [batch_size, cell_size, cell_size, num_classes + 5 * boxes_per_cell]
+            or a list of them with different grid sizes (the heads of YoloUNet),
+            the candidates of all grids are merged before one NMS per image
+        Returns:
+          list of 2-D arrays [k, 6], one per image
+        """
+        if not isinstance(predicts, (list, tuple)):
+            predicts = [predicts]
+        grids = [self.decode_boxes(grid) for grid in predicts]
+        boxes = np.concatenate([grid[0] for grid in grids], axis=1)
+        scores = np.concatenate([grid[1] for grid in grids], axis=1)
+        return [self.select(b, s) for b, s in zip(boxes, scores)]
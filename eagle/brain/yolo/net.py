@@ -8,8 +8,151 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 
+from datum.models.yolo.yolo_targets import RESPONSE, OBJECTS, BOXES, CLASSES
+
+
+def batch_loss(net, predicts, labels, objects_num):
+    """Yolo loss terms of the whole batch without loops
+
+    Every label gets the same terms as in the per object formulation,
+    the padded labels behind `objects_num` are masked out, so images and
+    objects are computed at once on
+    [batch_size, max_objects, cell_size, cell_size, boxes_per_cell].
+    Args:
+      net: the Net of the predicts, gives image_size, num_classes,
+        boxes_per_cell and the scales of the terms
+      predicts: 4-D tensor [batch_size, cell_size, cell_size, num_classes + 5 * boxes_per_cell]
+      labels  : 3-D tensor of [batch_size, max_objects, 5]  (x_center, y_center, w, h, class)
+      objects_num: 1-D tensor [batch_size]
+    Return:
+      loss: [class_loss, object_loss, noobject_loss, coord_loss] summed over the batch
+      nilboy: 4-D tensor [batch_size, cell_size, cell_size, boxes_per_cell]
+        the responsible boxes of all objects
+    """
+    cell_size = predicts.get_shape().as_list()[1]
+    max_objects = labels.get_shape().as_list()[1]
+    cell_width = net.image_size / cell_size
+
+    # [batch_size, max_objects, 1, 1, 1]
+    valid = tf.sequence_mask(objects_num, max_objects, dtype=tf.float32)
+    valid = tf.reshape(valid, [-1, max_objects, 1, 1, 1])
+
+    # labels of every cell [batch_size, max_objects, 1, 1]
+    label = tf.reshape(labels, [-1, max_objects, 1, 1, 5])
+    x, y, w, h = (label[..., 0], label[..., 1], label[..., 2],
+                  label[..., 3])
+
+    grid_x = np.tile(np.arange(cell_size, dtype=np.float32), [cell_size, 1])
+    grid_y = tf.constant(grid_x.T.reshape(1, 1, cell_size, cell_size))
+    grid_x = tf.constant(grid_x.reshape(1, 1, cell_size, cell_size))
+
+    # calculate objects tensor [batch_size, max_objects, CELL_SIZE, CELL_SIZE]
+    min_x = tf.floor((x - w / 2) / cell_width)
+    max_x = tf.ceil((x + w / 2) / cell_width)
+    min_y = tf.floor((y - h / 2) / cell_width)
+    max_y = tf.ceil((y + h / 2) / cell_width)
+    objects = tf.cast(tf.logical_and(
+        tf.logical_and(grid_x >= min_x, grid_x < max_x),
+        tf.logical_and(grid_y >= min_y, grid_y < max_y)), tf.float32)
+
+    # calculate responsible tensor [batch_size, max_objects, CELL_SIZE, CELL_SIZE, 1]
+    response = tf.cast(tf.logical_and(
+        tf.equal(grid_x, tf.floor(x / cell_width)),
+        tf.equal(grid_y, tf.floor(y / cell_width))), tf.float32)
+    response = tf.expand_dims(response, -1)
+
+    # predict boxes [batch_size, 1, CELL_SIZE, CELL_SIZE, BOXES_PER_CELL, 4]
+    predict_boxes = predicts[:, :, :, net.num_classes + net.boxes_per_cell:]
+    predict_boxes = tf.reshape(predict_boxes,
+                               [-1, cell_size, cell_size,
+                                net.boxes_per_cell, 4])
+    predict_boxes = predict_boxes * [cell_width, cell_width,
+                                     net.image_size, net.image_size]
+    base_boxes = np.zeros([cell_size, cell_size, 1, 4], dtype=np.float32)
+    base_boxes[:, :, 0, 0] = np.arange(cell_size) * cell_width
+    base_boxes[:, :, 0, 1] = np.arange(cell_size)[:, np.newaxis] * cell_width
+    predict_boxes = tf.expand_dims(predict_boxes + base_boxes, 1)
+
+    # calculate iou_predict_truth [batch_size, max_objects, CELL_SIZE, CELL_SIZE, BOXES_PER_CELL]
+    truth_boxes = tf.reshape(labels[:, :, 0:4], [-1, max_objects, 1, 1, 1, 4])
+    iou_predict_truth = batch_iou(predict_boxes, truth_boxes)
+
+    C = iou_predict_truth * response
+    I = iou_predict_truth * response
+    max_I = tf.reduce_max(I, 4, keep_dims=True)
+    I = tf.cast((I >= max_I), tf.float32) * response
+    no_I = tf.ones_like(I, dtype=tf.float32) - I
+
+    p_C = tf.expand_dims(
+        predicts[:, :, :, net.num_classes:net.num_classes + net.boxes_per_cell], 1)
+
+    # calculate truth x, y, sqrt_w, sqrt_h [batch_size, max_objects, 1, 1, 1]
+    x, y = tf.expand_dims(x, -1), tf.expand_dims(y, -1)
+    sqrt_w = tf.sqrt(tf.abs(tf.expand_dims(w, -1)))
+    sqrt_h = tf.sqrt(tf.abs(tf.expand_dims(h, -1)))
+
+    p_x = predict_boxes[..., 0]
+    p_y = predict_boxes[..., 1]
+    p_sqrt_w = tf.sqrt(tf.minimum(net.image_size * 1.0,
+                                  tf.maximum(0.0, predict_boxes[..., 2])))
+    p_sqrt_h = tf.sqrt(tf.minimum(net.image_size * 1.0,
+                                  tf.maximum(0.0, predict_boxes[..., 3])))
+
+    # calculate truth P [batch_size, max_objects, 1, 1, NUM_CLASSES]
+    P = tf.one_hot(tf.cast(label[..., 4], tf.int32), net.num_classes,
+                   dtype=tf.float32)
+    p_P = tf.expand_dims(predicts[:, :, :, 0:net.num_classes], 1)
+
+    I = valid * I
+    class_loss = tf.nn.l2_loss(
+        valid * tf.expand_dims(objects, -1) * (p_P - P)) * net.class_scale
+    object_loss = tf.nn.l2_loss(I * (p_C - C)) * net.object_scale
+    noobject_loss = tf.nn.l2_loss(
+        valid * no_I * p_C) * net.noobject_scale
+    coord_loss = (tf.nn.l2_loss(I * (p_x - x) / cell_width) +
+                  tf.nn.l2_loss(I * (p_y - y) / cell_width) +
+                  tf.nn.l2_loss(I * (p_sqrt_w - sqrt_w)) / net.image_size +
+                  tf.nn.l2_loss(I * (p_sqrt_h - sqrt_h)) / net.image_size
+                  ) * net.coord_scale
+
+    nilboy = tf.reduce_sum(I, 1)
+    return [class_loss, object_loss, noobject_loss, coord_loss], nilboy
+
+
+def batch_iou(boxes1, boxes2):
+    """calculate ious, the shapes of the two boxes broadcast
+    Args:
+      boxes1: tensor [..., 4]  ====> (x_center, y_center, w, h)
+      boxes2: tensor [..., 4]  ====> (x_center, y_center, w, h)
+    Return:
+      iou: tensor of the broadcast shape without the last dimension
+    """
+    boxes1 = tf.concat([boxes1[..., 0:2] - boxes1[..., 2:4] / 2,
+                        boxes1[..., 0:2] + boxes1[..., 2:4] / 2], -1)
+    boxes2 = tf.concat([boxes2[..., 0:2] - boxes2[..., 2:4] / 2,
+                        boxes2[..., 0:2] + boxes2[..., 2:4] / 2], -1)
+
+    # calculate the left up point and the right down point
+    lu = tf.maximum(boxes1[..., 0:2], boxes2[..., 0:2])
+    rd = tf.minimum(boxes1[..., 2:], boxes2[..., 2:])
+
+    # intersection
+    intersection = rd - lu
+    mask = tf.cast(intersection[..., 0] > 0, tf.float32) * tf.cast(
+        intersection[..., 1] > 0, tf.float32)
+    inter_square = mask * intersection[..., 0] * intersection[..., 1]
+
+    # calculate the boxs1 square and boxs2 square
+    square1 = (boxes1[..., 2] - boxes1[..., 0]) * (
+        boxes1[..., 3] - boxes1[..., 1])
+    square2 = (boxes2[..., 2] - boxes2[..., 0]) * (
+        boxes2[..., 3] - boxes2[..., 1])
+
+    return inter_square / (square1 + square2 - inter_square + 1e-6)
+
 
 class Net(object):
     """Base Net class
@@ -195,3 +338,96 @@ class Net(object):
           objects_num: 1-D tensor [batch_size]
         """
         raise NotImplementedError
+
+    def batch_loss(self, predicts, labels, objects_num):
+        """Yolo loss terms of the whole batch, see `batch_loss`"""
+        return batch_loss(self, predicts, labels, objects_num)
+
+    def target_loss(self, predicts, targets, objects_num):
+        """Yolo loss terms on the dense per-cell targets of the data loader
+
+        `encode_targets` merges the object masks of `batch_loss` in the loader
+        threads, the graph only works on
+        [batch_size, cell_size, cell_size, boxes_per_cell]. The terms equal the
+        ones of `batch_loss`, except when the centers of several objects fall
+        into one cell: only the later object is responsible for that cell.
+        Args:
+          predicts: 4-D tensor [batch_size, cell_size, cell_size, num_classes + 5 * boxes_per_cell]
+          targets : 4-D tensor [batch_size, cell_size, cell_size, 6 + num_classes]
+            (response, objects, x_center, y_center, w, h, classes)
+          objects_num: 1-D tensor [batch_size]
+        Return:
+          loss: [class_loss, object_loss, noobject_loss, coord_loss] summed over the batch
+          nilboy: 4-D tensor [batch_size, cell_size, cell_size, boxes_per_cell]
+            the responsible boxes of all objects
+        """
+        cell_size = predicts.get_shape().as_list()[1]
+        cell_width = self.image_size / cell_size
+
+        # [batch_size, CELL_SIZE, CELL_SIZE, 1]
+        response = targets[..., RESPONSE:RESPONSE + 1]
+        objects = targets[..., OBJECTS:OBJECTS + 1]
+        # [batch_size, CELL_SIZE, CELL_SIZE, 4]
+        truth_boxes = targets[..., BOXES:CLASSES]
+        # [batch_size, CELL_SIZE, CELL_SIZE, NUM_CLASSES]
+        classes = targets[..., CLASSES:]
+
+        # predict boxes [batch_size, CELL_SIZE, CELL_SIZE, BOXES_PER_CELL, 4]
+        predict_boxes = predicts[:, :, :, self.num_classes + self.boxes_per_cell:]
+        predict_boxes = tf.reshape(predict_boxes,
+                                   [-1, cell_size, cell_size,
+                                    self.boxes_per_cell, 4])
+        predict_boxes = predict_boxes * [cell_width, cell_width,
+                                         self.image_size, self.image_size]
+        base_boxes = np.zeros([cell_size, cell_size, 1, 4], dtype=np.float32)
+        base_boxes[:, :, 0, 0] = np.arange(cell_size) * cell_width
+        base_boxes[:, :, 0, 1] = np.arange(cell_size)[:, np.newaxis] * cell_width
+        predict_boxes = predict_boxes + base_boxes
+
+        # calculate iou_predict_truth [batch_size, CELL_SIZE, CELL_SIZE, BOXES_PER_CELL]
+        iou_predict_truth = self.batch_iou(predict_boxes,
+                                           tf.expand_dims(truth_boxes, 3))
+
+        C = iou_predict_truth * response
+        I = iou_predict_truth * response
+        max_I = tf.reduce_max(I, 3, keep_dims=True)
+        I = tf.cast((I >= max_I), tf.float32) * response
+
+        p_C = predicts[:, :, :, self.num_classes:self.num_classes + self.boxes_per_cell]
+
+        # calculate truth x, y, sqrt_w, sqrt_h [batch_size, CELL_SIZE, CELL_SIZE, 1]
+        x = truth_boxes[..., 0:1]
+        y = truth_boxes[..., 1:2]
+        sqrt_w = tf.sqrt(tf.abs(truth_boxes[..., 2:3]))
+        sqrt_h = tf.sqrt(tf.abs(truth_boxes[..., 3:4]))
+
+        p_x = predict_boxes[..., 0]
+        p_y = predict_boxes[..., 1]
+        p_sqrt_w = tf.sqrt(tf.minimum(self.image_size * 1.0,
+                                      tf.maximum(0.0, predict_boxes[..., 2])))
+        p_sqrt_h = tf.sqrt(tf.minimum(self.image_size * 1.0,
+                                      tf.maximum(0.0, predict_boxes[..., 3])))
+
+        p_P = predicts[:, :, :, 0:self.num_classes]
+
+        # batch_loss sums the class term over the overlapping objects:
+        # sum((p - P_o)^2) = objects * p^2 - 2 * p * classes + classes
+        class_loss = 0.5 * tf.reduce_sum(
+            objects * p_P * p_P - 2 * p_P * classes + classes) * self.class_scale
+        object_loss = tf.nn.l2_loss(I * (p_C - C)) * self.object_scale
+        # and the noobject term over every object of the image:
+        # sum(1 - I_o) = objects_num - I
+        num = tf.reshape(tf.cast(objects_num, tf.float32), [-1, 1, 1, 1])
+        noobject_loss = 0.5 * tf.reduce_sum(
+            (num - I) * p_C * p_C) * self.noobject_scale
+        coord_loss = (tf.nn.l2_loss(I * (p_x - x) / cell_width) +
+                      tf.nn.l2_loss(I * (p_y - y) / cell_width) +
+                      tf.nn.l2_loss(I * (p_sqrt_w - sqrt_w)) / self.image_size +
+                      tf.nn.l2_loss(I * (p_sqrt_h - sqrt_h)) / self.image_size
+                      ) * self.coord_scale
+
+        return [class_loss, object_loss, noobject_loss, coord_loss], I
+
+    def batch_iou(self, boxes1, boxes2):
+        """calculate ious, see `batch_iou`"""
+        return batch_iou(boxes1, boxes2)
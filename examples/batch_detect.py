@@ -0,0 +1,69 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-2])
+sys.path.insert(0, proj_root)
+
+from datum.utils.process_config import process_config
+from eagle.brain.predictor.builder import build_predictor
+from eagle.brain.predictor.batch import BatchRunner
+
+parser = OptionParser()
+parser.add_option("-c", "--conf",
+                  dest="configure",
+                  help="configure filename")
+parser.add_option("-m", "--model",
+                  dest="model", default="ssd",
+                  help="ssd, yolo, yolo_tiny or yolo_u")
+parser.add_option("-i", "--input",
+                  dest="input",
+                  help="a directory of images or a dataset index file")
+parser.add_option("-o", "--output_dir",
+                  dest="output_dir",
+                  help="the outputs mirror the input paths under this directory")
+parser.add_option("-f", "--format",
+                  dest="format", default="txt",
+                  help="txt or voc")
+parser.add_option("-w", "--workers",
+                  dest="workers", default="4",
+                  help="number of decode and of writer threads")
+parser.add_option("--progress",
+                  dest="progress", default=None,
+                  help="log of the finished and the unreadable images, a "
+                       "restarted run skips them (default output_dir/progress.log)")
+(options, args) = parser.parse_args()
+if options.configure and options.input and options.output_dir:
+    conf_file = str(options.configure)
+else:
+    print('please specify --conf configure filename, --input and --output_dir')
+    exit(0)
+
+dataset_params = process_config(conf_file)[1]
+class_names, class_offset = None, 0
+if "classes" in dataset_params:
+    class_names = json.loads(dataset_params["classes"])
+    # SSD的类别0是背景
+    if options.model == "ssd" and dataset_params.get("is_need_bg") == "True":
+        class_offset = 1
+
+predictor = build_predictor(options.model, conf_file)
+runner = BatchRunner(predictor, options.output_dir,
+                     output_format=options.format,
+                     num_workers=int(options.workers),
+                     class_names=class_names, class_offset=class_offset)
+try:
+    runner.run(options.input, progress_path=options.progress)
+finally:
+    predictor.close()
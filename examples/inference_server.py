@@ -0,0 +1,77 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import threading
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-2])
+sys.path.insert(0, proj_root)
+
+from eagle.brain.predictor.builder import build_predictor
+from eagle.brain.predictor.server import InferenceServer
+from eagle.brain.predictor.server import make_http_server, make_unix_server
+
+parser = OptionParser()
+parser.add_option("-c", "--conf",
+                  dest="configure",
+                  help="configure filename")
+parser.add_option("-m", "--model",
+                  dest="model", default="ssd",
+                  help="ssd, yolo, yolo_tiny or yolo_u")
+parser.add_option("--max_wait_ms",
+                  dest="max_wait_ms", default="5",
+                  help="max time to wait for a micro batch to fill up")
+parser.add_option("--port",
+                  dest="port", default="8080",
+                  help="port of the local http front end")
+parser.add_option("--unix_socket",
+                  dest="unix_socket", default=None,
+                  help="serve on this UNIX socket instead of http")
+(options, args) = parser.parse_args()
+if options.configure:
+    conf_file = str(options.configure)
+else:
+    print('please specify --conf configure filename')
+    exit(0)
+
+predictor = build_predictor(options.model, conf_file)
+
+server = InferenceServer(predictor, max_wait_ms=float(options.max_wait_ms))
+server.start()
+if options.unix_socket:
+    front_end = make_unix_server(server, options.unix_socket)
+    print("Serving on %s" % options.unix_socket)
+else:
+    front_end = make_http_server(server, port=int(options.port))
+    print("Serving on http://127.0.0.1:%s (POST /predict, GET /stats)" % options.port)
+
+
+def report_stats():
+    # 每分钟打印一次排队和计算延迟的分位数
+    while True:
+        time.sleep(60)
+        print(server.stats())
+
+
+reporter = threading.Thread(target=report_stats)
+reporter.daemon = True
+reporter.start()
+
+try:
+    front_end.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    front_end.server_close()
+    server.stop()
+    predictor.close()
@@ -0,0 +1,92 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/12
+
+"""Count the positive anchors of a dataset per layer and aspect ratio
+
+Every record of the index is matched with the BoxEncoder of the conf, as in
+the training. The anchor shapes with few positives are dropped and the
+`aspect_ratios_per_layer` / `anchor_masks` for the [BoxEncoder] section are
+printed. A pruned config changes the predictor layers, so the model has to be
+trained again (or at least its heads).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import time
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-3])
+sys.path.insert(0, proj_root)
+
+from datum.utils.process_config import process_config
+from datum.models.ssd.anchor_stats import AnchorStatistics
+from eagle.brain.ssd.box_encode_decode_utils import count_anchor_boxes
+
+parser = OptionParser()
+parser.add_option("-c", "--conf", dest="configure",
+                  help="configure filename")
+parser.add_option("--data_path", dest="data_path", default=None,
+                  help="text index, defaults to path of the conf")
+parser.add_option("--predictor_sizes", dest="predictor_sizes", default=None,
+                  help="predictor layer sizes, e.g. for the squeezenet models "
+                       "\"[[36, 36], [19, 19], [10, 10], [5, 5], [3, 3], [1, 1]]\"")
+parser.add_option("-w", "--workers", dest="workers", type="int", default=4,
+                  help="matching processes")
+parser.add_option("--min_fraction", dest="min_fraction", type="float",
+                  default=0.001,
+                  help="keep an anchor shape with at least this share of the positives")
+parser.add_option("--min_count", dest="min_count", type="int", default=1,
+                  help="keep an anchor shape with at least this many positives")
+parser.add_option("-o", "--output", dest="output", default=None,
+                  help="write the pruned [BoxEncoder] values to this json file")
+(options, args) = parser.parse_args()
+if options.configure:
+    conf_file = str(options.configure)
+else:
+    print('please specify --conf configure filename')
+    exit(0)
+
+common_params, dataset_params, net_params, solver_params, box_encoder_params = \
+    process_config(conf_file)
+if options.data_path:
+    dataset_params["path"] = options.data_path
+if options.predictor_sizes:
+    box_encoder_params["predictor_sizes"] = options.predictor_sizes
+if "predictor_sizes" not in box_encoder_params:
+    print('please specify --predictor_sizes of the model')
+    exit(0)
+
+start_time = time.time()
+stats = AnchorStatistics(common_params, dataset_params, box_encoder_params)
+stats.collect(num_workers=options.workers)
+print(stats.report())
+print("matched in %.1f sec with %d processes" % (
+    time.time() - start_time, options.workers))
+
+aspect_ratios_per_layer, anchor_masks = stats.prune(options.min_fraction,
+                                                    options.min_count)
+two_boxes_for_ar1 = stats.box_encoder.two_boxes_for_ar1
+n_boxes = [count_anchor_boxes(aspect_ratios, two_boxes_for_ar1,
+                              None if anchor_masks is None else anchor_masks[i])
+           for i, aspect_ratios in enumerate(aspect_ratios_per_layer)]
+print("anchor boxes per image: %d -> %d" % (
+    stats.num_anchors(stats.box_encoder.n_boxes), stats.num_anchors(n_boxes)))
+
+pruned = {"aspect_ratios_per_layer": json.dumps(aspect_ratios_per_layer),
+          "anchor_masks": json.dumps(anchor_masks) if anchor_masks else "None"}
+print()
+print("[BoxEncoder]")
+for key in ["aspect_ratios_per_layer", "anchor_masks"]:
+    print("%s: %s" % (key, pruned[key]))
+if options.output:
+    with open(options.output, "w") as output_file:
+        json.dump(pruned, output_file, indent=2)
+    print("written to %s" % options.output)
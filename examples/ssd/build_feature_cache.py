@@ -0,0 +1,116 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2017/12/18
+
+"""Run the frozen SSDVGG backbone once over the training set
+
+The inputs of the predictor layers and the encoded labels are stored in
+`feature_cache_dir`, `train_mode: heads` then trains only the predictor layers
+on them. The images are resized like SSDDataSet does, without augmentation.
+Rebuild the cache when the backbone checkpoint or the dataset changes.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-3])
+sys.path.insert(0, proj_root)
+
+import tensorflow as tf
+
+from datum.utils.process_config import process_config
+from datum.models.ssd.ssd_dataset import SSDDataSet
+from datum.models.ssd.feature_cache import FeatureCacheWriter
+from eagle.brain.ssd.models.vgg import SSDVGG
+
+parser = OptionParser()
+parser.add_option("-c", "--conf", dest="configure",
+                  help="configure filename")
+parser.add_option("--cache_dir", dest="cache_dir", default=None,
+                  help="output directory, defaults to feature_cache_dir of the conf")
+parser.add_option("--dtype", dest="dtype", default="float16",
+                  help="storage type of the features, float16 or float32")
+parser.add_option("--batch_size", dest="batch_size", type="int", default=None,
+                  help="images per backbone run, defaults to batch_size of the conf")
+(options, args) = parser.parse_args()
+if options.configure:
+    conf_file = str(options.configure)
+else:
+    print('please specify --conf configure filename')
+    exit(0)
+
+common_params, dataset_params, net_params, solver_params, box_encoder_params = \
+    process_config(conf_file)
+cache_dir = options.cache_dir or dataset_params.get("feature_cache_dir", "None")
+if cache_dir == "None":
+    print('please specify --cache_dir or feature_cache_dir in the conf')
+    exit(0)
+pretrain_path = str(solver_params['pretrain_model_path'])
+if pretrain_path == "None":
+    print('the backbone is frozen, please set pretrain_model_path in the conf')
+    exit(0)
+batch_size = options.batch_size or int(common_params['batch_size'])
+
+# 不启动读取线程，按顺序每个样本只处理一次
+dataset_params["thread_num"] = "0"
+dataset = SSDDataSet(common_params, dataset_params, box_encoder_params)
+net = SSDVGG(common_params, net_params, box_encoder_params)
+
+images = tf.placeholder(
+    tf.float32, (None, net.image_height, net.image_width, 3), name="images")
+features = net.backbone(images)
+fetches = [features[name] for name in net.FEATURE_LAYERS]
+
+label_shape = dataset.box_encoder.generate_encode_template(batch_size=1).shape[1:]
+writer = FeatureCacheWriter(
+    cache_dir, dataset.record_number,
+    [(name, features[name].get_shape().as_list()[1:])
+     for name in net.FEATURE_LAYERS],
+    label_shape, dtype=options.dtype,
+    info={"pretrain_model_path": pretrain_path, "conf": conf_file})
+
+saver = tf.train.Saver()
+start_time = time.time()
+dropped = 0
+with tf.Session() as sess:
+    saver.restore(sess, pretrain_path)
+
+    def flush(batch):
+        outputs = sess.run(fetches, feed_dict={
+            images: SSDDataSet.normalize([image for image, _ in batch])})
+        writer.write(outputs, [label[0] for _, label in batch])
+
+    batch = []
+    for i, record in enumerate(dataset.record_list):
+        out = dataset.encode_record(record)
+        if out is None:
+            dropped += 1
+            continue
+        batch.append(out)
+        if len(batch) == batch_size:
+            flush(batch)
+            batch = []
+        if (i + 1) % 1000 == 0:
+            print("%d / %d images, %.1f images/sec" % (
+                i + 1, dataset.record_number,
+                (i + 1) / (time.time() - start_time)))
+            sys.stdout.flush()
+    if batch:
+        flush(batch)
+writer.close()
+
+duration = time.time() - start_time
+size = sum(os.path.getsize(os.path.join(cache_dir, name))
+           for name in os.listdir(cache_dir))
+print("cached %d images (%d dropped) to %s in %.1f sec, %.1f GB" % (
+    writer.count, dropped, cache_dir, duration, size / 1024 ** 3))
+print("train the predictor layers with `train_mode: heads` and "
+      "`feature_cache_dir: %s`" % cache_dir)
@@ -0,0 +1,182 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import json
+import socket
+import subprocess
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-3])
+sys.path.insert(0, proj_root)
+
+from datum.utils.process_config import process_config
+
+parser = OptionParser()
+parser.add_option("-c", "--conf",
+                  dest="configure",
+                  help="configure filename")
+parser.add_option("--local",
+                  dest="local", default="0",
+                  help="launch this many local worker processes (and the ps)")
+parser.add_option("--num_ps",
+                  dest="num_ps", default="1",
+                  help="number of local parameter servers")
+parser.add_option("--baseline",
+                  dest="baseline", default=None,
+                  help="examples/sec of a single worker, measured with one "
+                       "local worker first if not given")
+parser.add_option("--ps_hosts",
+                  dest="ps_hosts", default="",
+                  help="comma separated host:port of the parameter servers")
+parser.add_option("--worker_hosts",
+                  dest="worker_hosts", default="",
+                  help="comma separated host:port of the workers")
+parser.add_option("--job_name",
+                  dest="job_name", default=None,
+                  help="ps or worker")
+parser.add_option("--task_index",
+                  dest="task_index", default="0",
+                  help="index of this process in its job")
+parser.add_option("--sync_replicas",
+                  dest="sync_replicas", default="True",
+                  help="aggregate the gradients of all workers for every update")
+parser.add_option("--intra_op_threads",
+                  dest="intra_op_threads", default="0",
+                  help="intra-op threads per process, 0 for all cores (with "
+                       "--local: cores // N, the processes share one host)")
+parser.add_option("--inter_op_threads",
+                  dest="inter_op_threads", default="0",
+                  help="inter-op threads per process, 0 for the default (with "
+                       "--local: 2)")
+(options, args) = parser.parse_args()
+if options.configure:
+    conf_file = str(options.configure)
+else:
+    print('please specify --conf configure filename')
+    exit(0)
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("localhost", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def run_task(job_name, task_index, ps_hosts, worker_hosts):
+    """Train one task of the cluster in this process"""
+    from datum.models.ssd.ssd_dataset import SSDDataSet
+    from eagle.brain.ssd.models.vgg import SSDVGG
+    from eagle.brain.ssd.models.vgg_dilated import SSDVGGDilated
+    from eagle.brain.solver.distributed_ssd_solver import DistributedSSDSolver
+
+    common_params, dataset_params, net_params, solver_params, box_encoder_params = \
+        process_config(conf_file)
+    cluster_params = {
+        "ps_hosts": ps_hosts,
+        "worker_hosts": worker_hosts,
+        "job_name": job_name,
+        "task_index": task_index,
+        "sync_replicas": options.sync_replicas == "True",
+        "intra_op_threads": options.intra_op_threads,
+        "inter_op_threads": options.inter_op_threads
+    }
+    if job_name == "ps":
+        DistributedSSDSolver(
+            None, None, common_params, solver_params, cluster_params).solve()
+        return
+
+    # 每个worker只读取属于自己的那一份数据
+    dataset_params["num_shards"] = str(len(worker_hosts))
+    dataset_params["shard_index"] = str(task_index)
+    data_generator = SSDDataSet(common_params, dataset_params, box_encoder_params)
+    model_name = common_params.get("model_name", "VGG")
+    if model_name == "VGG":
+        net = SSDVGG(common_params, net_params, box_encoder_params)
+    elif model_name == "VGG-Dilated":
+        net = SSDVGGDilated(common_params, net_params, box_encoder_params)
+    else:
+        raise ValueError("model_name is not fitted !", model_name)
+    solver = DistributedSSDSolver(data_generator, net, common_params,
+                                  solver_params, cluster_params)
+    solver.solve()
+
+
+def launch_local(num_workers, num_ps):
+    """Run a local cluster as separate processes
+
+    Returns:
+      the summed examples/sec of all workers
+    """
+    _, _, _, solver_params, _ = process_config(conf_file)
+    train_dir = str(solver_params['train_dir'])
+    for path in glob.glob(os.path.join(train_dir, "throughput_worker_*.json")):
+        os.remove(path)
+
+    # 所有进程在同一台机器上，按照worker数划分CPU核
+    intra_op_threads = int(options.intra_op_threads)
+    if intra_op_threads == 0:
+        intra_op_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    inter_op_threads = int(options.inter_op_threads) or 2
+
+    ps_hosts = ["localhost:%d" % free_port() for _ in range(num_ps)]
+    worker_hosts = ["localhost:%d" % free_port() for _ in range(num_workers)]
+
+    def start(job_name, task_index):
+        return subprocess.Popen([
+            sys.executable, abs_path,
+            "--conf", conf_file,
+            "--ps_hosts", ",".join(ps_hosts),
+            "--worker_hosts", ",".join(worker_hosts),
+            "--job_name", job_name,
+            "--task_index", str(task_index),
+            "--sync_replicas", options.sync_replicas,
+            "--intra_op_threads", str(intra_op_threads),
+            "--inter_op_threads", str(inter_op_threads)])
+
+    ps_procs = [start("ps", i) for i in range(num_ps)]
+    worker_procs = [start("worker", i) for i in range(num_workers)]
+    try:
+        for proc in worker_procs:
+            proc.wait()
+    finally:
+        # the parameter servers never return by themselves
+        for proc in ps_procs + worker_procs:
+            if proc.poll() is None:
+                proc.terminate()
+
+    total = 0.0
+    for path in glob.glob(os.path.join(train_dir, "throughput_worker_*.json")):
+        with open(path) as f:
+            total += json.load(f)["examples_per_sec"]
+    return total
+
+
+if options.job_name is not None:
+    run_task(options.job_name, int(options.task_index),
+             options.ps_hosts.split(","), options.worker_hosts.split(","))
+elif int(options.local) > 0:
+    num_workers = int(options.local)
+    num_ps = int(options.num_ps)
+    if options.baseline is not None:
+        baseline = float(options.baseline)
+    else:
+        print("Measuring the throughput of a single worker !")
+        baseline = launch_local(1, num_ps)
+    total = launch_local(num_workers, num_ps)
+    print("workers: %d, %.1f examples/sec, single worker: %.1f examples/sec" % (
+        num_workers, total, baseline))
+    print("scaling efficiency: %.1f%%" % (100.0 * total / (num_workers * baseline)))
+else:
+    print('please specify --local N or --job_name with the cluster hosts')
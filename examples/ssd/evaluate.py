@@ -0,0 +1,87 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import time
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-3])
+sys.path.insert(0, proj_root)
+
+import cv2
+import numpy as np
+
+from datum.utils.process_config import process_config
+from eagle.brain.ssd.models.vgg import SSDVGG
+from eagle.brain.ssd.models.vgg_dilated import SSDVGGDilated
+from eagle.brain.predictor.ssd_predictor import SSDPredictor
+from eagle.brain.evaluate.detection_eval import load_index, BackgroundEvaluator
+
+parser = OptionParser()
+parser.add_option("-c", "--conf",
+                  dest="configure",
+                  help="configure filename")
+parser.add_option("-i", "--index",
+                  dest="index",
+                  help="text index of the validation set")
+parser.add_option("--coco",
+                  dest="coco", action="store_true", default=False,
+                  help="average over the iou thresholds 0.5:0.95")
+(options, args) = parser.parse_args()
+if options.configure and options.index:
+    conf_file = str(options.configure)
+else:
+    print('please specify --conf configure filename and --index validation index')
+    exit(0)
+
+common_params, dataset_params, net_params, solver_params, box_encoder_params = \
+    process_config(conf_file)
+model_name = common_params.get("model_name", "VGG")
+if model_name == "VGG":
+    net = SSDVGG(common_params, net_params, box_encoder_params)
+elif model_name == "VGG-Dilated":
+    net = SSDVGGDilated(common_params, net_params, box_encoder_params)
+else:
+    raise ValueError("model_name is not fitted !", model_name)
+predictor = SSDPredictor(net, common_params, solver_params, box_encoder_params)
+
+is_need_bg = True if dataset_params["is_need_bg"] == "True" else False
+records = load_index(options.index, is_need_bg)
+num_classes = int(common_params["num_classes"])
+iou_thresholds = np.arange(0.5, 1.0, 0.05) if options.coco else (0.5,)
+# 匹配在另一个进程中进行，和网络的前向计算并行
+evaluator = BackgroundEvaluator(num_classes, iou_thresholds,
+                                class_offset=1 if is_need_bg else 0)
+
+start_time = time.time()
+for start in range(0, len(records), predictor.batch_size):
+    chunk = records[start:start + predictor.batch_size]
+    images = [cv2.imread(image_path) for image_path, _ in chunk]
+    detections = predictor.predict_images(images)
+    for image, (_, boxes), dets in zip(images, chunk, detections):
+        # the predictions are in the coordinates of the resized input
+        boxes = boxes.copy()
+        boxes[:, [0, 2]] *= predictor.width / image.shape[1]
+        boxes[:, [1, 3]] *= predictor.height / image.shape[0]
+        evaluator.update(dets, boxes)
+
+result = evaluator.result()
+evaluator.close()
+predictor.close()
+print("%d images in %.1f sec" % (len(records), time.time() - start_time))
+classes = json.loads(dataset_params["classes"])
+for c in range(num_classes):
+    print("%s: AP %.4f (%d boxes)" % (classes[c], result["ap"][c, 0],
+                                      result["num_gt"][c]))
+print("mAP@0.5: %.4f" % result["map"][0])
+if options.coco:
+    print("mAP@[.5:.95]: %.4f" % result["mAP"])
@@ -0,0 +1,123 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-3])
+sys.path.insert(0, proj_root)
+
+import numpy as np
+from keras import backend as K
+from keras.models import load_model
+
+from eagle.brain.ssd.anchor_boxes import AnchorBoxes
+from eagle.brain.ssd.normalization import L2Normalization
+from eagle.brain.ssd.models.components import fold_batch_norm_weights
+from eagle.brain.ssd.models.squeezenet_300 import \
+    base_feature_model as squeezenet_300
+from eagle.brain.ssd.models.squeezenet_512 import \
+    base_feature_model as squeezenet_512
+from eagle.brain.predictor.quantize import freeze_keras_model
+from eagle.brain.predictor.quantize import FrozenGraphRunner
+
+BUILDERS = {300: squeezenet_300, 512: squeezenet_512}
+
+parser = OptionParser()
+parser.add_option("-m", "--model_path",
+                  dest="model_path",
+                  help="trained squeezenet_300 / squeezenet_512 keras model (.h5)")
+parser.add_option("-o", "--output",
+                  dest="output", default=None,
+                  help="the folded keras model, defaults to <model>_folded.h5")
+parser.add_option("-n", "--num_runs",
+                  dest="num_runs", type="int", default=50,
+                  help="timed runs of each graph on one image")
+parser.add_option("--tolerance",
+                  dest="tolerance", type="float", default=1e-3,
+                  help="max abs difference of the class and box outputs")
+(options, args) = parser.parse_args()
+if not options.model_path:
+    print('please specify --model_path keras model')
+    exit(0)
+output = options.output or \
+    os.path.splitext(options.model_path)[0] + "_folded.h5"
+
+# 1: The trained model in inference mode, the BN uses the moving statistics
+K.set_learning_phase(0)
+model = load_model(options.model_path,
+                   custom_objects={'AnchorBoxes': AnchorBoxes,
+                                   'L2Normalization': L2Normalization},
+                   compile=False)
+img_height, img_width, img_channels = model.input_shape[1:4]
+n_classes = model.output_shape[-1] - 12
+if img_height not in BUILDERS:
+    raise ValueError("not a squeezenet 300 / 512 model", model.input_shape)
+
+# 2: The same net without BN layers, the anchor parameters are read from the
+# anchor layers (the scales grow with the predictor layers)
+anchor_layers = sorted([layer for layer in model.layers
+                        if isinstance(layer, AnchorBoxes)],
+                       key=lambda layer: layer.this_scale)
+anchor_masks = [layer.box_mask for layer in anchor_layers]
+if all(box_mask is None for box_mask in anchor_masks):
+    anchor_masks = None
+folded, _ = BUILDERS[img_height](
+    (img_height, img_width, img_channels), n_classes,
+    scales=[layer.this_scale for layer in anchor_layers] +
+           [anchor_layers[-1].next_scale],
+    aspect_ratios_per_layer=[list(layer.aspect_ratios)
+                             for layer in anchor_layers],
+    two_boxes_for_ar1=anchor_layers[0].two_boxes_for_ar1,
+    variances=list(anchor_layers[0].variances),
+    coords=anchor_layers[0].coords,
+    normalize_coords=anchor_layers[0].normalize_coords,
+    anchor_masks=anchor_masks,
+    fold_bn=True)
+fold_batch_norm_weights(model, folded)
+num_bn = len(model.layers) - len(folded.layers)
+
+# 3: Both models on the same images, the anchors (last 8 columns) must be equal
+images = np.random.RandomState(0).uniform(
+    0, 255, (8, img_height, img_width, img_channels)).astype(np.float32)
+original_outputs = model.predict(images, batch_size=1)
+folded_outputs = folded.predict(images, batch_size=1)
+max_diff = np.abs(original_outputs[..., :-8] - folded_outputs[..., :-8]).max()
+assert np.allclose(original_outputs[..., -8:], folded_outputs[..., -8:])
+assert max_diff <= options.tolerance, \
+    "the folded model differs by %g" % max_diff
+
+# 4: Latency of the frozen graphs on one image, the first run is excluded
+runners = {}
+for name, keras_model in [("bn", model), ("folded", folded)]:
+    graph_def, input_names, output_names = freeze_keras_model(
+        keras_model, K.get_session())
+    runners[name] = FrozenGraphRunner(graph_def, input_names[0],
+                                      output_names[0])
+for _ in range(options.num_runs + 1):
+    for name in ["bn", "folded"]:
+        runners[name].run(images[:1])
+
+print("%d BatchNormalization layers folded, max abs output difference %.2e" % (
+    num_bn, max_diff))
+print("%-10s %8s %10s %10s %10s" % (
+    "graph", "nodes", "mean (ms)", "p50 (ms)", "p90 (ms)"))
+for name in ["bn", "folded"]:
+    runner = runners[name]
+    runner.latencies = runner.latencies[1:]
+    latency = runner.latency_ms()
+    print("%-10s %8d %10.2f %10.2f %10.2f" % (
+        name, len(runner.graph_def.node), latency["mean"], latency["p50"],
+        latency["p90"]))
+    runner.close()
+
+folded.save(output)
+print("folded model written to %s" % output)
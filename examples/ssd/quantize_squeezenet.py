@@ -0,0 +1,125 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-3])
+sys.path.insert(0, proj_root)
+
+import cv2
+import numpy as np
+import tensorflow as tf
+from keras import backend as K
+from keras.models import load_model
+
+from eagle.brain.ssd.anchor_boxes import AnchorBoxes
+from eagle.brain.ssd.normalization import L2Normalization
+from eagle.brain.ssd.box_encode_decode_utils import decode_y2
+from eagle.brain.predictor.quantize import freeze_keras_model, optimize_graph
+from eagle.brain.predictor.quantize import FrozenGraphRunner
+from eagle.brain.evaluate.detection_eval import load_index, DetectionEvaluator
+
+parser = OptionParser()
+parser.add_option("-m", "--model_path",
+                  dest="model_path",
+                  help="trained squeezenet_300 / squeezenet_512 keras model (.h5)")
+parser.add_option("-i", "--index",
+                  dest="index",
+                  help="text index of the training set, the calibration "
+                       "sample is drawn from it")
+parser.add_option("-o", "--output_dir",
+                  dest="output_dir", default=".",
+                  help="where the float and the quantized graphs are written")
+parser.add_option("-n", "--num_samples",
+                  dest="num_samples", default="200",
+                  help="size of the calibration sample")
+parser.add_option("--no_bg",
+                  dest="is_need_bg", action="store_false", default=True,
+                  help="the classes in the index already include background")
+(options, args) = parser.parse_args()
+if not options.model_path or not options.index:
+    print('please specify --model_path keras model and --index training index')
+    exit(0)
+
+# 1: Load the keras model in inference mode and freeze it
+K.set_learning_phase(0)
+model = load_model(options.model_path,
+                   custom_objects={'AnchorBoxes': AnchorBoxes,
+                                   'L2Normalization': L2Normalization},
+                   compile=False)
+img_height, img_width = model.input_shape[1:3]
+n_classes = model.output_shape[-1] - 12
+graph_def, input_names, output_names = freeze_keras_model(model, K.get_session())
+
+# 2: Float graph and graph with 8-bit weights
+graphs = {
+    "float": optimize_graph(graph_def, input_names, output_names),
+    "quantized": optimize_graph(graph_def, input_names, output_names,
+                                quantize=True)
+}
+model_name = os.path.splitext(os.path.basename(options.model_path))[0]
+for name, graph in graphs.items():
+    tf.train.write_graph(graph, options.output_dir,
+                         "%s_%s.pb" % (model_name, name), as_text=False)
+K.clear_session()
+
+# 3: A fixed sample of the training index for the comparison
+records = load_index(options.index, options.is_need_bg)
+random.Random(42).shuffle(records)
+records = records[:int(options.num_samples)]
+
+runners = dict((name, FrozenGraphRunner(graph, input_names[0], output_names[0]))
+               for name, graph in graphs.items())
+evaluators = dict((name, DetectionEvaluator(n_classes - 1))
+                  for name in graphs)
+output_diffs = []
+for image_path, boxes in records:
+    image = cv2.imread(image_path)
+    h, w = image.shape[:2]
+    image = cv2.resize(image, (img_width, img_height))
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32)
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] *= img_width / w
+    boxes[:, [1, 3]] *= img_height / h
+
+    outputs = {}
+    for name, runner in runners.items():
+        outputs[name] = runner.run(image[np.newaxis])
+        detections = decode_y2(outputs[name],
+                               confidence_thresh=0.01,
+                               iou_threshold=0.45,
+                               top_k=200,
+                               input_coords='centroids',
+                               normalize_coords=True,
+                               img_height=img_height,
+                               img_width=img_width)[0]
+        evaluators[name].update(detections, boxes)
+    output_diffs.append(np.abs(
+        outputs["float"][..., :-8] - outputs["quantized"][..., :-8]).max())
+
+# 4: Report, the first run of each graph is excluded from the latency
+print("%d calibration images from %s" % (len(records), options.index))
+print("%-10s %12s %10s %10s %10s %8s" % (
+    "graph", "size (MB)", "mean (ms)", "p50 (ms)", "p90 (ms)", "mAP"))
+maps = {}
+for name in ["float", "quantized"]:
+    runner = runners[name]
+    runner.latencies = runner.latencies[1:]
+    latency = runner.latency_ms()
+    maps[name] = evaluators[name].compute()["mAP"]
+    print("%-10s %12.2f %10.2f %10.2f %10.2f %8.4f" % (
+        name, runner.size / 1024.0 / 1024.0, latency["mean"], latency["p50"],
+        latency["p90"], maps[name]))
+    runner.close()
+print("mAP delta: %+.4f, max abs output difference: %.4f" % (
+    maps["quantized"] - maps["float"], max(output_diffs)))
@@ -20,6 +20,7 @@ reload(sys)
 
 from datum.utils.process_config import process_config
 from datum.models.ssd.ssd_dataset import SSDDataSet
+from datum.models.ssd.feature_cache import FeatureCacheDataSet
 from eagle.brain.ssd.models.vgg import SSDVGG
 from eagle.brain.ssd.models.vgg_dilated import SSDVGGDilated
 from eagle.brain.solver.ssd_solver import SSDSolver
@@ -38,7 +39,12 @@ else:
 common_params, dataset_params, net_params, solver_params, box_encoder_params = \
     process_config(conf_file)
 
-data_generator = SSDDataSet(common_params, dataset_params, box_encoder_params)
+if solver_params.get("train_mode", "full") == "heads":
+    # backbone冻结，从特征缓存中读取预测层的输入
+    data_generator = FeatureCacheDataSet(common_params, dataset_params)
+else:
+    data_generator = SSDDataSet(common_params, dataset_params,
+                                box_encoder_params)
 model_name = common_params.get("model_name", "VGG")
 if model_name == "VGG":
     net = SSDVGG(common_params, net_params, box_encoder_params)
@@ -0,0 +1,112 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import time
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-2])
+sys.path.insert(0, proj_root)
+
+from eagle.brain.predictor.builder import build_predictor
+from eagle.brain.predictor.tiled import TiledDetector, ChangeGatedTiledDetector
+from eagle.brain.predictor.tiled import CascadeTiledDetector
+
+parser = OptionParser()
+parser.add_option("-c", "--conf",
+                  dest="configure",
+                  help="configure filename")
+parser.add_option("-m", "--model",
+                  dest="model", default="ssd",
+                  help="ssd, yolo, yolo_tiny or yolo_u")
+parser.add_option("-i", "--input",
+                  dest="input",
+                  help="a large frame, a directory of frames or a glob pattern")
+parser.add_option("-o", "--output",
+                  dest="output", default="detections.txt",
+                  help="one line per frame: "
+                       "path xmin ymin xmax ymax class confidence ...")
+parser.add_option("--overlap",
+                  dest="overlap", default="80",
+                  help="overlap of neighbouring tiles in pixel")
+parser.add_option("--change_threshold",
+                  dest="change_threshold", default=None,
+                  help="only detect the tiles whose mean gray difference to "
+                       "their last detected frame reaches this value")
+parser.add_option("--refresh_interval",
+                  dest="refresh_interval", default="30",
+                  help="frames after which an unchanged tile is detected again")
+parser.add_option("--gate_model",
+                  dest="gate_model", default=None,
+                  help="cascade: cheap model (e.g. yolo_tiny) run on all tiles, "
+                       "only the tiles it passes go to --model")
+parser.add_option("--gate_conf",
+                  dest="gate_conf", default=None,
+                  help="configure filename of the gate model")
+parser.add_option("--gate_threshold",
+                  dest="gate_threshold", default="0.3",
+                  help="minimal gate confidence to pass a tile")
+parser.add_option("--audit_every",
+                  dest="audit_every", default="0",
+                  help="also detect all tiles every N frames and report "
+                       "the recall of the gated or cascaded detections")
+(options, args) = parser.parse_args()
+if options.configure and options.input:
+    conf_file = str(options.configure)
+else:
+    print('please specify --conf configure filename and --input frames')
+    exit(0)
+
+if os.path.isdir(options.input):
+    frames = sorted(glob.glob(os.path.join(options.input, "*.jpg")) +
+                    glob.glob(os.path.join(options.input, "*.png")))
+else:
+    frames = sorted(glob.glob(options.input))
+
+if options.gate_model is not None and options.change_threshold is not None:
+    print('--gate_model and --change_threshold can not be combined')
+    exit(0)
+
+predictor = build_predictor(options.model, conf_file)
+gate_predictor = None
+if options.gate_model is not None:
+    gate_predictor = build_predictor(options.gate_model,
+                                     options.gate_conf or conf_file)
+    detector = CascadeTiledDetector(
+        predictor, gate_predictor,
+        gate_threshold=float(options.gate_threshold),
+        overlap=int(options.overlap),
+        audit_every=int(options.audit_every))
+elif options.change_threshold is not None:
+    detector = ChangeGatedTiledDetector(
+        predictor, overlap=int(options.overlap),
+        change_threshold=float(options.change_threshold),
+        refresh_interval=int(options.refresh_interval),
+        audit_every=int(options.audit_every))
+else:
+    detector = TiledDetector(predictor, overlap=int(options.overlap))
+
+start_time = time.time()
+with open(options.output, "w") as writer:
+    # 下一帧的读取和切片在后台线程中进行，与当前帧的推理重叠
+    for frame_path, detections in detector.detect_frames(frames):
+        boxes = ["%.1f %.1f %.1f %.1f %d %.4f" % (
+            xmin, ymin, xmax, ymax, class_id, confidence)
+            for class_id, confidence, xmin, xmax, ymin, ymax in detections]
+        writer.write(" ".join([frame_path] + boxes) + "\n")
+duration = time.time() - start_time
+predictor.close()
+if gate_predictor is not None:
+    gate_predictor.close()
+print(detector.report())
+print("%d frames in %.1f sec, %.2f frames/sec" % (
+    len(frames), duration, len(frames) / max(duration, 1e-6)))
@@ -0,0 +1,97 @@
+# Copyright (c) 2009 IW.
+# All rights reserved.
+#
+# Author: liuguiyang <liuguiyangnwpu@gmail.com>
+# Date:   2018/3/4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from optparse import OptionParser
+
+import os, sys
+abs_path = os.path.abspath(__file__)
+proj_root = "/".join(abs_path.split("/")[:-2])
+sys.path.insert(0, proj_root)
+
+from eagle.brain.predictor.builder import build_predictor
+from eagle.brain.predictor.tiled import TiledDetector, ChangeGatedTiledDetector
+from eagle.brain.predictor.video import VideoReader, VideoDetector
+
+parser = OptionParser()
+parser.add_option("-c", "--conf",
+                  dest="configure",
+                  help="configure filename")
+parser.add_option("-m", "--model",
+                  dest="model", default="ssd",
+                  help="ssd, yolo, yolo_tiny or yolo_u")
+parser.add_option("-v", "--video",
+                  dest="video",
+                  help="local video file")
+parser.add_option("-o", "--output",
+                  dest="output", default="video_detections.txt",
+                  help="one line per frame: "
+                       "index track_id xmin ymin xmax ymax class confidence ...")
+parser.add_option("--detect_every",
+                  dest="detect_every", default="1",
+                  help="run the detector on every N-th frame, "
+                       "the tracker fills the frames in between")
+parser.add_option("--tiled",
+                  dest="tiled", action="store_true", default=False,
+                  help="detect on overlapping tiles of the full frame "
+                       "instead of the resized frame")
+parser.add_option("--overlap",
+                  dest="overlap", default="80",
+                  help="overlap of neighbouring tiles in pixel")
+parser.add_option("--change_threshold",
+                  dest="change_threshold", default=None,
+                  help="only detect the tiles whose mean gray difference to "
+                       "their last detected frame reaches this value")
+parser.add_option("--refresh_interval",
+                  dest="refresh_interval", default="30",
+                  help="frames after which an unchanged tile is detected again")
+parser.add_option("--audit_every",
+                  dest="audit_every", default="0",
+                  help="also detect all tiles every N frames and report "
+                       "the recall of the gated detections")
+(options, args) = parser.parse_args()
+if options.configure and options.video:
+    conf_file = str(options.configure)
+else:
+    print('please specify --conf configure filename and --video video file')
+    exit(0)
+
+predictor = build_predictor(options.model, conf_file)
+detector = predictor
+if options.tiled and options.change_threshold is not None:
+    detector = ChangeGatedTiledDetector(
+        predictor, overlap=int(options.overlap),
+        change_threshold=float(options.change_threshold),
+        refresh_interval=int(options.refresh_interval),
+        audit_every=int(options.audit_every))
+elif options.tiled:
+    detector = TiledDetector(predictor, overlap=int(options.overlap))
+video_detector = VideoDetector(detector,
+                               detect_every=int(options.detect_every))
+
+reader = VideoReader(options.video)
+print("%s: %d frames, %.1f fps" % (options.video, reader.frame_count,
+                                   reader.fps))
+try:
+    with open(options.output, "w") as writer:
+        for index, frame, boxes in video_detector.run(reader):
+            ids = video_detector.tracker.active_ids()
+            line = ["%d %.1f %.1f %.1f %.1f %d %.4f" % (
+                track_id, xmin, ymin, xmax, ymax, class_id, confidence)
+                for track_id, (class_id, confidence, xmin, xmax, ymin, ymax)
+                in zip(ids, boxes)]
+            writer.write(" ".join([str(index)] + line) + "\n")
+            if index % 100 == 0:
+                print(video_detector.report())
+finally:
+    reader.close()
+    predictor.close()
+print(video_detector.report())
+if options.tiled:
+    print(detector.report())
@@ -26,6 +26,8 @@ else:
   exit(0)
 
 common_params, dataset_params, net_params, solver_params = process_config(conf_file)
+# precompute_targets的目标按照网络的cell划分
+dataset_params["cell_size"] = net_params["cell_size"]
 dataset = YoloDataSet(common_params, dataset_params)
 net = YoloTinyNet(common_params, net_params)
 solver = YoloSolver(dataset, net, common_params, solver_params)